@@ -11,6 +11,8 @@ import io
 from fpdf import FPDF
 import base64
 
+import forecast_engine
+
 # Configuration de la page
 st.set_page_config(
     page_title="Analyse Réassurance SEN-RE 2018-2022",
@@ -1260,6 +1262,15 @@ def show_compliance_analysis(analyzer):
     for i, rec in enumerate(recommendations, 1):
         st.markdown(f"{i}. {rec}")
 
+def add_fan_traces(fig, bands, levels, name, rgb):
+    """Ajoute les bandes d'un graphique en éventail (de la plus large à la plus étroite)"""
+    dates = list(bands['date'])
+    for i, level in enumerate(sorted(levels, reverse=True)):
+        fig.add_trace(go.Scatter(x=dates + dates[::-1],
+                                y=list(bands[f'upper_{level}']) + list(bands[f'lower_{level}'])[::-1],
+                                fill='toself', fillcolor=f'rgba({rgb}, {0.15 + 0.15 * i})',
+                                line=dict(width=0), hoverinfo='skip', name=f'{name} IC {level}%'))
+
 def show_forecasting_analysis(analyzer):
     """Analyse de prévisions et scénarios avec machine learning simplifié"""
     st.markdown('<div class="section-header">🔮 Prévisions et Scénarios 2023-2025</div>', unsafe_allow_html=True)
@@ -1285,20 +1296,41 @@ def show_forecasting_analysis(analyzer):
     years_hist = analyzer.years
     primes_totales_hist = [analyzer.income_statements[y]['primes_vie'] + analyzer.income_statements[y]['primes_iard'] for y in years_hist]
     resultats_hist = [analyzer.income_statements[y]['resultat_net'] for y in years_hist]
+    sinistres_hist = [analyzer.income_statements[y]['sinistres_vie'] + analyzer.income_statements[y]['sinistres_iard'] for y in years_hist]
+    commissions_hist = [analyzer.income_statements[y]['commissions_vie'] + analyzer.income_statements[y]['commissions_iard'] for y in years_hist]
     
-    # Prévisions simplifiées (régression linéaire)
-    x = np.array(range(len(years_hist)))
-    y_primes = np.array(primes_totales_hist)
-    y_resultats = np.array(resultats_hist)
+    ratio_hist = [(s + c) / p * 100 for s, c, p in zip(sinistres_hist, commissions_hist, primes_totales_hist)]
     
-    # Ajustement des modèles
-    coef_primes = np.polyfit(x, y_primes, 1)
-    coef_resultats = np.polyfit(x, y_resultats, 1)
+    # Séries historiques empilées (primes, résultats, ratio combiné) : ajustées ensemble.
+    # Le ratio est prévu sur sa propre série : sinistres et primes sont trop corrélés
+    # pour être simulés indépendamment puis divisés.
+    x = np.array(range(len(years_hist)))
+    series_hist = np.vstack([primes_totales_hist, resultats_hist, ratio_hist]).astype(float)
     
     # Génération des prévisions
     years_future = list(range(2023, 2023 + horizon_prevision))
     x_future = np.array(range(len(years_hist), len(years_hist) + horizon_prevision))
     
+    if modele_choisi == "Lissage Exponentiel":
+        # Holt-Winters vectorisé, tendance amortie (données annuelles, sans saisonnalité)
+        base_forecast, _ = forecast_engine.ets_forecast(series_hist, horizon_prevision, damped=True)
+        paths = forecast_engine.ets_simulate(series_hist, horizon_prevision, damped=True, seed=42)
+    else:
+        if modele_choisi == "Moyenne Mobile":
+            # Moyenne des trois dernières années
+            base_forecast = np.repeat(series_hist[:, -3:].mean(axis=1, keepdims=True), horizon_prevision, axis=1)
+            fitted = np.array([series_hist[:, max(0, t - 3):t].mean(axis=1) for t in range(1, len(x))]).T
+            residuals = series_hist[:, 1:] - fitted
+        else:
+            # Tendance linéaire (régression et ARIMA simplifié)
+            coefs = [np.polyfit(x, y, 1) for y in series_hist]
+            base_forecast = np.array([c[0] * x_future + c[1] for c in coefs])
+            residuals = series_hist - np.array([c[0] * x + c[1] for c in coefs])
+        # Trajectoires : erreurs gaussiennes de l'écart-type des résidus du modèle
+        sigma = residuals.std(axis=1, ddof=1)
+        draws = np.random.default_rng(42).standard_normal((len(series_hist), forecast_engine.N_PATHS, horizon_prevision))
+        paths = base_forecast[:, None, :] + sigma[:, None, None] * draws
+    
     # Application des scénarios
     if scenario == "Optimiste":
         multiplicateur = 1.15
@@ -1309,8 +1341,15 @@ def show_forecasting_analysis(analyzer):
     else:  # Central
         multiplicateur = 1.0
     
-    primes_forecast = (coef_primes[0] * x_future + coef_primes[1]) * multiplicateur
-    resultats_forecast = (coef_resultats[0] * x_future + coef_resultats[1]) * multiplicateur
+    primes_forecast = base_forecast[0] * multiplicateur
+    resultats_forecast = base_forecast[1] * multiplicateur
+    
+    # Bandes de prévision au niveau de confiance choisi (quantiles des trajectoires simulées)
+    fan_levels = (50, confidence_level)
+    primes_bands = forecast_engine.fan_bands(pd.DataFrame(paths[0] * multiplicateur, columns=years_future), fan_levels)
+    resultats_bands = forecast_engine.fan_bands(pd.DataFrame(paths[1] * multiplicateur, columns=years_future), fan_levels)
+    # Ratio combiné (sinistres + commissions) / primes : trajectoires de sa propre série
+    ratio_bands = forecast_engine.fan_bands(pd.DataFrame(paths[2], columns=years_future), fan_levels)
     
     # Graphique des prévisions
     fig = go.Figure()
@@ -1333,6 +1372,9 @@ def show_forecasting_analysis(analyzer):
                             mode='lines+markers', name='Résultat Prévision',
                             line=dict(color='green', width=2, dash='dash')))
     
+    add_fan_traces(fig, primes_bands, [confidence_level], 'Primes', '0, 0, 255')
+    add_fan_traces(fig, resultats_bands, [confidence_level], 'Résultat', '0, 128, 0')
+    
     fig.update_layout(
         title=f'Prévisions des Primes et Résultats ({scenario} Scenario)',
         xaxis_title='Année',
@@ -1342,6 +1384,21 @@ def show_forecasting_analysis(analyzer):
     
     st.plotly_chart(fig, use_container_width=True)
     
+    # Éventail du ratio combiné
+    fig_ratio = go.Figure()
+    add_fan_traces(fig_ratio, ratio_bands, fan_levels, 'Ratio combiné', '214, 39, 40')
+    fig_ratio.add_trace(go.Scatter(x=years_hist, y=ratio_hist, mode='lines+markers',
+                                   name='Ratio combiné Historique', line=dict(color='firebrick', width=2)))
+    fig_ratio.add_trace(go.Scatter(x=years_future, y=base_forecast[2], mode='lines+markers',
+                                   name='Ratio combiné Prévision', line=dict(color='firebrick', width=2, dash='dash')))
+    fig_ratio.update_layout(
+        title=f'Ratio Combiné Prévisionnel - bandes 50 % et {confidence_level} % ({forecast_engine.N_PATHS:,} trajectoires)',
+        xaxis_title='Année',
+        yaxis_title='Ratio combiné (%)',
+        hovermode='x unified'
+    )
+    st.plotly_chart(fig_ratio, use_container_width=True)
+    
     # Tableau des prévisions détaillées
     st.markdown('<div class="section-header">📊 Détail des Prévisions</div>', unsafe_allow_html=True)
     
@@ -1357,7 +1414,10 @@ def show_forecasting_analysis(analyzer):
         forecast_data.append({
             'Année': year,
             'Primes Totales (Md FCFA)': f"{primes_pred/1000000000:.2f}",
+            f'Primes IC {confidence_level}% (Md FCFA)': f"{primes_bands[f'lower_{confidence_level}'][i]/1000000000:.2f} - {primes_bands[f'upper_{confidence_level}'][i]/1000000000:.2f}",
             'Résultat Net (M FCFA)': f"{resultat_pred/1000000:.2f}",
+            f'Résultat IC {confidence_level}% (M FCFA)': f"{resultats_bands[f'lower_{confidence_level}'][i]/1000000:.2f} - {resultats_bands[f'upper_{confidence_level}'][i]/1000000:.2f}",
+            f'Ratio Combiné IC {confidence_level}% (%)': f"{ratio_bands[f'lower_{confidence_level}'][i]:.1f} - {ratio_bands[f'upper_{confidence_level}'][i]:.1f}",
             'ROE Prévisionnel (%)': f"{roe_pred:.1f}",
             'Marge Nette Prévisionnelle (%)': f"{marge_pred:.1f}",
             'Scénario': scenario
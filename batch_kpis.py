@@ -0,0 +1,153 @@
+# =============================================================================
+# TRAITEMENT BATCH DES KPI PAR CÉDANTE
+# =============================================================================
+# Exécute la chaîne complète (lecture, mapping, KPI, agrégats, prévisions,
+# export) sur chaque fichier d'un répertoire, sans session Streamlit.
+#
+# Usage : python batch_kpis.py bordereaux/ sorties/ --by date --by date,lob \
+#             --forecast earned_premium --steps 8 --workers 4
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+import column_mapping
+import forecast_engine
+import kpi_engine
+import kpi_parallel
+
+INPUT_EXTENSIONS = (".csv", ".xlsx", ".xls", ".parquet")
+# Au-delà de cette taille, un CSV est agrégé par blocs sans être chargé en entier
+CHUNKED_MIN_MB = float(os.environ.get("REASSURANCE_CHUNKED_MIN_MB", "256"))
+
+
+def read_source(path: str) -> pd.DataFrame:
+    """Lit un fichier de cédante selon son extension."""
+    if path.lower().endswith(".csv"):
+        return pd.read_csv(path)
+    if path.lower().endswith(".parquet"):
+        return pd.read_parquet(path)
+    return pd.read_excel(path)
+
+
+def list_sources(input_dir: str) -> list:
+    """Fichiers de cédantes du répertoire, triés par nom."""
+    paths = glob.glob(os.path.join(input_dir, "*"))
+    return sorted(p for p in paths if p.lower().endswith(INPUT_EXTENSIONS))
+
+
+def load_cube(path: str, views: list, mapping: dict = None):
+    """Cube de mesures d'un fichier et nombre de lignes lues.
+
+    Un CSV de plus de CHUNKED_MIN_MB est agrégé par blocs (aggregate_kpis_chunked)
+    au grain le plus fin demandé par les vues, sans être chargé en entier.
+    """
+    if path.lower().endswith(".csv") and os.path.getsize(path) > CHUNKED_MIN_MB * 1e6:
+        if mapping is None:
+            header = pd.read_csv(path, nrows=0).columns
+            mapping, _ = column_mapping.suggest_mapping(header, column_mapping.MappingProfileStore())
+        missing = [c for c in kpi_engine.REQUIRED_BASE if mapping.get(c) is None]
+        if missing:
+            raise KeyError(f"Colonnes obligatoires absentes : {missing}")
+        needed = {"date"} | {d for by in views for d in by}
+        grain = [d for d in kpi_engine.DIMENSIONS if d in needed]
+        agg = kpi_engine.aggregate_kpis_chunked(path, grain, mapping)
+        return kpi_engine.KpiCube(agg), agg.attrs["rows_read"]
+    df_raw = read_source(path)
+    if mapping is None:
+        mapping, _ = column_mapping.suggest_mapping(df_raw.columns, column_mapping.MappingProfileStore())
+    df_kpi = kpi_engine.compute_kpis(kpi_engine.prepare_frame(df_raw, mapping))
+    return kpi_parallel.build_cube(df_kpi), len(df_kpi)
+
+
+def run_file(path: str, output_dir: str, views: list, targets: list, steps: int,
+             mapping: dict = None, fmt: str = "csv") -> dict:
+    """Chaîne KPI complète pour un fichier ; retourne une ligne de synthèse."""
+    name = os.path.splitext(os.path.basename(path))[0]
+    t0 = time.perf_counter()
+    summary = {"file": os.path.basename(path), "rows": 0, "tables": 0, "status": "ok", "error": ""}
+    try:
+        cube, summary["rows"] = load_cube(path, views, mapping)
+        target_dir = os.path.join(output_dir, name)
+        os.makedirs(target_dir, exist_ok=True)
+
+        for by in views:
+            agg = cube.rollup(by).sort_values(by)
+            kpi_engine.export_table(agg, os.path.join(target_dir, f"kpi_{'_'.join(by)}.{fmt}"))
+            summary["tables"] += 1
+        if targets:
+            fc = forecast_engine.forecast_kpis(cube.rollup(["date"]), targets, steps)
+            kpi_engine.export_table(fc, os.path.join(target_dir, f"forecast.{fmt}"))
+            summary["tables"] += 1
+    except Exception as exc:
+        summary["status"] = "erreur"
+        summary["error"] = f"{type(exc).__name__}: {exc}"
+    summary["seconds"] = round(time.perf_counter() - t0, 3)
+    return summary
+
+
+def run_batch(input_dir: str, output_dir: str, views=(["date"],), targets=(), steps: int = 8,
+              mapping: dict = None, fmt: str = "csv", workers: int = 1) -> pd.DataFrame:
+    """Traite tous les fichiers du répertoire ; retourne la synthèse par fichier."""
+    sources = list_sources(input_dir)
+    os.makedirs(output_dir, exist_ok=True)
+    args = (output_dir, [list(v) for v in views], list(targets), steps, mapping, fmt)
+    if workers > 1 and len(sources) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(sources))) as pool:
+            futures = [pool.submit(run_file, path, *args) for path in sources]
+            results = []
+            # Progression dans l'ordre de fin des fichiers, synthèse remise dans l'ordre des noms
+            for i, fut in enumerate(as_completed(futures), 1):
+                results.append(fut.result())
+                _progress(i, len(sources), results[-1])
+            results.sort(key=lambda r: r["file"])
+    else:
+        results = []
+        for i, path in enumerate(sources, 1):
+            results.append(run_file(path, *args))
+            _progress(i, len(sources), results[-1])
+    summary = pd.DataFrame(results, columns=["file", "rows", "tables", "status", "error", "seconds"])
+    kpi_engine.export_table(summary, os.path.join(output_dir, "_batch_summary.csv"))
+    return summary
+
+
+def _progress(i: int, total: int, result: dict):
+    status = result["status"] if result["status"] == "ok" else f"{result['status']} ({result['error']})"
+    print(f"[{i}/{total}] {result['file']} : {result['rows']:,} lignes, "
+          f"{result['seconds']:.2f} s - {status}", file=sys.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Calcul batch des KPI de réassurance par cédante")
+    parser.add_argument("input_dir", help="Répertoire des fichiers de cédantes (CSV, Excel, Parquet)")
+    parser.add_argument("output_dir", help="Répertoire de sortie des tables KPI")
+    parser.add_argument("--by", action="append",
+                        help="Dimensions d'agrégation séparées par des virgules (répétable, défaut : date)")
+    parser.add_argument("--forecast", action="append", default=[], metavar="COLONNE",
+                        help="Série agrégée à prévoir (répétable)")
+    parser.add_argument("--steps", type=int, default=8, help="Horizon de prévision en périodes")
+    parser.add_argument("--mapping", help="Fichier JSON {colonne schéma: colonne source} "
+                                          "(défaut : profil enregistré ou correspondance approchée)")
+    parser.add_argument("--format", choices=["csv", "parquet"], default="csv")
+    parser.add_argument("--workers", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    views = [v.split(",") for v in (args.by or ["date"])]
+    mapping = None
+    if args.mapping:
+        with open(args.mapping, encoding="utf-8") as f:
+            mapping = json.load(f)
+    summary = run_batch(args.input_dir, args.output_dir, views, args.forecast, args.steps,
+                        mapping, args.format, args.workers)
+    failed = int((summary["status"] != "ok").sum())
+    print(f"{len(summary)} fichiers traités, {failed} en erreur", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,557 @@
+# =============================================================================
+# BENCHMARKS DU MOTEUR KPI
+# =============================================================================
+# Usage : python benchmarks.py kpis --rows 2000000
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+import warnings
+
+import numpy as np
+import pandas as pd
+
+import dataset_store
+import demo_data
+import forecast_engine
+import hierarchy
+import ingestion
+import kpi_engine
+import kpi_parallel
+
+MEASURES = [
+    "gross_premium", "ceded_premium", "earned_premium", "incurred_claims", "paid_claims",
+    "ibnr", "rbns", "acq_expense", "adm_expense", "investment_income",
+    "claims_count", "exposure", "scr", "own_funds",
+]
+
+
+def make_bench_frame(rows: int, seed: int = 0) -> pd.DataFrame:
+    """Bordereau synthétique ligne à ligne, avec quelques primes nulles."""
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        "date": pd.Timestamp("2020-01-01") + pd.to_timedelta(rng.integers(0, 20, rows) * 91, unit="D"),
+        "cedant": rng.choice(["CedantA", "CedantB", "CedantC"], rows),
+        "lob": rng.choice(["Property Cat", "Casualty", "Vie", "Santé"], rows),
+        "region": rng.choice(["EU", "NA", "Asia"], rows),
+        "peril": rng.choice(["Wind", "Flood", "Liability", "Quake"], rows),
+    })
+    for col in MEASURES:
+        df[col] = rng.gamma(2.0, 50.0, rows)
+    df["claims_count"] = rng.poisson(90, rows)
+    df["exposure"] = rng.integers(0, 1600, rows)
+    df.loc[df.sample(frac=0.01, random_state=seed).index, "earned_premium"] = 0.0
+    return df
+
+
+def legacy_compute_kpis(d: pd.DataFrame) -> pd.DataFrame:
+    """Implémentation historique de compute_kpis (référence)."""
+    df = d.copy()
+    ep = df["earned_premium"].replace(0, np.nan)
+    gwp = df.get("gross_premium", pd.Series(np.nan, index=df.index))
+    ced = df.get("ceded_premium", pd.Series(0.0, index=df.index))
+
+    df["loss_ratio"] = df["incurred_claims"] / ep
+    df["acq_ratio"] = df.get("acq_expense", 0) / ep
+    df["adm_ratio"] = df.get("adm_expense", 0) / ep
+    df["expense_ratio"] = df["acq_ratio"].fillna(0) + df["adm_ratio"].fillna(0)
+    df["combined_ratio"] = df["loss_ratio"].fillna(0) + df["expense_ratio"].fillna(0)
+    df["operating_ratio"] = df["combined_ratio"] - (df.get("investment_income", 0) / ep)
+    df["cession_ratio"] = ced / gwp.replace(0, np.nan)
+    df["retention_ratio"] = (gwp - ced) / gwp.replace(0, np.nan)
+
+    if {"claims_count", "exposure"}.issubset(df.columns):
+        df["frequency"] = df["claims_count"] / df["exposure"].replace(0, np.nan)
+    if {"incurred_claims", "claims_count"}.issubset(df.columns):
+        df["severity"] = df["incurred_claims"] / df["claims_count"].replace(0, np.nan)
+
+    if {"ibnr", "rbns"}.issubset(df.columns):
+        df["total_reserves"] = df["ibnr"].fillna(0) + df["rbns"].fillna(0)
+        df["reserve_coverage"] = df["total_reserves"] / df["incurred_claims"].replace(0, np.nan)
+
+    if {"scr", "own_funds"}.issubset(df.columns):
+        df["solvency_ratio"] = df["own_funds"] / df["scr"].replace(0, np.nan)
+
+    return df
+
+
+def legacy_make_demo_data(periods=16, seed=42, freq="Q"):
+    """Générateur de démonstration historique, ligne à ligne (référence)."""
+    rng = np.random.default_rng(seed)
+    idx = pd.period_range("2022Q1", periods=periods, freq=freq).to_timestamp()
+    rows = []
+    for dt in idx:
+        for lob in ["Property Cat", "Casualty", "Vie", "Santé"]:
+            for region in ["EU", "NA"]:
+                gwp = rng.normal(50, 8) * 100000
+                ced = gwp * rng.uniform(0.15, 0.45)
+                ep = gwp * rng.uniform(0.75, 0.95)
+                cnt = rng.poisson(110 if lob == "Property Cat" else 85)
+                expo = rng.integers(900, 1600)
+                sev = rng.lognormal(mean=9.35 if lob == "Property Cat" else 9.1, sigma=0.35)
+                inc = float(cnt) * float(sev)
+                paid = inc * rng.uniform(0.6, 0.9)
+                ibnr = inc * rng.uniform(0.06, 0.18)
+                rbns = inc * rng.uniform(0.05, 0.15)
+                acq = ep * rng.uniform(0.08, 0.14)
+                adm = ep * rng.uniform(0.05, 0.09)
+                inv = gwp * rng.uniform(0.01, 0.03)
+                scr = ep * rng.uniform(0.28, 0.42)
+                own = scr * rng.uniform(1.25, 1.9)
+                rows.append([
+                    dt, "CedantA", lob, region, gwp, ced, ep, inc, paid, ibnr, rbns,
+                    acq, adm, cnt, expo, scr, own, inv
+                ])
+    return pd.DataFrame(rows, columns=[
+        "date", "cedant", "lob", "region", "gross_premium", "ceded_premium", "earned_premium",
+        "incurred_claims", "paid_claims", "ibnr", "rbns", "acq_expense", "adm_expense",
+        "claims_count", "exposure", "scr", "own_funds", "investment_income"
+    ])
+
+
+def measure(fn, *args, repeat: int = 3, **kwargs):
+    """Retourne (meilleur temps en s, pic mémoire en Mo, résultat)."""
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        result = None
+        t0 = time.perf_counter()
+        result = fn(*args, **kwargs)
+        best = min(best, time.perf_counter() - t0)
+    result = None
+    tracemalloc.start()
+    result = fn(*args, **kwargs)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak / 1e6, result
+
+
+def report(label: str, base, new):
+    """Affiche la comparaison entre l'implémentation de référence et la nouvelle."""
+    print(f"{label}")
+    print(f"  référence : {base[0]*1000:9.1f} ms   pic {base[1]:9.1f} Mo")
+    print(f"  nouveau   : {new[0]*1000:9.1f} ms   pic {new[1]:9.1f} Mo")
+    print(f"  gain      : x{base[0] / max(new[0], 1e-9):.1f} temps, x{base[1] / max(new[1], 1e-9):.1f} mémoire")
+
+
+def bench_kpis(args):
+    """compute_kpis historique vs noyau colonnaire."""
+    df = make_bench_frame(args.rows)
+    base = measure(legacy_compute_kpis, df)
+    new = measure(kpi_engine.compute_kpis, df)
+    pd.testing.assert_frame_equal(base[2], new[2])
+    report(f"compute_kpis sur {args.rows:,} lignes", base, new)
+
+
+def bench_cube(args):
+    """aggregate_kpis à chaque regroupement vs rollups depuis KpiCube."""
+    df = kpi_engine.compute_kpis(make_bench_frame(args.rows))
+    t0 = time.perf_counter()
+    cube = kpi_engine.KpiCube(df)
+    print(f"construction du cube sur {args.rows:,} lignes : {(time.perf_counter() - t0)*1000:.1f} ms")
+    for by in (["date"], ["date", "lob"], ["lob"], ["region"], ["date", "region"]):
+        base = measure(kpi_engine.aggregate_kpis, df, by)
+        new = measure(cube.rollup, by)
+        pd.testing.assert_frame_equal(base[2], new[2])
+        report(f"rollup {by}", base, new)
+
+
+def bench_incremental(args):
+    """Recalcul complet à chaque trimestre vs IncrementalAggregator.append."""
+    df = make_bench_frame(args.rows)
+    views = (["date"], ["date", "lob"], ["date", "region"])
+    dates = sorted(df["date"].unique())
+    history, last = df[df["date"] < dates[-1]], df[df["date"] == dates[-1]]
+
+    def full():
+        kpi = kpi_engine.compute_kpis(df)
+        return [kpi_engine.aggregate_kpis(kpi, by) for by in views]
+
+    # measure() appelle la fonction deux fois : un agrégateur prêt par appel
+    ready = []
+    for _ in range(2):
+        inc = kpi_engine.IncrementalAggregator().append(history)
+        for by in views:
+            inc.frame(by)
+        ready.append(inc)
+
+    def incremental():
+        inc = ready.pop()
+        inc.append(last)
+        return [inc.frame(by) for by in views]
+
+    base = measure(full, repeat=1)
+    new = measure(incremental, repeat=1)
+    for a, b in zip(base[2], new[2]):
+        pd.testing.assert_frame_equal(a, b)
+    report(f"ajout d'un trimestre ({len(last):,} lignes) à {len(history):,} lignes", base, new)
+
+
+def bench_chunked(args):
+    """read_csv complet + aggregate_kpis vs aggregate_kpis_chunked."""
+    by = ["date", "lob"]
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bordereau.csv")
+        make_bench_frame(args.rows).to_csv(path, index=False)
+
+        def full():
+            df = pd.read_csv(path)
+            df["date"] = kpi_engine.infer_date_col(df["date"])
+            df = kpi_engine.add_month_start(df)
+            return kpi_engine.aggregate_kpis(kpi_engine.compute_kpis(df), by)
+
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", UserWarning)
+            base = measure(full, repeat=1)
+            new = measure(kpi_engine.aggregate_kpis_chunked, path, by, chunksize=args.rows // 20 or 1, repeat=1)
+    pd.testing.assert_frame_equal(base[2], new[2])
+    report(f"agrégation d'un CSV de {args.rows:,} lignes (20 blocs)", base, new)
+
+
+def bench_parallel(args):
+    """aggregate_kpis_parallel de 1 à N processus (blocs de lignes agrégés par chaque processus)."""
+    df = make_bench_frame(args.rows)
+    by = ["date", "lob", "region"]
+    base = measure(kpi_engine.aggregate_kpis, df, by, repeat=1)
+    print(f"aggregate_kpis mono-processus sur {args.rows:,} lignes : {base[0]*1000:.1f} ms")
+    for workers in range(1, args.workers + 1):
+        new = measure(kpi_parallel.aggregate_kpis_parallel, df, by, workers, repeat=1)
+        pd.testing.assert_frame_equal(base[2], new[2])
+        print(f"  workers={workers:<2} {new[0]*1000:9.1f} ms   (x{base[0] / new[0]:.2f})")
+
+
+def bench_fan(args):
+    """10 000 trajectoires par segment : simulate de statsmodels vs tirages par lots, puis ETS vectorisé."""
+    df = demo_data.make_demo_data(48, freq="M", lobs=[f"LOB{i}" for i in range(8)],
+                                  regions=[f"R{i}" for i in range(5)])
+    agg = kpi_engine.aggregate_kpis(df, ["date", "lob", "region"])
+    agg["segment"] = agg["lob"].astype(str) + "/" + agg["region"].astype(str)
+    series = forecast_engine.segment_series(agg, "segment", "earned_premium")
+    ts = forecast_engine._clean(next(iter(series.values())))
+    order, seasonal = forecast_engine.default_orders(12)
+    n_paths = forecast_engine.N_PATHS
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        res = forecast_engine._fit_model(ts, order, seasonal)
+        base = measure(lambda: np.asarray(res.simulate(12, repetitions=n_paths, anchor="end")).reshape(12, -1).T, repeat=1)
+        new = measure(forecast_engine._state_space_paths, res, 12, n_paths, np.random.default_rng(0),
+                      forecast_engine.SIM_BATCH)
+        interval = forecast_engine.forecast_interval(ts, 12, order, seasonal, level=0.9)
+    bands = forecast_engine.fan_bands(pd.DataFrame(new[2]), (90,))
+    gap = np.abs(bands[["lower_90", "upper_90"]].to_numpy() - interval[["lower", "upper"]].to_numpy()).max(axis=1)
+    half = (interval["upper"] - interval["forecast"]).to_numpy()
+    report(f"{n_paths:,} trajectoires, 1 segment (bornes 90 % simulées vs analytiques : "
+           f"écart max {np.max(gap / half):.1%} de la demi-largeur)", base, new)
+
+    values = np.vstack([s.to_numpy() for s in series.values()])
+    new = measure(forecast_engine.ets_simulate, values, 12, n_paths, season=12, repeat=1)
+    print(f"ETS vectorisé, {len(series)} segments × {n_paths:,} trajectoires : {new[0]*1000:.1f} ms, "
+          f"pic {new[1]:.1f} Mo")
+
+
+def bench_forecast(args):
+    """SARIMAX segment par segment vs batch_forecast de 1 à N processus (40 segments lob × région)."""
+    df = demo_data.make_demo_data(48, freq="M", lobs=[f"LOB{i}" for i in range(8)],
+                                  regions=[f"R{i}" for i in range(5)])
+    agg = kpi_engine.aggregate_kpis(df, ["date", "lob", "region"])
+    agg["segment"] = agg["lob"].astype(str) + "/" + agg["region"].astype(str)
+    series = forecast_engine.segment_series(agg, "segment", "earned_premium")
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        base = measure(lambda: {k: forecast_engine.sarimax_forecast(ts, 12) for k, ts in series.items()}, repeat=1)
+        print(f"boucle séquentielle sur {len(series)} segments : {base[0]*1000:.1f} ms")
+        for workers in range(1, args.workers + 1):
+            new = measure(forecast_engine.batch_forecast, series, 12, workers=workers, repeat=1)
+            for k, fc in base[2].items():
+                pd.testing.assert_series_equal(fc, new[2][k])
+            print(f"  workers={workers:<2} {new[0]*1000:9.1f} ms   (x{base[0] / new[0]:.2f})")
+        # Rerun servi par le cache de prévisions
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = forecast_engine.ForecastCache(root=tmp)
+            forecast_engine.batch_forecast(series, 12, workers=1, cache=cache)
+            warm = measure(forecast_engine.batch_forecast, series, 12, cache=cache)
+            print(f"  rerun depuis le cache {warm[0]*1000:9.1f} ms   (x{base[0] / warm[0]:.0f})")
+
+
+def bench_ets(args):
+    """SARIMAX segment par segment vs lissage exponentiel vectorisé (précision sur 12 mois réservés, puis montée en charge)."""
+    def segments(n_lobs, n_regions):
+        df = demo_data.make_demo_data(48, freq="M", lobs=[f"LOB{i}" for i in range(n_lobs)],
+                                      regions=[f"R{i}" for i in range(n_regions)])
+        agg = kpi_engine.aggregate_kpis(df, ["date", "lob", "region"])
+        agg["segment"] = agg["lob"].astype(str) + "/" + agg["region"].astype(str)
+        return forecast_engine.segment_series(agg, "segment", "earned_premium")
+
+    series = segments(8, 5)
+    train = {k: ts.iloc[:-12] for k, ts in series.items()}
+    actual = np.vstack([ts.iloc[-12:].to_numpy() for ts in series.values()])
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        base = measure(lambda: {k: forecast_engine.sarimax_forecast(ts, 12) for k, ts in train.items()}, repeat=1)
+    new = measure(forecast_engine.ets_batch_forecast, train, 12, season=12)
+    for label, (_, _, fc) in (("SARIMAX", base), ("ETS vectorisé", new)):
+        mape = np.mean(np.abs(np.vstack([f.to_numpy() for f in fc.values()]) / actual - 1))
+        print(f"  {label:<14} MAPE sur 12 mois réservés : {mape:.1%}")
+    report(f"{len(train)} segments", base, new)
+
+    series = segments(50, 40)
+    values = np.vstack([ts.to_numpy() for ts in series.values()])
+    new = measure(forecast_engine.ets_forecast, values, 12, season=12, repeat=1)
+    per_series = base[0] / len(train)
+    print(f"{len(series)} segments : ETS {new[0]*1000:.1f} ms, SARIMAX estimé {per_series * len(series):.1f} s "
+          f"(x{per_series * len(series) / new[0]:.0f})")
+
+
+def bench_hierarchy(args):
+    """Réconciliation MinT d'une hiérarchie lob × région (2000 feuilles) : matrices denses vs produits creux."""
+    df = demo_data.make_demo_data(48, freq="M", lobs=[f"LOB{i}" for i in range(50)],
+                                  regions=[f"R{i}" for i in range(40)])
+    history, S, nodes = hierarchy.hierarchy_series(df, ["lob", "region"], "earned_premium")
+    base_fc, _ = forecast_engine.ets_forecast(history.T.to_numpy(), 12, season=12)
+    variances = hierarchy.residual_variances(history, 12)
+    print(f"{S.shape[0]} nœuds, {S.shape[1]} feuilles, {S.nnz} non-zéros")
+
+    def dense_mint():
+        Sd = S.toarray()
+        SW = Sd.T / variances
+        return Sd @ np.linalg.solve(SW @ Sd, SW @ base_fc)
+
+    base = measure(dense_mint, repeat=1)
+    new = measure(hierarchy.reconcile, base_fc, S, "mint", variances)
+    np.testing.assert_allclose(new[2], base[2], rtol=1e-6, atol=1e-6 * np.abs(base[2]).max())
+    report("MinT", base, new)
+    for method in ("bottom_up", "top_down"):
+        res = measure(hierarchy.reconcile, base_fc, S, method, proportions=hierarchy.historical_proportions(history, S))
+        print(f"  {method:<10} {res[0]*1000:9.1f} ms")
+
+
+def bench_orders(args):
+    """Sélection automatique de l'ordre SARIMAX (grille AIC) de 1 à N processus, puis depuis le cache."""
+    df = demo_data.make_demo_data(48, freq="M", lobs=[f"LOB{i}" for i in range(4)], regions=["EU", "NA"])
+    agg = kpi_engine.aggregate_kpis(df, ["date", "lob", "region"])
+    agg["segment"] = agg["lob"].astype(str) + "/" + agg["region"].astype(str)
+    series = forecast_engine.segment_series(agg, "segment", "earned_premium")
+    n_grid = len(forecast_engine.order_grid(12))
+    print(f"{len(series)} segments × {n_grid} candidats (d et D fixés par segment)")
+    for workers in range(1, args.workers + 1):
+        new = measure(forecast_engine.select_orders, series, 12, workers=workers, repeat=1)
+        print(f"  workers={workers:<2} {new[0]*1000:9.1f} ms   {int(new[2][1]['écartés'].sum())} candidats écartés")
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = forecast_engine.ForecastCache(root=tmp)
+        forecast_engine.select_orders(series, 12, workers=1, cache=cache)
+        warm = measure(forecast_engine.select_orders, series, 12, cache=cache)
+        print(f"  choix en cache {warm[0]*1000:9.1f} ms")
+    print(new[2][1].to_string())
+
+
+def bench_store(args):
+    """Re-parsing du CSV à chaque rerun vs lecture du dataset Parquet (projection, filtre)."""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bordereau.csv")
+        make_bench_frame(args.rows).to_csv(path, index=False)
+        store = dataset_store.ParquetDatasetStore(os.path.join(tmp, "store"))
+        with open(path, "rb") as f:
+            key = dataset_store.content_fingerprint(f.read())
+
+        def parse():
+            df = pd.read_csv(path)
+            df["date"] = kpi_engine.infer_date_col(df["date"])
+            return ingestion.compact_dtypes(kpi_engine.add_month_start(df))
+
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", UserWarning)
+            base = measure(parse, repeat=1)
+        t0 = time.perf_counter()
+        store.write(base[2], key)
+        print(f"conversion Parquet initiale : {(time.perf_counter() - t0)*1000:.1f} ms")
+        cases = {
+            "page KPI (dimensions + mesures)": dict(columns=dataset_store.KPI_PAGE_COLUMNS),
+            "prévision (date + cible)": dict(columns=["date", "earned_premium"]),
+            "filtre lob=Vie": dict(columns=dataset_store.KPI_PAGE_COLUMNS, filters={"lob": "Vie"}),
+        }
+        for label, kwargs in cases.items():
+            new = measure(store.read, key, **kwargs)
+            report(f"{label} sur {args.rows:,} lignes", base, new)
+
+
+def bench_window(args):
+    """Ratios glissants par boucle groupby/rolling vs window_kpis vectorisé.
+
+    La référence somme, groupe par groupe, les 12 derniers mois d'un
+    calendrier mensuel complet (mois absents à 0) ; la fenêtre n'est complète
+    que si la première période du groupe y commence. Cas mensuel et trimestriel.
+    """
+    df = kpi_engine.add_month_start(make_bench_frame(args.rows))
+    by = ["lob", "region", "cedant", "peril"]
+    months = np.random.default_rng(1).integers(0, 60, len(df))
+    cases = {
+        "mensuel": (1, pd.to_datetime(pd.DataFrame({"year": 2020 + months // 12,
+                                                    "month": months % 12 + 1, "day": 1}))),
+        "trimestriel": (3, df["date"].dt.to_period("Q").dt.start_time),
+    }
+    for label, (period, dates) in cases.items():
+        agg = kpi_engine.KpiCube(df.assign(date=dates)).rollup(["date"] + by)
+
+        def loop():
+            parts = []
+            for _, g in agg.groupby(by, observed=True):
+                g = g.sort_values("date")
+                calendar = g.set_index("date")[kpi_engine.SUM_MEASURES].asfreq("MS", fill_value=0.0)
+                sums = calendar.rolling(12, min_periods=1).sum().loc[g["date"]]
+                sums.index = g.index
+                ratios = kpi_engine.compute_kpis(sums)[kpi_engine.WINDOW_RATIOS]
+                complete = g["date"] >= g["date"].iloc[0] + pd.DateOffset(months=12 - period)
+                parts.append(ratios.where(complete))
+            return pd.concat(parts).sort_index()
+
+        base = measure(loop, repeat=1)
+        new = measure(kpi_engine.window_kpis, agg, by, repeat=1)
+        for ratio in kpi_engine.WINDOW_RATIOS:
+            np.testing.assert_allclose(new[2][f"{ratio}_12m"].to_numpy(dtype=float),
+                                       base[2][ratio].to_numpy(dtype=float), rtol=1e-9, equal_nan=True)
+        report(f"ratios glissants 12 mois ({label}) sur {len(agg):,} lignes agrégées", base, new)
+
+
+def bench_mmap(args):
+    """Lecture du dataset Parquet vs ouverture des colonnes memory-mappées."""
+    df = ingestion.compact_dtypes(kpi_engine.add_month_start(make_bench_frame(args.rows)))
+    with tempfile.TemporaryDirectory() as tmp:
+        store = dataset_store.ParquetDatasetStore(os.path.join(tmp, "store"))
+        mapped = dataset_store.MmapColumnStore(os.path.join(tmp, "mmap"))
+        store.write(df, "bench")
+        mapped.write(df, "bench")
+        cases = {
+            "ouverture complète": {},
+            "filtre lob=Vie": dict(filters={"lob": "Vie"}),
+        }
+        for label, kwargs in cases.items():
+            base = measure(store.read, "bench", columns=dataset_store.KPI_PAGE_COLUMNS, **kwargs)
+            new = measure(mapped.read, "bench", **kwargs)
+            # Le Parquet relit les lignes dans l'ordre des partitions : comparaison des totaux
+            assert len(base[2]) == len(new[2])
+            np.testing.assert_allclose(base[2][MEASURES].sum(), new[2][MEASURES].sum())
+            report(f"{label} sur {args.rows:,} lignes", base, new)
+            base = new = None
+
+
+def bench_subset(args):
+    """Tous les KPI vs le seul combined_ratio, sur un jeu de données élargi."""
+    df = make_bench_frame(args.rows)
+    extra = pd.DataFrame(np.ones((len(df), 100)), columns=[f"extra_{i}" for i in range(100)])
+    df = pd.concat([df, extra], axis=1)
+    base = measure(kpi_engine.compute_kpis, df)
+    new = measure(kpi_engine.compute_kpis, df, kpis=["combined_ratio"])
+    pd.testing.assert_series_equal(base[2]["combined_ratio"], new[2]["combined_ratio"])
+    report(f"compute_kpis, {df.shape[1]} colonnes, {args.rows:,} lignes (combined_ratio seul)", base, new)
+
+
+def bench_dates(args):
+    """Parsing générique historique vs détection de format + valeurs distinctes."""
+    dates = make_bench_frame(args.rows)["date"]
+    cases = {
+        "jj/mm/aaaa": dates.dt.strftime("%d/%m/%Y"),
+        "aaaa-mm-jj": dates.dt.strftime("%Y-%m-%d"),
+        "trimestres 2024Q1": dates.dt.to_period("Q").astype(str),
+    }
+    for label, s in cases.items():
+        s = s.astype(object)
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", UserWarning)
+            base = measure(kpi_engine._legacy_infer_date_col, s, repeat=1)
+        new = measure(kpi_engine.infer_date_col, s, repeat=1)
+        pd.testing.assert_series_equal(base[2], new[2], check_dtype=False)
+        report(f"dates {label} sur {args.rows:,} lignes", base, new)
+
+
+def bench_demo(args):
+    """Générateur de démonstration ligne à ligne vs tirages vectorisés."""
+    periods = max(args.rows // 8, 1)
+    base = measure(legacy_make_demo_data, periods, freq="D", repeat=1)
+    new = measure(demo_data.make_demo_data, periods, freq="D", start="2022-01-01", repeat=1)
+    assert base[2].shape == new[2].shape
+    pd.testing.assert_series_equal(base[2]["date"], new[2]["date"])
+    report(f"jeu de démonstration de {len(new[2]):,} lignes", base, new)
+
+
+def bench_claims(args):
+    """Sinistres individuels générés d'un bloc vs écrits en streaming, puis pont par période."""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "sinistres.parquet")
+        base = measure(demo_data.write_claims, path, args.rows, chunk_claims=args.rows, repeat=1)
+        new = measure(demo_data.write_claims, path, args.rows, chunk_claims=max(args.rows // 20, 1), repeat=1)
+        report(f"{args.rows:,} sinistres ({new[2]:,} paiements) : un bloc vs 20 blocs", base, new)
+        bridge = measure(demo_data.claims_to_periods, path, batch_rows=1_000_000, repeat=1)
+        print(f"pont par trimestre : {bridge[0]*1000:.1f} ms, pic {bridge[1]:.1f} Mo, {len(bridge[2]):,} lignes")
+
+
+def bench_excel(args):
+    """pd.read_excel de toutes les feuilles vs lecture en streaming par threads."""
+    df = make_bench_frame(args.rows)
+    df["date"] = df["date"].dt.year
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bordereau.xlsx")
+        with pd.ExcelWriter(path, engine="openpyxl") as writer:
+            for lob, part in df.groupby("lob"):
+                part.drop(columns="lob").to_excel(writer, sheet_name=lob[:31], index=False)
+
+        def full():
+            sheets = pd.read_excel(path, sheet_name=None)
+            return pd.concat(sheets.values(), ignore_index=True)
+
+        base = measure(full, repeat=1)
+        new = measure(ingestion.read_excel_streaming, path, workers=args.workers, repeat=1)
+    assert len(base[2]) == len(new[2][0]) == args.rows
+    report(f"classeur de {args.rows:,} lignes sur 4 feuilles", base, new)
+    print(new[2][1].round(3).to_string())
+
+
+def bench_validate(args):
+    """Coût de validate_frame rapporté au parsing du CSV, avec quelques valeurs texte."""
+    df = make_bench_frame(args.rows)
+    df["gross_premium"] = df["gross_premium"].round(2).astype(object)
+    df.loc[df.sample(frac=0.001, random_state=1).index, "gross_premium"] = "inconnu"
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bordereau.csv")
+        df.to_csv(path, index=False)
+        base = measure(pd.read_csv, path, repeat=1)
+    new = measure(ingestion.validate_frame, base[2])
+    report(f"parsing CSV vs validation, {args.rows:,} lignes", base, new)
+    print(f"  validation = {new[0] / base[0]:.1%} du temps de parsing")
+    print(new[2][1].to_string())
+
+
+BENCHES = {
+    "kpis": bench_kpis,
+    "orders": bench_orders,
+    "claims": bench_claims,
+    "cube": bench_cube,
+    "incremental": bench_incremental,
+    "chunked": bench_chunked,
+    "dates": bench_dates,
+    "demo": bench_demo,
+    "ets": bench_ets,
+    "excel": bench_excel,
+    "fan": bench_fan,
+    "forecast": bench_forecast,
+    "hierarchy": bench_hierarchy,
+    "mmap": bench_mmap,
+    "parallel": bench_parallel,
+    "store": bench_store,
+    "subset": bench_subset,
+    "validate": bench_validate,
+    "window": bench_window,
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks du moteur KPI")
+    parser.add_argument("bench", choices=sorted(BENCHES))
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args(argv)
+    BENCHES[args.bench](args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+# =============================================================================
+# MAPPING DES COLONNES - CORRESPONDANCE APPROCHÉE ET PROFILS
+# =============================================================================
+# Les en-têtes des bordereaux sont rapprochés des alias de SCHEMA par un index
+# de trigrammes (coefficient de Dice), ce qui reste rapide sur des fichiers de
+# plusieurs centaines de colonnes. Un mapping validé est enregistré comme
+# profil, identifié par l'empreinte de l'en-tête : un fichier de même
+# structure est ensuite mappé directement.
+import hashlib
+import json
+import os
+import re
+import unicodedata
+from collections import defaultdict
+
+import pandas as pd
+
+from dataset_store import DEFAULT_STORE_DIR
+from kpi_engine import SCHEMA, auto_map_columns
+
+# Score minimal (Dice sur trigrammes) pour proposer une correspondance
+MATCH_THRESHOLD = 0.5
+# Score d'un alias contenu mot pour mot dans l'en-tête
+CONTAINED_SCORE = 0.8
+
+
+# Abréviations courantes des en-têtes, développées avant comparaison
+ABBREVIATIONS = {"nb": "nombre", "nbr": "nombre", "nbre": "nombre", "no": "nombre", "num": "nombre"}
+
+
+def normalize_label(label) -> str:
+    """Minuscules sans accents, séparateurs ramenés à des espaces, abréviations développées."""
+    text = unicodedata.normalize("NFKD", str(label)).encode("ascii", "ignore").decode()
+    words = [w for w in re.split(r"[^0-9a-z&]+", text.lower()) if w]
+    return " ".join(ABBREVIATIONS.get(w, w) for w in words)
+
+
+def _trigrams(label: str) -> set:
+    """Trigrammes des mots d'un libellé normalisé, bornés par des espaces."""
+    grams = set()
+    for word in label.split():
+        padded = f" {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def header_fingerprint(columns) -> str:
+    """Empreinte d'une structure de fichier : liste ordonnée des en-têtes normalisés."""
+    payload = json.dumps([normalize_label(c) for c in columns])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+
+
+class ColumnMatcher:
+    """Index de trigrammes des alias du schéma."""
+
+    def __init__(self, schema: dict = SCHEMA, threshold: float = MATCH_THRESHOLD):
+        self.threshold = threshold
+        self._aliases = []                 # (clé du schéma, alias normalisé, trigrammes)
+        self._index = defaultdict(list)    # trigramme -> positions dans _aliases
+        for key, aliases in schema.items():
+            for alias in {normalize_label(a) for a in [key] + list(aliases)}:
+                grams = _trigrams(alias)
+                self._aliases.append((key, alias, grams))
+                for g in grams:
+                    self._index[g].append(len(self._aliases) - 1)
+
+    def scores(self, column) -> dict:
+        """Meilleur score par clé du schéma pour un en-tête (clés sans trigramme commun omises)."""
+        label = normalize_label(column)
+        grams = _trigrams(label)
+        common = defaultdict(int)
+        for g in grams:
+            for pos in self._index.get(g, ()):
+                common[pos] += 1
+        words = set(label.split())
+        best = {}
+        for pos, shared in common.items():
+            key, alias, alias_grams = self._aliases[pos]
+            score = 1.0 if alias == label else 2.0 * shared / (len(grams) + len(alias_grams))
+            # Alias présent mot pour mot dans un en-tête plus long ("Date comptable")
+            if len(alias) >= 4 and words.issuperset(alias.split()):
+                score = max(score, CONTAINED_SCORE)
+            if score > best.get(key, 0.0):
+                best[key] = score
+        return best
+
+    def match(self, columns) -> dict:
+        """Mapping {clé du schéma: colonne ou None}, une colonne au plus par clé.
+
+        Les paires (clé, colonne) sont affectées par score décroissant.
+        """
+        candidates = []
+        for col in columns:
+            for key, score in self.scores(col).items():
+                if score >= self.threshold:
+                    candidates.append((score, key, col))
+        candidates.sort(key=lambda c: -c[0])
+        mapping = {key: None for key in SCHEMA}
+        used = set()
+        for score, key, col in candidates:
+            if mapping.get(key) is None and col not in used:
+                mapping[key] = col
+                used.add(col)
+        return mapping
+
+
+class MappingProfileStore:
+    """Profils de mapping enregistrés par empreinte d'en-tête (fichiers JSON)."""
+
+    def __init__(self, root: str = os.path.join(DEFAULT_STORE_DIR, "profiles")):
+        self.root = root
+
+    def _path(self, fingerprint: str) -> str:
+        return os.path.join(self.root, f"{fingerprint}.json")
+
+    def load(self, fingerprint: str):
+        """Mapping enregistré pour cette structure de fichier, sinon None."""
+        path = self._path(fingerprint)
+        if not os.path.exists(path):
+            return None
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+
+    def save(self, fingerprint: str, mapping: dict):
+        """Enregistre le mapping s'il diffère du profil existant."""
+        if self.load(fingerprint) == mapping:
+            return
+        os.makedirs(self.root, exist_ok=True)
+        tmp = f"{self._path(fingerprint)}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(mapping, f, ensure_ascii=False)
+        os.replace(tmp, self._path(fingerprint))
+
+
+_DEFAULT_MATCHER = None
+
+
+def suggest_mapping(columns, profiles: MappingProfileStore = None):
+    """Mapping proposé pour un en-tête et indicateur « profil connu ».
+
+    Les clés d'un profil enregistré pour la même structure (confirmées par
+    l'utilisateur) sont reprises telles quelles ; les autres sont proposées
+    par les alias exacts de SCHEMA puis la correspondance approchée, parmi
+    les colonnes restantes.
+    """
+    global _DEFAULT_MATCHER
+    columns = [str(c) for c in columns]
+    profile = profiles.load(header_fingerprint(columns)) if profiles is not None else None
+    mapping = {key: (col if col in columns else None) for key, col in (profile or {}).items()}
+    rest = [key for key in SCHEMA if key not in mapping]
+    if rest:
+        if _DEFAULT_MATCHER is None:
+            _DEFAULT_MATCHER = ColumnMatcher()
+        free = [c for c in columns if c not in mapping.values()]
+        exact = auto_map_columns(pd.DataFrame(columns=free))
+        fuzzy = _DEFAULT_MATCHER.match([c for c in free if c not in exact.values()])
+        mapping.update({key: exact.get(key) or fuzzy.get(key) for key in rest})
+    return {key: mapping.get(key) for key in SCHEMA}, profile is not None
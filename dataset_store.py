@@ -0,0 +1,340 @@
+# =============================================================================
+# STOCKAGE PARQUET DES JEUX DE DONNÉES
+# =============================================================================
+# Le premier chargement d'un fichier est converti en dataset Parquet partitionné
+# par date et lob. Les lectures suivantes ne chargent que les colonnes utiles
+# (projection) et ne lisent que les partitions/groupes de lignes qui passent
+# les filtres de dimensions (predicate pushdown). Le dataset est identifié par
+# une empreinte du contenu : plusieurs sessions partagent la même copie disque.
+#
+# Un dataset préparé peut aussi être figé en colonnes memory-mappées (.npy) :
+# l'ouverture ne lit rien, les pages sont chargées à la demande et partagées
+# entre sessions (et entre redémarrages) par le cache de pages du système.
+#
+# Chaque store est borné, comme les caches de fichiers et de prévisions : à
+# chaque écriture, les datasets non ouverts depuis plus de max_age_days sont
+# supprimés, puis les moins récemment ouverts au-delà de max_mb.
+import hashlib
+import json
+import os
+import shutil
+import time
+import uuid
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+from kpi_engine import DIMENSIONS, SUM_MEASURES
+
+DEFAULT_STORE_DIR = os.environ.get("REASSURANCE_STORE_DIR", ".reassurance_store")
+PARTITION_COLUMNS = ["date", "lob"]
+
+# Colonnes lues par page de l'application
+KPI_PAGE_COLUMNS = DIMENSIONS + SUM_MEASURES
+# Bornes de chaque store : taille totale (Mo) et ancienneté depuis la dernière ouverture
+DEFAULT_BUDGET_MB = float(os.environ.get("REASSURANCE_STORE_MB", "4096"))
+DEFAULT_MAX_AGE_DAYS = float(os.environ.get("REASSURANCE_STORE_MAX_AGE_DAYS", "30"))
+
+
+def content_fingerprint(data: bytes, mapping: dict = None) -> str:
+    """Empreinte SHA-256 du contenu brut, et du mapping de colonnes s'il est fourni."""
+    h = hashlib.sha256(data)
+    if mapping is not None:
+        h.update(json.dumps(mapping, sort_keys=True, default=str).encode("utf-8"))
+    return h.hexdigest()[:32]
+
+
+def _filter_expression(filters: dict):
+    """Expression pyarrow à partir de {colonne: valeur ou liste de valeurs}."""
+    expr = None
+    for col, value in (filters or {}).items():
+        values = list(value) if isinstance(value, (list, tuple, set)) else [value]
+        if col == "date":
+            values = [pd.Timestamp(v).date() for v in values]
+        term = ds.field(col).isin(values)
+        expr = term if expr is None else expr & term
+    return expr
+
+
+def _dir_size(path: str) -> int:
+    total = 0
+    for base, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(base, name))
+            except OSError:
+                pass
+    return total
+
+
+def _trim_datasets(root: str, max_bytes: int, max_age_s: float, keep: str = None):
+    """Supprime les datasets de `root` inutilisés depuis `max_age_s`, puis les
+    moins récemment ouverts jusqu'à repasser sous `max_bytes`.
+
+    La date de dernière ouverture est celle de _meta.json (mise à jour par
+    touch) ; le dataset `keep` (celui qu'on vient d'écrire) est conservé.
+    Retourne les clés supprimées.
+    """
+    if not os.path.isdir(root):
+        return []
+    entries = []
+    for entry in os.scandir(root):
+        meta = os.path.join(entry.path, "_meta.json")
+        if entry.name == keep or not entry.is_dir() or not os.path.exists(meta):
+            continue
+        try:
+            entries.append((os.path.getmtime(meta), _dir_size(entry.path), entry.name, entry.path))
+        except OSError:
+            continue
+    entries.sort()
+    total = sum(size for _, size, _, _ in entries) + (_dir_size(os.path.join(root, keep)) if keep else 0)
+    now = time.time()
+    removed = []
+    for used, size, key, path in entries:
+        if now - used <= max_age_s and total <= max_bytes:
+            break
+        shutil.rmtree(path, ignore_errors=True)
+        total -= size
+        removed.append(key)
+    return removed
+
+
+class ParquetDatasetStore:
+    """Datasets Parquet partitionnés (date, lob) sur disque local."""
+
+    def __init__(self, root: str = DEFAULT_STORE_DIR, max_mb: float = DEFAULT_BUDGET_MB,
+                 max_age_days: float = DEFAULT_MAX_AGE_DAYS):
+        self.root = root
+        self.max_bytes = int(max_mb * 1e6)
+        self.max_age_s = max_age_days * 86400
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.root, key)
+
+    def exists(self, key: str) -> bool:
+        return os.path.exists(os.path.join(self.path(key), "_meta.json"))
+
+    def metadata(self, key: str) -> dict:
+        with open(os.path.join(self.path(key), "_meta.json"), encoding="utf-8") as f:
+            return json.load(f)
+
+    def touch(self, key: str):
+        """Marque le dataset comme ouvert (repousse son éviction)."""
+        try:
+            os.utime(os.path.join(self.path(key), "_meta.json"))
+        except OSError:
+            pass
+
+    def trim(self, keep: str = None) -> list:
+        """Évince les datasets trop anciens ou au-delà du budget disque."""
+        return _trim_datasets(self.root, self.max_bytes, self.max_age_s, keep)
+
+    def header(self, raw_key: str):
+        """En-tête brut (colonnes utilisateur) d'un fichier déjà chargé, sinon None."""
+        path = os.path.join(self.root, "headers", f"{raw_key}.json")
+        if not os.path.exists(path):
+            return None
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+
+    def save_header(self, raw_key: str, columns: list):
+        os.makedirs(os.path.join(self.root, "headers"), exist_ok=True)
+        with open(os.path.join(self.root, "headers", f"{raw_key}.json"), "w", encoding="utf-8") as f:
+            json.dump([str(c) for c in columns], f)
+
+    def _partitioning(self, columns):
+        types = {"date": pa.date32(), "lob": pa.string()}
+        fields = [(c, types[c]) for c in PARTITION_COLUMNS if c in columns]
+        return ds.partitioning(pa.schema(fields), flavor="hive") if fields else None
+
+    def write(self, df: pd.DataFrame, key: str, meta: dict = None) -> str:
+        """Écrit le DataFrame (colonnes déjà au format SCHEMA) sous la clé donnée.
+
+        L'écriture se fait dans un répertoire temporaire renommé à la fin, de
+        sorte qu'une session concurrente ne voie jamais un dataset partiel.
+        """
+        target = self.path(key)
+        if self.exists(key):
+            return target
+        os.makedirs(self.root, exist_ok=True)
+        tmp = os.path.join(self.root, f".tmp-{key}-{uuid.uuid4().hex[:8]}")
+        table_df = df.copy(deep=False)
+        if "date" in table_df.columns:
+            table_df["date"] = pd.to_datetime(table_df["date"]).dt.date
+        if "lob" in table_df.columns:
+            table_df["lob"] = table_df["lob"].astype(str)
+        table = pa.Table.from_pandas(table_df, preserve_index=False)
+        ds.write_dataset(
+            table, tmp, format="parquet",
+            partitioning=self._partitioning(table_df.columns),
+            existing_data_behavior="overwrite_or_ignore",
+            # Évite une multitude de petits groupes de lignes par fichier
+            min_rows_per_group=64_000, max_rows_per_group=1_000_000,
+        )
+        with open(os.path.join(tmp, "_meta.json"), "w", encoding="utf-8") as f:
+            json.dump(dict(meta or {}, columns=list(df.columns), rows=len(df)), f)
+        try:
+            os.replace(tmp, target)
+        except OSError:
+            # Une autre session a écrit le même dataset entre-temps
+            shutil.rmtree(tmp, ignore_errors=True)
+        self.trim(keep=key)
+        return target
+
+    def dataset(self, key: str):
+        meta = self.metadata(key)
+        return ds.dataset(
+            self.path(key), format="parquet",
+            partitioning=self._partitioning(meta["columns"]),
+            exclude_invalid_files=True,
+        )
+
+    def read(self, key: str, columns=None, filters: dict = None) -> pd.DataFrame:
+        """Charge les colonnes demandées, en ne lisant que les données qui passent les filtres."""
+        dset = self.dataset(key)
+        self.touch(key)
+        if columns is not None:
+            columns = [c for c in columns if c in dset.schema.names]
+        table = dset.to_table(columns=columns, filter=_filter_expression(filters))
+        out = table.to_pandas()
+        order = [c for c in self.metadata(key)["columns"] if c in out.columns]
+        out = out[order]
+        if "date" in out.columns:
+            out["date"] = pd.to_datetime(out["date"])
+        if "lob" in out.columns:
+            out["lob"] = out["lob"].astype("category")
+        return out
+
+    def partition_values(self, key: str, column: str = "lob") -> list:
+        """Valeurs d'une colonne de partition, lues depuis l'arborescence seule."""
+        dset = self.dataset(key)
+        values = set()
+        for fragment in dset.get_fragments():
+            expr = ds.get_partition_keys(fragment.partition_expression)
+            if column in expr:
+                values.add(expr[column])
+        return sorted(values)
+
+
+# =============================================================================
+# COLONNES MEMORY-MAPPÉES
+# =============================================================================
+class MmapColumnStore:
+    """Datasets préparés stockés colonne par colonne en tableaux .npy memory-mappés.
+
+    Les mesures et les dates sont écrites telles quelles ; les dimensions
+    texte ou catégorielles sont écrites sous forme de codes entiers, leurs
+    dictionnaires étant conservés dans un petit fichier annexe JSON.
+    """
+
+    def __init__(self, root: str = os.path.join(DEFAULT_STORE_DIR, "mmap"), max_mb: float = DEFAULT_BUDGET_MB,
+                 max_age_days: float = DEFAULT_MAX_AGE_DAYS):
+        self.root = root
+        self.max_bytes = int(max_mb * 1e6)
+        self.max_age_s = max_age_days * 86400
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.root, key)
+
+    def exists(self, key: str) -> bool:
+        return os.path.exists(os.path.join(self.path(key), "_meta.json"))
+
+    def metadata(self, key: str) -> dict:
+        with open(os.path.join(self.path(key), "_meta.json"), encoding="utf-8") as f:
+            return json.load(f)
+
+    def touch(self, key: str):
+        """Marque le dataset comme ouvert (repousse son éviction)."""
+        try:
+            os.utime(os.path.join(self.path(key), "_meta.json"))
+        except OSError:
+            pass
+
+    def trim(self, keep: str = None) -> list:
+        """Évince les datasets trop anciens ou au-delà du budget disque."""
+        return _trim_datasets(self.root, self.max_bytes, self.max_age_s, keep)
+
+    def categories(self, key: str, column: str) -> list:
+        """Dictionnaire d'une colonne catégorielle, lu depuis le fichier annexe."""
+        with open(os.path.join(self.path(key), "_categories.json"), encoding="utf-8") as f:
+            return json.load(f).get(column, [])
+
+    def write(self, df: pd.DataFrame, key: str, meta: dict = None) -> str:
+        """Écrit le DataFrame colonne par colonne, dans un répertoire renommé à la fin."""
+        target = self.path(key)
+        if self.exists(key):
+            return target
+        tmp = os.path.join(self.root, f".tmp-{key}-{uuid.uuid4().hex[:8]}")
+        os.makedirs(tmp)
+        dtypes, categories = {}, {}
+        for i, col in enumerate(df.columns):
+            s = df[col]
+            if isinstance(s.dtype, pd.CategoricalDtype) or s.dtype.kind not in "iufbM":
+                cat = s.astype("category").cat
+                values = cat.codes.to_numpy()
+                categories[col] = [str(c) for c in cat.categories]
+                dtypes[col] = "category"
+            else:
+                values = s.to_numpy()
+                dtypes[col] = str(values.dtype)
+                if values.dtype.kind == "M":
+                    values = values.view(np.int64)
+            np.save(os.path.join(tmp, f"{i}.npy"), np.ascontiguousarray(values))
+        with open(os.path.join(tmp, "_categories.json"), "w", encoding="utf-8") as f:
+            json.dump(categories, f, ensure_ascii=False)
+        with open(os.path.join(tmp, "_meta.json"), "w", encoding="utf-8") as f:
+            json.dump(dict(meta or {}, columns=[str(c) for c in df.columns], dtypes=dtypes, rows=len(df)), f)
+        try:
+            os.replace(tmp, target)
+        except OSError:
+            # Une autre session a écrit le même dataset entre-temps
+            shutil.rmtree(tmp, ignore_errors=True)
+        self.trim(keep=key)
+        return target
+
+    def read(self, key: str, columns=None, filters: dict = None) -> pd.DataFrame:
+        """Ouvre les colonnes demandées sans les charger en mémoire.
+
+        Sans filtre, les mesures restent adossées aux fichiers (lecture seule) ;
+        un filtre {colonne: valeur ou liste} ne copie que les lignes retenues.
+        """
+        meta = self.metadata(key)
+        self.touch(key)
+        with open(os.path.join(self.path(key), "_categories.json"), encoding="utf-8") as f:
+            categories = json.load(f)
+        wanted = meta["columns"] if columns is None else [c for c in meta["columns"] if c in columns]
+
+        def load(col):
+            return np.load(os.path.join(self.path(key), f"{meta['columns'].index(col)}.npy"), mmap_mode="r")
+
+        mask = None
+        for col, value in (filters or {}).items():
+            values = list(value) if isinstance(value, (list, tuple, set)) else [value]
+            arr = load(col)
+            dtype = meta["dtypes"][col]
+            if dtype == "category":
+                # Table de correspondance code -> retenu (la dernière case couvre le code -1)
+                keep = np.zeros(len(categories[col]) + 1, dtype=bool)
+                keep[[i for i, c in enumerate(categories[col]) if c in {str(v) for v in values}]] = True
+                term = keep[arr]
+            else:
+                if dtype.startswith("datetime64"):
+                    arr = arr.view(dtype)
+                    values = pd.to_datetime(values).to_numpy().astype(dtype)
+                term = np.isin(arr, values)
+            mask = term if mask is None else mask & term
+        rows = None if mask is None else np.flatnonzero(mask)
+
+        data = {}
+        for col in wanted:
+            arr = load(col)
+            dtype = meta["dtypes"][col]
+            if rows is not None:
+                arr = arr.take(rows)
+            if dtype == "category":
+                data[col] = pd.Categorical.from_codes(arr, categories[col])
+            else:
+                data[col] = pd.Series(arr.view(dtype) if dtype.startswith("datetime64") else arr, copy=False)
+        return pd.DataFrame(data, copy=False)
@@ -0,0 +1,283 @@
+# =============================================================================
+# DONNÉES DE DÉMONSTRATION - GÉNÉRATEUR VECTORISÉ
+# =============================================================================
+# Toutes les lignes (date × cédante × lob × péril × région) sont tirées en une
+# fois sous forme de tableaux : quelques millions de lignes se génèrent en
+# quelques secondes, ce qui permet de construire des jeux de test de charge.
+# Le résultat ne dépend que de la graine.
+#
+# Le générateur de sinistres individuels écrit des dizaines de millions de
+# lignes de paiement par blocs dans un fichier Parquet, sans les garder en
+# mémoire ; un pont les ré-agrège aux colonnes par période du schéma.
+#
+# Usage : python demo_data.py demo.parquet --periods 120 --freq M --cedants 50
+#         python demo_data.py sinistres.parquet --claims 20000000 --cedants 50
+import argparse
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+import kpi_engine
+
+DEMO_LOBS = ["Property Cat", "Casualty", "Vie", "Santé"]
+DEMO_REGIONS = ["EU", "NA"]
+# Paramètres par ligne de business : (nombre moyen de sinistres, moyenne du log de la sévérité)
+LOB_PARAMS = {"Property Cat": (110, 9.35)}
+DEFAULT_LOB_PARAMS = (85, 9.1)
+
+
+def _names(values, prefix: str) -> list:
+    """Liste de libellés ; un entier n donne n libellés générés ("CedantA"... puis numérotés)."""
+    if not isinstance(values, int):
+        return list(values)
+    if values <= 26:
+        return [f"{prefix}{chr(ord('A') + i)}" for i in range(values)]
+    width = len(str(values))
+    return [f"{prefix}{i + 1:0{width}d}" for i in range(values)]
+
+
+def make_demo_data(periods: int = 16, seed: int = 42, freq: str = "Q", start: str = "2022Q1",
+                   cedants=("CedantA",), lobs=DEMO_LOBS, regions=DEMO_REGIONS, perils=None,
+                   paired: bool = False, premium_scale: float = 100_000.0,
+                   severity_scale: float = 1.0, lob_params: dict = None) -> pd.DataFrame:
+    """Jeu de données de démonstration, une ligne par date × cédante × segment.
+
+    Les segments sont le produit lob × péril × région, ou, avec paired=True,
+    les triplets (lob, péril, région) pris terme à terme. `cedants` accepte
+    une liste de noms ou un nombre de cédantes. La colonne peril n'est
+    présente que si `perils` est fourni. Les dimensions sont catégorielles.
+    """
+    rng = np.random.default_rng(seed)
+    dates = pd.period_range(start, periods=periods, freq=freq).to_timestamp()
+    cedants = _names(cedants, "Cedant")
+    lobs, regions = list(lobs), list(regions)
+    dims = {"lob": lobs, "peril": list(perils), "region": regions} if perils is not None \
+        else {"lob": lobs, "region": regions}
+
+    if paired:
+        n_seg = len(lobs)
+        if any(len(v) != n_seg for v in dims.values()):
+            raise ValueError("paired=True : lobs, perils et regions doivent avoir la même longueur")
+        d_code, c_code, s_code = np.unravel_index(np.arange(periods * len(cedants) * n_seg),
+                                                  (periods, len(cedants), n_seg))
+        seg_codes = {name: s_code for name in dims}
+    else:
+        shape = (periods, len(cedants)) + tuple(len(v) for v in dims.values())
+        d_code, c_code, *codes = np.unravel_index(np.arange(int(np.prod(shape))), shape)
+        seg_codes = dict(zip(dims, codes))
+    n = len(d_code)
+
+    out = {
+        "date": dates.to_numpy()[d_code],
+        "cedant": pd.Categorical.from_codes(c_code.astype(np.int32), cedants),
+    }
+    for name, values in dims.items():
+        out[name] = pd.Categorical.from_codes(seg_codes[name].astype(np.int32), values)
+
+    # Paramètres par ligne, lus dans une table indexée par le code lob
+    params = np.array([(lob_params or LOB_PARAMS).get(lob, DEFAULT_LOB_PARAMS) for lob in lobs], dtype=float)
+    lob_code = seg_codes["lob"]
+    cnt_mean, sev_mu = params[lob_code, 0], params[lob_code, 1]
+
+    gwp = rng.normal(50, 8, n) * premium_scale
+    ced = gwp * rng.uniform(0.15, 0.45, n)
+    ep = gwp * rng.uniform(0.75, 0.95, n)
+    cnt = rng.poisson(cnt_mean)
+    expo = rng.integers(900, 1600, n)
+    sev = rng.lognormal(mean=sev_mu, sigma=0.35) * severity_scale
+    inc = cnt * sev
+    scr = ep * rng.uniform(0.28, 0.42, n)
+    out.update({
+        "gross_premium": gwp,
+        "ceded_premium": ced,
+        "earned_premium": ep,
+        "incurred_claims": inc,
+        "paid_claims": inc * rng.uniform(0.6, 0.9, n),
+        "ibnr": inc * rng.uniform(0.06, 0.18, n),
+        "rbns": inc * rng.uniform(0.05, 0.15, n),
+        "acq_expense": ep * rng.uniform(0.08, 0.14, n),
+        "adm_expense": ep * rng.uniform(0.05, 0.09, n),
+        "claims_count": cnt,
+        "exposure": expo,
+        "scr": scr,
+        "own_funds": scr * rng.uniform(1.25, 1.9, n),
+        "investment_income": gwp * rng.uniform(0.01, 0.03, n),
+    })
+    return pd.DataFrame(out)
+
+
+# =============================================================================
+# SINISTRES INDIVIDUELS
+# =============================================================================
+DEMO_PERILS = ["Wind", "Flood", "Quake", "Liability"]
+# Paramètres des sinistres par ligne de business : (moyenne et écart-type du log
+# de la sévérité, délai moyen de déclaration en jours, nombre moyen de paiements
+# au-delà du premier, délai moyen entre deux paiements en jours)
+CLAIM_LOB_PARAMS = {
+    "Property Cat": (9.6, 1.2, 30, 1.5, 90),
+    "Casualty": (9.2, 1.4, 240, 3.0, 270),
+    "Vie": (9.8, 0.5, 45, 0.2, 60),
+    "Santé": (7.2, 0.9, 20, 0.5, 30),
+}
+DEFAULT_CLAIM_PARAMS = (9.0, 1.0, 60, 1.0, 120)
+CLAIM_COLUMNS = [
+    "claim_id", "cedant", "lob", "peril", "region", "accident_date", "report_date",
+    "payment_date", "payment_seq", "severity", "paid_amount",
+]
+
+
+def _claims_chunk(rng, first_id: int, n: int, start, span_days: int, names: dict,
+                  params: np.ndarray) -> pd.DataFrame:
+    """Lignes de paiement de n sinistres ; chaque sinistre est réglé en un ou plusieurs paiements."""
+    codes = {dim: rng.integers(0, len(values), n).astype(np.int32) for dim, values in names.items()}
+    p = params[codes["lob"]]
+    severity = rng.lognormal(p[:, 0], p[:, 1])
+    accident = start + rng.integers(0, span_days, n).astype("timedelta64[D]")
+    report = accident + np.ceil(rng.exponential(p[:, 2])).astype("timedelta64[D]")
+
+    # Développement : k paiements par sinistre, à dates croissantes, qui soldent la sévérité
+    k = 1 + rng.poisson(p[:, 3])
+    claim = np.repeat(np.arange(n), k)
+    offsets = np.concatenate(([0], np.cumsum(k)[:-1]))
+    seq = np.arange(len(claim)) - offsets[claim]
+    gaps = np.ceil(rng.exponential(p[claim, 4]))
+    elapsed = np.cumsum(gaps)
+    elapsed -= (elapsed[offsets] - gaps[offsets])[claim]
+    weights = rng.exponential(1.0, len(claim))
+    share = weights / np.add.reduceat(weights, offsets)[claim]
+
+    out = {"claim_id": first_id + claim}
+    for dim, values in names.items():
+        out[dim] = pd.Categorical.from_codes(codes[dim][claim], values)
+    out.update({
+        "accident_date": accident[claim],
+        "report_date": report[claim],
+        "payment_date": report[claim] + elapsed.astype("timedelta64[D]"),
+        "payment_seq": seq.astype(np.int16),
+        "severity": severity[claim],
+        "paid_amount": severity[claim] * share,
+    })
+    return pd.DataFrame(out, columns=CLAIM_COLUMNS)
+
+
+def iter_claims(n_claims: int, seed: int = 42, start="2022-01-01", end="2025-12-31",
+                cedants=5, lobs=DEMO_LOBS, perils=DEMO_PERILS, regions=DEMO_REGIONS,
+                chunk_claims: int = 500_000, lob_params: dict = None):
+    """Sinistres individuels par blocs de `chunk_claims` sinistres (DataFrames de paiements).
+
+    Chaque bloc a son propre flux aléatoire dérivé de la graine : le résultat
+    est reproductible pour une graine et une taille de bloc données.
+    """
+    start = np.datetime64(pd.Timestamp(start).date(), "D")
+    span_days = int((np.datetime64(pd.Timestamp(end).date(), "D") - start).astype(int)) + 1
+    names = {"cedant": _names(cedants, "Cedant"), "lob": list(lobs),
+             "peril": list(perils), "region": list(regions)}
+    params = np.array([(lob_params or CLAIM_LOB_PARAMS).get(lob, DEFAULT_CLAIM_PARAMS) for lob in lobs],
+                      dtype=float)
+    firsts = range(0, n_claims, chunk_claims)
+    for first, child in zip(firsts, np.random.SeedSequence(seed).spawn(len(firsts))):
+        n = min(chunk_claims, n_claims - first)
+        yield _claims_chunk(np.random.default_rng(child), first, n, start, span_days, names, params)
+
+
+def write_claims(path: str, n_claims: int, chunk_claims: int = 500_000, **kwargs) -> int:
+    """Écrit les sinistres en Parquet bloc par bloc ; retourne le nombre de lignes de paiement.
+
+    Seul le bloc en cours est en mémoire. Le fichier est écrit sous un nom
+    temporaire puis renommé, de sorte qu'un lecteur ne voie jamais de fichier partiel.
+    """
+    tmp = f"{path}.tmp"
+    writer = None
+    rows = 0
+    try:
+        for chunk in iter_claims(n_claims, chunk_claims=chunk_claims, **kwargs):
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(tmp, table.schema)
+            writer.write_table(table)
+            rows += len(chunk)
+    finally:
+        if writer is not None:
+            writer.close()
+    os.replace(tmp, path)
+    return rows
+
+
+def claims_to_periods(path: str, freq: str = "Q", by=("cedant", "lob", "region"),
+                      batch_rows: int = 2_000_000) -> pd.DataFrame:
+    """Pont vers les colonnes par période : sinistres agrégés par période de survenance.
+
+    Colonnes produites : date (début de la période de survenance), dimensions
+    `by`, claims_count, incurred_claims (sévérités), paid_claims (paiements
+    effectués avant la fin de la période), ibnr (sinistres déclarés après la
+    fin de la période) et rbns (déclarés, non réglés). Le fichier est lu par lots.
+    """
+    by = list(by)
+    keys = ["date"] + by
+    columns = by + ["accident_date", "report_date", "payment_date", "payment_seq", "severity", "paid_amount"]
+    parts = []
+    for batch in pq.ParquetFile(path).iter_batches(batch_size=batch_rows, columns=columns):
+        df = batch.to_pandas()
+        # Période de survenance calculée sur les dates distinctes seulement
+        codes, days = pd.factorize(df["accident_date"])
+        periods = pd.DatetimeIndex(days).to_period(freq)
+        period_end = (periods + 1).to_timestamp().to_numpy()[codes]
+        first = df["payment_seq"].to_numpy() == 0
+        severity = np.where(first, df["severity"].to_numpy(), 0.0)
+        part = pd.DataFrame({
+            "date": periods.to_timestamp()[codes],
+            **{dim: df[dim] for dim in by},
+            "claims_count": first.astype(np.int64),
+            "incurred_claims": severity,
+            "paid_claims": np.where(df["payment_date"].to_numpy() < period_end, df["paid_amount"].to_numpy(), 0.0),
+            "ibnr": np.where(df["report_date"].to_numpy() >= period_end, severity, 0.0),
+        })
+        parts.append(part.groupby(keys, observed=True, sort=False).sum())
+    out = pd.concat(parts).groupby(level=keys, observed=True).sum().reset_index()
+    out["rbns"] = (out["incurred_claims"] - out["paid_claims"] - out["ibnr"]).clip(lower=0.0)
+    return out.sort_values(keys, ignore_index=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Génération d'un jeu de démonstration / de test de charge")
+    parser.add_argument("output", help="Fichier de sortie (.csv ou .parquet)")
+    parser.add_argument("--periods", type=int, default=16)
+    parser.add_argument("--freq", default="Q", help="Fréquence pandas des dates (Q, M...)")
+    parser.add_argument("--start", default="2022Q1")
+    parser.add_argument("--cedants", type=int, default=1, help="Nombre de cédantes")
+    parser.add_argument("--lobs", default=",".join(DEMO_LOBS), help="Lignes de business séparées par des virgules")
+    parser.add_argument("--regions", default=",".join(DEMO_REGIONS), help="Régions séparées par des virgules")
+    parser.add_argument("--perils", help="Périls séparés par des virgules (colonne absente par défaut)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--claims", type=int, help="Nombre de sinistres : écrit un Parquet de sinistres individuels "
+                                                   "couvrant les mêmes périodes")
+    parser.add_argument("--chunk", type=int, default=500_000, help="Sinistres générés par bloc")
+    args = parser.parse_args(argv)
+
+    if args.claims:
+        dates = pd.period_range(args.start, periods=args.periods, freq=args.freq)
+        rows = write_claims(
+            args.output, args.claims, args.chunk, seed=args.seed,
+            start=dates[0].start_time, end=dates[-1].end_time, cedants=args.cedants,
+            lobs=args.lobs.split(","), regions=args.regions.split(","),
+            perils=args.perils.split(",") if args.perils else DEMO_PERILS,
+        )
+        print(f"{args.claims:,} sinistres ({rows:,} paiements) écrits dans {args.output}", file=sys.stderr)
+        return 0
+
+    df = make_demo_data(
+        args.periods, args.seed, args.freq, args.start, cedants=args.cedants,
+        lobs=args.lobs.split(","), regions=args.regions.split(","),
+        perils=args.perils.split(",") if args.perils else None,
+    )
+    kpi_engine.export_table(df, args.output)
+    print(f"{len(df):,} lignes écrites dans {args.output}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
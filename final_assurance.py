@@ -12,6 +12,16 @@ import io
 import base64
 from statsmodels.tsa.statespace.sarimax import SARIMAX
 
+import column_mapping
+import dataset_store
+import demo_data
+import forecast_engine
+import hierarchy
+import ingestion
+import kpi_engine
+import kpi_parallel
+import parse_cache
+
 # Configuration de la page - DOIT ÊTRE LA PREMIÈRE COMMANDE STREAMLIT
 st.set_page_config(
     page_title="Plateforme de Réassurance - Théorie & Data Science",
@@ -61,119 +71,36 @@ class DataProcessor:
     
     @staticmethod
     def _infer_date_col(s: pd.Series) -> pd.Series:
-        """Tente de parser une colonne date."""
-        try:
-            parsed = pd.to_datetime(s, errors="coerce", dayfirst=True)
-            if parsed.notna().mean() > 0.6:
-                return parsed
-        except Exception:
-            pass
-        if s.dtype.kind in "if":
-            return pd.to_datetime(s.astype(int).astype(str) + "-01-01", errors="coerce")
-        return pd.to_datetime(s, errors="coerce")
+        """Tente de parser une colonne date (kpi_engine)."""
+        return kpi_engine.infer_date_col(s)
 
     @staticmethod
     def auto_map_columns(df: pd.DataFrame):
-        """Détecte automatiquement les correspondances colonnes utilisateur -> schéma."""
-        mapping = {}
-        cols_lower = {c.lower(): c for c in df.columns}
-        for key, aliases in SCHEMA.items():
-            found = None
-            for a in aliases:
-                if a in cols_lower:
-                    found = cols_lower[a]
-                    break
-            mapping[key] = found
-        return mapping
+        """Détecte automatiquement les correspondances colonnes utilisateur -> schéma (kpi_engine)."""
+        return kpi_engine.auto_map_columns(df)
 
     @staticmethod
     def compute_kpis(d: pd.DataFrame) -> pd.DataFrame:
-        """Calcule les ratios KPI techniques/financiers/risque."""
-        df = d.copy()
-        ep = df["earned_premium"].replace(0, np.nan)
-        gwp = df.get("gross_premium", pd.Series(np.nan, index=df.index))
-        ced = df.get("ceded_premium", pd.Series(0.0, index=df.index))
-
-        df["loss_ratio"] = df["incurred_claims"] / ep
-        df["acq_ratio"] = df.get("acq_expense", 0) / ep
-        df["adm_ratio"] = df.get("adm_expense", 0) / ep
-        df["expense_ratio"] = df["acq_ratio"].fillna(0) + df["adm_ratio"].fillna(0)
-        df["combined_ratio"] = df["loss_ratio"].fillna(0) + df["expense_ratio"].fillna(0)
-        df["operating_ratio"] = df["combined_ratio"] - (df.get("investment_income", 0) / ep)
-        df["cession_ratio"] = ced / gwp.replace(0, np.nan)
-        df["retention_ratio"] = (gwp - ced) / gwp.replace(0, np.nan)
-
-        if {"claims_count", "exposure"}.issubset(df.columns):
-            df["frequency"] = df["claims_count"] / df["exposure"].replace(0, np.nan)
-        if {"incurred_claims", "claims_count"}.issubset(df.columns):
-            df["severity"] = df["incurred_claims"] / df["claims_count"].replace(0, np.nan)
-
-        if {"ibnr", "rbns"}.issubset(df.columns):
-            df["total_reserves"] = df["ibnr"].fillna(0) + df["rbns"].fillna(0)
-            df["reserve_coverage"] = df["total_reserves"] / df["incurred_claims"].replace(0, np.nan)
-
-        if {"scr", "own_funds"}.issubset(df.columns):
-            df["solvency_ratio"] = df["own_funds"] / df["scr"].replace(0, np.nan)
-
-        return df
+        """Calcule les ratios KPI techniques/financiers/risque (noyau colonnaire kpi_engine)."""
+        return kpi_engine.compute_kpis(d)
 
     @staticmethod
-    def aggregate_kpis(d: pd.DataFrame, by=["date"]) -> pd.DataFrame:
-        """Agrège par dimensions et recalcule les KPI au niveau agrégé."""
-        grp = d.groupby(by, dropna=False).agg({
-            "gross_premium": "sum", "ceded_premium": "sum", "earned_premium": "sum",
-            "incurred_claims": "sum", "paid_claims": "sum", "ibnr": "sum", "rbns": "sum",
-            "acq_expense": "sum", "adm_expense": "sum", "investment_income": "sum",
-            "claims_count": "sum", "exposure": "sum", "scr": "sum", "own_funds": "sum"
-        }).reset_index()
-        grp = DataProcessor.compute_kpis(grp)
-        return grp
+    def aggregate_kpis(d: pd.DataFrame, by=["date"], kpis=None) -> pd.DataFrame:
+        """Agrège par dimensions et recalcule les KPI au niveau agrégé (groupes observés seulement)."""
+        return kpi_engine.aggregate_kpis(d, by=by, kpis=kpis)
 
     @staticmethod
     def add_month_start(df: pd.DataFrame) -> pd.DataFrame:
-        """Aligne les dates sur le début de mois."""
-        out = df.copy()
-        out["date"] = pd.to_datetime(out["date"], errors="coerce").dt.to_period("M").dt.to_timestamp()
-        return out
+        """Aligne les dates sur le début de mois (kpi_engine)."""
+        return kpi_engine.add_month_start(df)
 
 class DataGenerator:
     """Classe pour générer des données de démonstration"""
     
     @staticmethod
     def make_demo_data(periods=16, seed=42, freq="Q"):
-        """Jeu de données de démonstration."""
-        rng = np.random.default_rng(seed)
-        idx = pd.period_range("2022Q1", periods=periods, freq=freq).to_timestamp()
-        lobs = ["Property Cat", "Casualty", "Vie", "Santé"]
-        regions = ["EU", "NA", "Asia"]
-        rows = []
-        for dt in idx:
-            for lob in lobs:
-                for region in regions[:2]:
-                    gwp = rng.normal(50, 8) * 100000
-                    ced = gwp * rng.uniform(0.15, 0.45)
-                    ep = gwp * rng.uniform(0.75, 0.95)
-                    cnt = rng.poisson(110 if lob == "Property Cat" else 85)
-                    expo = rng.integers(900, 1600)
-                    sev = rng.lognormal(mean=9.35 if lob == "Property Cat" else 9.1, sigma=0.35)
-                    inc = float(cnt) * float(sev)
-                    paid = inc * rng.uniform(0.6, 0.9)
-                    ibnr = inc * rng.uniform(0.06, 0.18)
-                    rbns = inc * rng.uniform(0.05, 0.15)
-                    acq = ep * rng.uniform(0.08, 0.14)
-                    adm = ep * rng.uniform(0.05, 0.09)
-                    inv = gwp * rng.uniform(0.01, 0.03)
-                    scr = ep * rng.uniform(0.28, 0.42)
-                    own = scr * rng.uniform(1.25, 1.9)
-                    rows.append([
-                        dt, "CedantA", lob, region, gwp, ced, ep, inc, paid, ibnr, rbns,
-                        acq, adm, cnt, expo, scr, own, inv
-                    ])
-        return pd.DataFrame(rows, columns=[
-            "date", "cedant", "lob", "region", "gross_premium", "ceded_premium", "earned_premium",
-            "incurred_claims", "paid_claims", "ibnr", "rbns", "acq_expense", "adm_expense",
-            "claims_count", "exposure", "scr", "own_funds", "investment_income"
-        ])
+        """Jeu de données de démonstration (générateur vectorisé demo_data)."""
+        return demo_data.make_demo_data(periods, seed, freq)
 
 # =============================================================================
 # CLASSES DE PRÉVISION
@@ -183,22 +110,8 @@ class ForecastEngine:
     
     @staticmethod
     def sarimax_forecast(ts: pd.Series, steps: int, order=(1,1,1), seasonal=(0,1,1,4)) -> pd.Series:
-        """Prévision SARIMAX avec fallback naïf si historique insuffisant."""
-        ts = ts.astype(float).replace([np.inf, -np.inf], np.nan).dropna()
-        if ts.shape[0] < max(24, steps):
-            last = ts.iloc[-1] if ts.shape[0] else 0.0
-            idx = pd.date_range(datetime.today(), periods=steps, freq="MS")
-            return pd.Series([last] * steps, index=idx)
-        try:
-            model = SARIMAX(ts, order=order, seasonal_order=seasonal,
-                            enforce_stationarity=False, enforce_invertibility=False)
-            res = model.fit(disp=False)
-            fc = res.get_forecast(steps=steps).predicted_mean
-            return fc
-        except Exception:
-            last = ts.iloc[-1] if ts.shape[0] else 0.0
-            idx = pd.date_range(ts.index[-1] + pd.offsets.MonthBegin(1), periods=steps, freq="MS")
-            return pd.Series([last] * steps, index=idx)
+        """Prévision SARIMAX avec fallback naïf si historique insuffisant (forecast_engine, résultats en cache)."""
+        return forecast_engine.sarimax_forecast(ts, steps, order, seasonal, cache=forecast_engine.default_cache())
 
 # =============================================================================
 # CLASSES D'INTERFACE UTILISATEUR
@@ -2672,30 +2585,85 @@ def _page_analyse_data_science(self):
         use_demo_data = st.checkbox("Utiliser les données de démonstration", value=True)
         freq = st.selectbox("Fréquence des données", ["Trimestrielle", "Mensuelle", "Annuelle"], index=0)
         forecast_years = st.slider("Années de prévision", 1, 5, 3)
+        use_float32 = st.checkbox("Mesures en float32 (mémoire réduite)", value=False)
 
+    def prepare(frame, rename_dict):
+        """Renommage SCHEMA, validation, typage compact et normalisation des dates.
+        Retourne (données, (rapport de validation, rapport mémoire))"""
+        df = frame.rename(columns=rename_dict)
+        df["date"] = self.processor._infer_date_col(df["date"])  # CORRECTION: self.processor.
+        
+        # Validation vectorisée : mesures converties en numérique, anomalies signalées
+        df, validation = ingestion.validate_frame(df)
+        
+        # Typage compact : dimensions en catégories, mesures réduites
+        df_compact = ingestion.compact_dtypes(df, float32=use_float32)
+        mem_report = ingestion.memory_report(df, df_compact)
+        return self.processor.add_month_start(df_compact), (validation, mem_report)  # CORRECTION: self.processor.
+    
+    def show_load_reports(validation, mem_report):
+        """Sections validation et mémoire de la barre latérale, affichées à chaque rerun"""
+        if validation is not None and not validation.empty:
+            st.sidebar.warning(f"⚠️ {int(validation['nb_lignes'].sum()):,} anomalies détectées dans les données")
+            with st.sidebar.expander("Détail des anomalies"):
+                st.dataframe(validation)
+        if mem_report is not None:
+            st.sidebar.caption(
+                f"🧮 Mémoire : {mem_report.loc['TOTAL', 'mo_avant']:.1f} Mo → "
+                f"{mem_report.loc['TOTAL', 'mo_apres']:.1f} Mo"
+            )
+            with st.sidebar.expander("Détail de l'empreinte mémoire"):
+                st.dataframe(mem_report.round(2))
+    
     # Préparation des données
+    store = dataset_store.ParquetDatasetStore()
+    cache = parse_cache.session_cache(st.session_state)
     if use_demo_data:
         df_raw = self.generator.make_demo_data(periods=16, freq="Q" if freq == "Trimestrielle" else "M")  # CORRECTION: self.generator.
+        header = list(df_raw.columns)
         mapping = self.processor.auto_map_columns(df_raw)  # CORRECTION: self.processor.
     elif uploaded_file is not None:
-        if uploaded_file.name.endswith('.csv'):
-            df_raw = pd.read_csv(uploaded_file)
-        else:
-            df_raw = pd.read_excel(uploaded_file)
-        mapping = self.processor.auto_map_columns(df_raw)  # CORRECTION: self.processor.
+        # Le fichier n'est parsé qu'au premier chargement : ensuite seul son en-tête est relu
+        raw_key = cache.fingerprint(uploaded_file)
+        header = store.header(raw_key)
+        if header is None:
+            df_raw = parse_cache.read_upload(uploaded_file, cache)
+            header = list(df_raw.columns)
+            if "load_report" in df_raw.attrs:
+                total = df_raw.attrs["load_report"].loc["TOTAL"]
+                st.sidebar.caption(
+                    f"📑 {len(df_raw.attrs['load_report']) - 1} feuilles, {int(total['lignes']):,} lignes "
+                    f"en {total['secondes']:.1f} s (pic {total['pic_mo']:.0f} Mo)"
+                )
+            store.save_header(raw_key, header)
+        # Profil enregistré pour cette structure de fichier, sinon correspondance approchée
+        profiles = column_mapping.MappingProfileStore()
+        mapping, known_layout = column_mapping.suggest_mapping(header, profiles)
         
         # Interface de mapping manuel
         st.sidebar.subheader("🎯 Mapping des Colonnes")
+        if known_layout:
+            st.sidebar.caption("✅ Structure de fichier reconnue : mapping du profil enregistré")
+        suggested = dict(mapping)
         for key in REQUIRED_BASE:
-            available_cols = [None] + list(df_raw.columns)
+            available_cols = [None] + header
             default_idx = 0
-            if mapping.get(key) in df_raw.columns:
-                default_idx = list(df_raw.columns).index(mapping[key]) + 1
+            if mapping.get(key) in header:
+                default_idx = header.index(mapping[key]) + 1
             mapping[key] = st.sidebar.selectbox(
                 f"Colonne pour {key}", 
                 available_cols,
                 index=default_idx
             )
+        # Profil enregistré seulement si le mapping est corrigé ou explicitement confirmé, et
+        # seulement pour les colonnes affichées : les correspondances approchées des autres
+        # colonnes, jamais revues, restent de simples propositions
+        edited = any(mapping[key] != suggested.get(key) for key in REQUIRED_BASE)
+        confirmed = not known_layout and st.sidebar.button("💾 Enregistrer ce mapping pour ce format de fichier")
+        if edited or confirmed:
+            fingerprint = column_mapping.header_fingerprint(header)
+            reviewed = {key: mapping[key] for key in REQUIRED_BASE}
+            profiles.save(fingerprint, dict(profiles.load(fingerprint) or {}, **reviewed))
     else:
         st.info("📊 Veuillez importer un fichier ou utiliser les données de démonstration")
         st.stop()
@@ -2703,13 +2671,53 @@ def _page_analyse_data_science(self):
     # Application du mapping
     if mapping:
         rename_dict = {v: k for k, v in mapping.items() if v is not None}
-        df = df_raw.rename(columns=rename_dict)
-        df["date"] = self.processor._infer_date_col(df["date"])  # CORRECTION: self.processor.
-        df = self.processor.add_month_start(df)  # CORRECTION: self.processor.
+        if use_demo_data:
+            df, load_reports = prepare(df_raw, rename_dict)
+            show_load_reports(*load_reports)
+            dataset_key = ("demo", freq, use_float32)
+        else:
+            # Dataset Parquet partitionné (date, lob), partagé entre sessions
+            data_key = dataset_store.content_fingerprint(
+                raw_key.encode("utf-8"), {"mapping": rename_dict, "float32": use_float32}
+            )
+            # Colonnes memory-mappées : ouverture quasi instantanée après un redémarrage
+            mapped = dataset_store.MmapColumnStore()
+            if not mapped.exists(data_key):
+                if store.exists(data_key):
+                    prepared = store.read(data_key, columns=dataset_store.KPI_PAGE_COLUMNS)
+                    meta = {"load_reports": store.metadata(data_key).get("load_reports")}
+                else:
+                    df_raw = parse_cache.read_upload(uploaded_file, cache)
+                    prepared, load_reports = prepare(df_raw, rename_dict)
+                    meta = ingestion.reports_to_meta(*load_reports)
+                    store.write(prepared, data_key, meta)
+                mapped.write(prepared[[c for c in dataset_store.KPI_PAGE_COLUMNS if c in prepared.columns]],
+                             data_key, meta)
+            # Rapports enregistrés avec le dataset : la barre latérale reste complète à chaque rerun
+            show_load_reports(*ingestion.reports_from_meta(mapped.metadata(data_key)))
+            
+            # Filtre sur les lignes de business, appliqué à l'ouverture des colonnes
+            lobs = mapped.categories(data_key, "lob")
+            selected_lobs = st.sidebar.multiselect("Lignes de business", lobs, default=lobs) if lobs else []
+            lob_filter = {"lob": selected_lobs} if lobs and len(selected_lobs) < len(lobs) else None
+            if lob_filter is None:
+                # Sans filtre, les mesures restent adossées aux fichiers partagés
+                df = mapped.read(data_key)
+            else:
+                # Sélection gardée dans le cache de session : un rerun ne refiltre pas
+                read_key = dataset_store.content_fingerprint(data_key.encode("utf-8"), {"lobs": selected_lobs})
+                df = cache.get_or_create(read_key, lambda: mapped.read(data_key, filters=lob_filter))
+            dataset_key = (data_key, tuple(selected_lobs))
         df_kpi = self.processor.compute_kpis(df)  # CORRECTION: self.processor.
     
+    # Cube de mesures agrégées, construit une seule fois par jeu de données
+    if st.session_state.get("kpi_cube_key") != dataset_key:
+        st.session_state["kpi_cube"] = kpi_parallel.build_cube(df_kpi)
+        st.session_state["kpi_cube_key"] = dataset_key
+    cube = st.session_state["kpi_cube"]
+    
     # Métriques principales
-    agg_global = self.processor.aggregate_kpis(df_kpi, by=["date"]).sort_values("date")  # CORRECTION: self.processor.
+    agg_global = cube.rollup(["date"], kpis=["loss_ratio", "combined_ratio", "solvency_ratio"]).sort_values("date")
     if not agg_global.empty:
         last_row = agg_global.iloc[-1]
         
@@ -2738,7 +2746,9 @@ def _page_analyse_data_science(self):
         selected_dims = st.multiselect("Regrouper par", dimensions, default=dimensions[:1] if dimensions else [])
         
         if selected_dims:
-            grouped_data = self.processor.aggregate_kpis(df_kpi, by=["date"] + selected_dims)  # CORRECTION: self.processor.
+            grouped_data = cube.rollup(["date"] + selected_dims)
+            # Ratios glissants 12 mois (4 trimestres) et variations sur un an par groupe
+            grouped_data = kpi_engine.window_kpis(grouped_data, selected_dims)
             
             # Sélecteur de KPI
             kpi_options = {
@@ -2746,7 +2756,11 @@ def _page_analyse_data_science(self):
                 "Expense Ratio": "expense_ratio", 
                 "Combined Ratio": "combined_ratio",
                 "Operating Ratio": "operating_ratio",
-                "Cession Ratio": "cession_ratio"
+                "Cession Ratio": "cession_ratio",
+                "Loss Ratio glissant 12 mois": "loss_ratio_12m",
+                "Combined Ratio glissant 12 mois": "combined_ratio_12m",
+                "Δ Loss Ratio sur 1 an": "loss_ratio_yoy",
+                "Δ Combined Ratio sur 1 an": "combined_ratio_yoy"
             }
             selected_kpi = st.selectbox("KPI à analyser", list(kpi_options.keys()))
             kpi_column = kpi_options[selected_kpi]
@@ -2773,23 +2787,58 @@ def _page_analyse_data_science(self):
         forecast_dim = st.selectbox("Dimension de prévision", 
                                    ["Global"] + [d for d in ["lob", "region"] if d in df_kpi.columns])
         
-        def generate_forecast(data_subset, target, steps):
-            """Génère les prévisions pour un sous-ensemble de données"""
-            aggregated = self.processor.aggregate_kpis(data_subset, by=["date"]).sort_values("date")  # CORRECTION: self.processor.
+        order_mode = st.radio("Ordre SARIMAX", ["Fixe", "Automatique (AIC)", "Automatique (BIC)"], horizontal=True)
+        season = forecast_engine.season_length(freq)
+        confidence_level = st.slider("Niveau de confiance (%)", 80, 95, 90)
+        
+        # Seul le KPI prévu est calculé (aucun si la cible est une mesure)
+        target_kpis = [target_var] if target_var in kpi_engine.KPI_REGISTRY else []
+        
+        # Réconciliation réservée aux mesures additives (un ratio ne se somme pas)
+        hierarchy_dims = [d for d in ["lob", "region"] if d in df_kpi.columns]
+        reconcile_label = "Aucune"
+        if not target_kpis and hierarchy_dims:
+            reconcile_label = st.selectbox("Réconciliation hiérarchique",
+                                           ["Aucune", "Bottom-up", "Top-down", "MinT"])
+        
+        def choose_orders(series):
+            """Ordres SARIMAX par série : fixes selon la fréquence, ou sélectionnés par AIC/BIC"""
+            if order_mode == "Fixe":
+                return {k: forecast_engine.default_orders(season) for k in series}
+            # Choix mis en cache par jeu de données, dimension et cible : les reruns sautent la recherche
+            orders, report = forecast_engine.select_orders(
+                series, season, "bic" if "BIC" in order_mode else "aic",
+                cache=forecast_engine.default_cache(),
+                namespace=f"{dataset_key}:{forecast_dim}:{target_var}",
+            )
+            with st.expander("🔎 Modèles retenus"):
+                st.dataframe(report)
+            return orders
+        
+        def forecast_steps(years):
+            """Nombre de pas selon la fréquence"""
+            if freq == "Trimestrielle":
+                return 4 * years
+            elif freq == "Mensuelle":
+                return 12 * years
+            return years  # Annuelle
+        
+        def generate_forecast(filters, target, steps):
+            """Génère les prévisions et leurs bandes pour un sous-ensemble de données ({dimension: valeur})"""
+            aggregated = cube.rollup(["date"], filters=filters, kpis=target_kpis).sort_values("date")
             if aggregated.empty:
-                return pd.DataFrame()
+                return pd.DataFrame(), None
                 
             ts_data = aggregated.set_index("date")[target]
+            ts_order, ts_seasonal = choose_orders({"Global": ts_data})["Global"]
+            forecast = self.forecaster.sarimax_forecast(ts_data, forecast_steps(steps), ts_order, ts_seasonal)  # CORRECTION: self.forecaster.
             
-            # Déterminer le nombre de pas selon la fréquence
-            if freq == "Trimestrielle":
-                steps_calc = 4 * steps
-            elif freq == "Mensuelle":
-                steps_calc = 12 * steps
-            else:  # Annuelle
-                steps_calc = steps
-                
-            forecast = self.forecaster.sarimax_forecast(ts_data, steps_calc)  # CORRECTION: self.forecaster.
+            # Éventail : trajectoires du modèle ajusté pour la prévision (même série, mêmes ordres,
+            # paramètres et tirage repris du cache), donc centré sur la courbe prévue
+            paths = forecast_engine.simulate_paths(ts_data, forecast_steps(steps), order=ts_order,
+                                                   seasonal=ts_seasonal, seed=42,
+                                                   cache=forecast_engine.default_cache())
+            bands = forecast_engine.fan_bands(paths, (50, confidence_level))
             
             # Préparation des résultats
             historical = pd.DataFrame({
@@ -2804,23 +2853,57 @@ def _page_analyse_data_science(self):
                 'type': 'Prévision'
             })
             
-            return pd.concat([historical, future], ignore_index=True)
-        
-        if forecast_dim == "Global":
-            forecast_data = generate_forecast(df_kpi, target_var, forecast_years)
+            return pd.concat([historical, future], ignore_index=True), bands
+        
+        def reconciled_forecasts():
+            """Prévisions de tous les nœuds (Total, dimensions, croisements), rendues cohérentes"""
+            leaves = cube.rollup(["date"] + hierarchy_dims, kpis=[])
+            history, S, nodes = hierarchy.hierarchy_series(leaves, hierarchy_dims, target_var)
+            series = {i: history[i].rename(target_var) for i in history.columns}
+            base = forecast_engine.batch_forecast(series, forecast_steps(forecast_years),
+                                                  cache=forecast_engine.default_cache(),
+                                                  orders=choose_orders(series))
+            method = {"Bottom-up": "bottom_up", "Top-down": "top_down", "MinT": "mint"}[reconcile_label]
+            variances = hierarchy.residual_variances(history, season) if method == "mint" else None
+            return history, nodes, hierarchy.reconcile_forecasts(base, history, S, method, variances)
+        
+        if reconcile_label != "Aucune":
+            # Les prévisions affichées s'additionnent d'un niveau à l'autre
+            history, nodes, reconciled = reconciled_forecasts()
+            level = hierarchy.TOTAL if forecast_dim == "Global" else forecast_dim
+            ids = nodes.index[nodes["niveau"] == level]
+            labels = nodes["noeud"]
+            forecast_all = forecast_engine.forecast_frame({labels[i]: reconciled[i] for i in ids},
+                                                          {labels[i]: history[i] for i in ids}, key=forecast_dim)
+            for val, forecast_data in forecast_all.groupby(forecast_dim, sort=False):
+                fig_forecast = px.line(forecast_data, x='date', y='value', color='type',
+                                     title=f"Prévision {target_var} - {val} (réconciliée : {reconcile_label})")
+                st.plotly_chart(fig_forecast, use_container_width=True)
+        elif forecast_dim == "Global":
+            forecast_data, bands = generate_forecast(None, target_var, forecast_years)
             if not forecast_data.empty:
                 fig_forecast = px.line(forecast_data, x='date', y='value', color='type',
-                                     title=f"Prévision {target_var} - Global")
+                                     title=f"Prévision {target_var} - Global "
+                                           f"(bandes 50 % et {confidence_level} %, {forecast_engine.N_PATHS:,} trajectoires)")
+                dates = list(bands["date"])
+                for level, opacity in ((confidence_level, 0.15), (50, 0.3)):
+                    fig_forecast.add_trace(go.Scatter(x=dates + dates[::-1],
+                                                      y=list(bands[f"upper_{level}"]) + list(bands[f"lower_{level}"])[::-1],
+                                                      fill="toself", fillcolor=f"rgba(255, 127, 14, {opacity})",
+                                                      line=dict(width=0), hoverinfo="skip", name=f"IC {level} %"))
                 st.plotly_chart(fig_forecast, use_container_width=True)  # CORRECTION: use_container_width=True
         else:
-            unique_vals = df_kpi[forecast_dim].dropna().unique()
-            for val in unique_vals:
-                subset = df_kpi[df_kpi[forecast_dim] == val]
-                forecast_data = generate_forecast(subset, target_var, forecast_years)
-                if not forecast_data.empty:
-                    fig_forecast = px.line(forecast_data, x='date', y='value', color='type',
-                                         title=f"Prévision {target_var} - {forecast_dim}: {val}")
-                    st.plotly_chart(fig_forecast, use_container_width=True)  # CORRECTION: use_container_width=True
+            # Tous les segments agrégés en une fois, puis ajustés en parallèle
+            segments = cube.rollup(["date", forecast_dim], kpis=target_kpis)
+            series = forecast_engine.segment_series(segments, forecast_dim, target_var)
+            forecasts = forecast_engine.batch_forecast(series, forecast_steps(forecast_years),
+                                                       cache=forecast_engine.default_cache(),
+                                                       orders=choose_orders(series))
+            forecast_all = forecast_engine.forecast_frame(forecasts, series, key=forecast_dim)
+            for val, forecast_data in forecast_all.groupby(forecast_dim, sort=False):
+                fig_forecast = px.line(forecast_data, x='date', y='value', color='type',
+                                     title=f"Prévision {target_var} - {forecast_dim}: {val}")
+                st.plotly_chart(fig_forecast, use_container_width=True)  # CORRECTION: use_container_width=True
     
     with tab3:
         st.subheader("🧪 Tests de Résistance (Stress Tests)")
@@ -2847,8 +2930,8 @@ def _page_analyse_data_science(self):
         df_stress.loc[cat_mask, "incurred_claims"] = df_stress.loc[cat_mask, "incurred_claims"] * cat_event
         
         # Comparaison baseline vs stress
-        base_kpi = self.processor.aggregate_kpis(df_kpi, by=["date"])  # CORRECTION: self.processor.
-        stress_kpi = self.processor.aggregate_kpis(df_stress, by=["date"])  # CORRECTION: self.processor.
+        base_kpi = cube.rollup(["date"], kpis=["combined_ratio"])
+        stress_kpi = self.processor.aggregate_kpis(df_stress, by=["date"], kpis=["combined_ratio"])  # CORRECTION: self.processor.
         
         col1, col2 = st.columns(2)
         with col1:
@@ -2874,21 +2957,22 @@ def _page_analyse_data_science(self):
         
         # Répartition par LOB
         if "lob" in df_kpi.columns:
-            lob_analysis = self.processor.aggregate_kpis(df_kpi, by=["lob"])  # CORRECTION: self.processor.
+            lob_analysis = cube.rollup(["lob"], kpis=[])
             fig_lob = px.pie(lob_analysis, values="earned_premium", names="lob",
                            title="Répartition des Primes par Ligne de Business")
             st.plotly_chart(fig_lob, use_container_width=True)  # CORRECTION: use_container_width=True
         
         # Répartition géographique
         if "region" in df_kpi.columns:
-            region_analysis = self.processor.aggregate_kpis(df_kpi, by=["region"])  # CORRECTION: self.processor.
+            region_analysis = cube.rollup(["region"], kpis=[])
             fig_region = px.bar(region_analysis, x="region", y="earned_premium",
                               title="Primes par Région")
             st.plotly_chart(fig_region, use_container_width=True)  # CORRECTION: use_container_width=True
         
         # Analyse fréquence vs sévérité
         if {"frequency", "severity"}.issubset(df_kpi.columns):
-            freq_sev_analysis = self.processor.aggregate_kpis(df_kpi, by=["lob"] if "lob" in df_kpi.columns else ["region"])  # CORRECTION: self.processor.
+            freq_sev_analysis = cube.rollup(["lob"] if "lob" in df_kpi.columns else ["region"],
+                                            kpis=["frequency", "severity"])
             fig_scatter = px.scatter(freq_sev_analysis, x="frequency", y="severity",
                                    size="earned_premium", hover_name=freq_sev_analysis.index,
                                    title="Fréquence vs Sévérité par Segment")
@@ -2897,12 +2981,23 @@ def _page_analyse_data_science(self):
     with tab5:
         st.subheader("📤 Export des Données et Rapports")
         
-        # Export CSV
+        # Export CSV : toutes les colonnes du fichier, pas seulement celles des pages KPI
+        if use_demo_data:
+            df_export = df_kpi
+        else:
+            def load_export():
+                if not store.exists(data_key):
+                    # Dataset Parquet évincé : reconstruit depuis le fichier importé
+                    prepared, load_reports = prepare(parse_cache.read_upload(uploaded_file, cache), rename_dict)
+                    store.write(prepared, data_key, ingestion.reports_to_meta(*load_reports))
+                return self.processor.compute_kpis(store.read(data_key, filters=lob_filter))  # CORRECTION: self.processor.
+            export_key = dataset_store.content_fingerprint(data_key.encode("utf-8"), {"export": selected_lobs})
+            df_export = cache.get_or_create(export_key, load_export)
         st.markdown("### 📊 Données Brutes avec KPI")
-        st.dataframe(df_kpi.head(100))
+        st.dataframe(df_export.head(100))
         
         # CORRECTION: Implémentation du bouton de téléchargement
-        csv_data = df_kpi.to_csv(index=False)
+        csv_data = df_export.to_csv(index=False)
         st.download_button(
             label="📥 Télécharger les données KPI (CSV)",
             data=csv_data,
@@ -2912,7 +3007,7 @@ def _page_analyse_data_science(self):
         
         # Export agrégé
         st.markdown("### 📈 Données Agrégées")
-        aggregated_data = self.processor.aggregate_kpis(df_kpi, by=["date"])  # CORRECTION: self.processor.
+        aggregated_data = cube.rollup(["date"])
         st.dataframe(aggregated_data)
         
         # CORRECTION: Implémentation du bouton de téléchargement agrégé
@@ -3208,30 +3303,85 @@ def _page_analyse_data_science(self):
         use_demo_data = st.checkbox("Utiliser les données de démonstration", value=True)
         freq = st.selectbox("Fréquence des données", ["Trimestrielle", "Mensuelle", "Annuelle"], index=0)
         forecast_years = st.slider("Années de prévision", 1, 5, 3)
+        use_float32 = st.checkbox("Mesures en float32 (mémoire réduite)", value=False)
 
+    def prepare(frame, rename_dict):
+        """Renommage SCHEMA, validation, typage compact et normalisation des dates.
+        Retourne (données, (rapport de validation, rapport mémoire))"""
+        df = frame.rename(columns=rename_dict)
+        df["date"] = self.processor._infer_date_col(df["date"])  # CORRECTION: self.processor.
+        
+        # Validation vectorisée : mesures converties en numérique, anomalies signalées
+        df, validation = ingestion.validate_frame(df)
+        
+        # Typage compact : dimensions en catégories, mesures réduites
+        df_compact = ingestion.compact_dtypes(df, float32=use_float32)
+        mem_report = ingestion.memory_report(df, df_compact)
+        return self.processor.add_month_start(df_compact), (validation, mem_report)  # CORRECTION: self.processor.
+    
+    def show_load_reports(validation, mem_report):
+        """Sections validation et mémoire de la barre latérale, affichées à chaque rerun"""
+        if validation is not None and not validation.empty:
+            st.sidebar.warning(f"⚠️ {int(validation['nb_lignes'].sum()):,} anomalies détectées dans les données")
+            with st.sidebar.expander("Détail des anomalies"):
+                st.dataframe(validation)
+        if mem_report is not None:
+            st.sidebar.caption(
+                f"🧮 Mémoire : {mem_report.loc['TOTAL', 'mo_avant']:.1f} Mo → "
+                f"{mem_report.loc['TOTAL', 'mo_apres']:.1f} Mo"
+            )
+            with st.sidebar.expander("Détail de l'empreinte mémoire"):
+                st.dataframe(mem_report.round(2))
+    
     # Préparation des données
+    store = dataset_store.ParquetDatasetStore()
+    cache = parse_cache.session_cache(st.session_state)
     if use_demo_data:
         df_raw = self.generator.make_demo_data(periods=16, freq="Q" if freq == "Trimestrielle" else "M")  # CORRECTION: self.generator.
+        header = list(df_raw.columns)
         mapping = self.processor.auto_map_columns(df_raw)  # CORRECTION: self.processor.
     elif uploaded_file is not None:
-        if uploaded_file.name.endswith('.csv'):
-            df_raw = pd.read_csv(uploaded_file)
-        else:
-            df_raw = pd.read_excel(uploaded_file)
-        mapping = self.processor.auto_map_columns(df_raw)  # CORRECTION: self.processor.
+        # Le fichier n'est parsé qu'au premier chargement : ensuite seul son en-tête est relu
+        raw_key = cache.fingerprint(uploaded_file)
+        header = store.header(raw_key)
+        if header is None:
+            df_raw = parse_cache.read_upload(uploaded_file, cache)
+            header = list(df_raw.columns)
+            if "load_report" in df_raw.attrs:
+                total = df_raw.attrs["load_report"].loc["TOTAL"]
+                st.sidebar.caption(
+                    f"📑 {len(df_raw.attrs['load_report']) - 1} feuilles, {int(total['lignes']):,} lignes "
+                    f"en {total['secondes']:.1f} s (pic {total['pic_mo']:.0f} Mo)"
+                )
+            store.save_header(raw_key, header)
+        # Profil enregistré pour cette structure de fichier, sinon correspondance approchée
+        profiles = column_mapping.MappingProfileStore()
+        mapping, known_layout = column_mapping.suggest_mapping(header, profiles)
         
         # Interface de mapping manuel
         st.sidebar.subheader("🎯 Mapping des Colonnes")
+        if known_layout:
+            st.sidebar.caption("✅ Structure de fichier reconnue : mapping du profil enregistré")
+        suggested = dict(mapping)
         for key in REQUIRED_BASE:
-            available_cols = [None] + list(df_raw.columns)
+            available_cols = [None] + header
             default_idx = 0
-            if mapping.get(key) in df_raw.columns:
-                default_idx = list(df_raw.columns).index(mapping[key]) + 1
+            if mapping.get(key) in header:
+                default_idx = header.index(mapping[key]) + 1
             mapping[key] = st.sidebar.selectbox(
                 f"Colonne pour {key}", 
                 available_cols,
                 index=default_idx
             )
+        # Profil enregistré seulement si le mapping est corrigé ou explicitement confirmé, et
+        # seulement pour les colonnes affichées : les correspondances approchées des autres
+        # colonnes, jamais revues, restent de simples propositions
+        edited = any(mapping[key] != suggested.get(key) for key in REQUIRED_BASE)
+        confirmed = not known_layout and st.sidebar.button("💾 Enregistrer ce mapping pour ce format de fichier")
+        if edited or confirmed:
+            fingerprint = column_mapping.header_fingerprint(header)
+            reviewed = {key: mapping[key] for key in REQUIRED_BASE}
+            profiles.save(fingerprint, dict(profiles.load(fingerprint) or {}, **reviewed))
     else:
         st.info("📊 Veuillez importer un fichier ou utiliser les données de démonstration")
         st.stop()
@@ -3239,13 +3389,53 @@ def _page_analyse_data_science(self):
     # Application du mapping
     if mapping:
         rename_dict = {v: k for k, v in mapping.items() if v is not None}
-        df = df_raw.rename(columns=rename_dict)
-        df["date"] = self.processor._infer_date_col(df["date"])  # CORRECTION: self.processor.
-        df = self.processor.add_month_start(df)  # CORRECTION: self.processor.
+        if use_demo_data:
+            df, load_reports = prepare(df_raw, rename_dict)
+            show_load_reports(*load_reports)
+            dataset_key = ("demo", freq, use_float32)
+        else:
+            # Dataset Parquet partitionné (date, lob), partagé entre sessions
+            data_key = dataset_store.content_fingerprint(
+                raw_key.encode("utf-8"), {"mapping": rename_dict, "float32": use_float32}
+            )
+            # Colonnes memory-mappées : ouverture quasi instantanée après un redémarrage
+            mapped = dataset_store.MmapColumnStore()
+            if not mapped.exists(data_key):
+                if store.exists(data_key):
+                    prepared = store.read(data_key, columns=dataset_store.KPI_PAGE_COLUMNS)
+                    meta = {"load_reports": store.metadata(data_key).get("load_reports")}
+                else:
+                    df_raw = parse_cache.read_upload(uploaded_file, cache)
+                    prepared, load_reports = prepare(df_raw, rename_dict)
+                    meta = ingestion.reports_to_meta(*load_reports)
+                    store.write(prepared, data_key, meta)
+                mapped.write(prepared[[c for c in dataset_store.KPI_PAGE_COLUMNS if c in prepared.columns]],
+                             data_key, meta)
+            # Rapports enregistrés avec le dataset : la barre latérale reste complète à chaque rerun
+            show_load_reports(*ingestion.reports_from_meta(mapped.metadata(data_key)))
+            
+            # Filtre sur les lignes de business, appliqué à l'ouverture des colonnes
+            lobs = mapped.categories(data_key, "lob")
+            selected_lobs = st.sidebar.multiselect("Lignes de business", lobs, default=lobs) if lobs else []
+            lob_filter = {"lob": selected_lobs} if lobs and len(selected_lobs) < len(lobs) else None
+            if lob_filter is None:
+                # Sans filtre, les mesures restent adossées aux fichiers partagés
+                df = mapped.read(data_key)
+            else:
+                # Sélection gardée dans le cache de session : un rerun ne refiltre pas
+                read_key = dataset_store.content_fingerprint(data_key.encode("utf-8"), {"lobs": selected_lobs})
+                df = cache.get_or_create(read_key, lambda: mapped.read(data_key, filters=lob_filter))
+            dataset_key = (data_key, tuple(selected_lobs))
         df_kpi = self.processor.compute_kpis(df)  # CORRECTION: self.processor.
     
+    # Cube de mesures agrégées, construit une seule fois par jeu de données
+    if st.session_state.get("kpi_cube_key") != dataset_key:
+        st.session_state["kpi_cube"] = kpi_parallel.build_cube(df_kpi)
+        st.session_state["kpi_cube_key"] = dataset_key
+    cube = st.session_state["kpi_cube"]
+    
     # Métriques principales
-    agg_global = self.processor.aggregate_kpis(df_kpi, by=["date"]).sort_values("date")  # CORRECTION: self.processor.
+    agg_global = cube.rollup(["date"], kpis=["loss_ratio", "combined_ratio", "solvency_ratio"]).sort_values("date")
     if not agg_global.empty:
         last_row = agg_global.iloc[-1]
         
@@ -3274,7 +3464,9 @@ def _page_analyse_data_science(self):
         selected_dims = st.multiselect("Regrouper par", dimensions, default=dimensions[:1] if dimensions else [])
         
         if selected_dims:
-            grouped_data = self.processor.aggregate_kpis(df_kpi, by=["date"] + selected_dims)  # CORRECTION: self.processor.
+            grouped_data = cube.rollup(["date"] + selected_dims)
+            # Ratios glissants 12 mois (4 trimestres) et variations sur un an par groupe
+            grouped_data = kpi_engine.window_kpis(grouped_data, selected_dims)
             
             # Sélecteur de KPI
             kpi_options = {
@@ -3282,7 +3474,11 @@ def _page_analyse_data_science(self):
                 "Expense Ratio": "expense_ratio", 
                 "Combined Ratio": "combined_ratio",
                 "Operating Ratio": "operating_ratio",
-                "Cession Ratio": "cession_ratio"
+                "Cession Ratio": "cession_ratio",
+                "Loss Ratio glissant 12 mois": "loss_ratio_12m",
+                "Combined Ratio glissant 12 mois": "combined_ratio_12m",
+                "Δ Loss Ratio sur 1 an": "loss_ratio_yoy",
+                "Δ Combined Ratio sur 1 an": "combined_ratio_yoy"
             }
             selected_kpi = st.selectbox("KPI à analyser", list(kpi_options.keys()))
             kpi_column = kpi_options[selected_kpi]
@@ -3309,23 +3505,58 @@ def _page_analyse_data_science(self):
         forecast_dim = st.selectbox("Dimension de prévision", 
                                    ["Global"] + [d for d in ["lob", "region"] if d in df_kpi.columns])
         
-        def generate_forecast(data_subset, target, steps):
-            """Génère les prévisions pour un sous-ensemble de données"""
-            aggregated = self.processor.aggregate_kpis(data_subset, by=["date"]).sort_values("date")  # CORRECTION: self.processor.
+        order_mode = st.radio("Ordre SARIMAX", ["Fixe", "Automatique (AIC)", "Automatique (BIC)"], horizontal=True)
+        season = forecast_engine.season_length(freq)
+        confidence_level = st.slider("Niveau de confiance (%)", 80, 95, 90)
+        
+        # Seul le KPI prévu est calculé (aucun si la cible est une mesure)
+        target_kpis = [target_var] if target_var in kpi_engine.KPI_REGISTRY else []
+        
+        # Réconciliation réservée aux mesures additives (un ratio ne se somme pas)
+        hierarchy_dims = [d for d in ["lob", "region"] if d in df_kpi.columns]
+        reconcile_label = "Aucune"
+        if not target_kpis and hierarchy_dims:
+            reconcile_label = st.selectbox("Réconciliation hiérarchique",
+                                           ["Aucune", "Bottom-up", "Top-down", "MinT"])
+        
+        def choose_orders(series):
+            """Ordres SARIMAX par série : fixes selon la fréquence, ou sélectionnés par AIC/BIC"""
+            if order_mode == "Fixe":
+                return {k: forecast_engine.default_orders(season) for k in series}
+            # Choix mis en cache par jeu de données, dimension et cible : les reruns sautent la recherche
+            orders, report = forecast_engine.select_orders(
+                series, season, "bic" if "BIC" in order_mode else "aic",
+                cache=forecast_engine.default_cache(),
+                namespace=f"{dataset_key}:{forecast_dim}:{target_var}",
+            )
+            with st.expander("🔎 Modèles retenus"):
+                st.dataframe(report)
+            return orders
+        
+        def forecast_steps(years):
+            """Nombre de pas selon la fréquence"""
+            if freq == "Trimestrielle":
+                return 4 * years
+            elif freq == "Mensuelle":
+                return 12 * years
+            return years  # Annuelle
+        
+        def generate_forecast(filters, target, steps):
+            """Génère les prévisions et leurs bandes pour un sous-ensemble de données ({dimension: valeur})"""
+            aggregated = cube.rollup(["date"], filters=filters, kpis=target_kpis).sort_values("date")
             if aggregated.empty:
-                return pd.DataFrame()
+                return pd.DataFrame(), None
                 
             ts_data = aggregated.set_index("date")[target]
+            ts_order, ts_seasonal = choose_orders({"Global": ts_data})["Global"]
+            forecast = self.forecaster.sarimax_forecast(ts_data, forecast_steps(steps), ts_order, ts_seasonal)  # CORRECTION: self.forecaster.
             
-            # Déterminer le nombre de pas selon la fréquence
-            if freq == "Trimestrielle":
-                steps_calc = 4 * steps
-            elif freq == "Mensuelle":
-                steps_calc = 12 * steps
-            else:  # Annuelle
-                steps_calc = steps
-                
-            forecast = self.forecaster.sarimax_forecast(ts_data, steps_calc)  # CORRECTION: self.forecaster.
+            # Éventail : trajectoires du modèle ajusté pour la prévision (même série, mêmes ordres,
+            # paramètres et tirage repris du cache), donc centré sur la courbe prévue
+            paths = forecast_engine.simulate_paths(ts_data, forecast_steps(steps), order=ts_order,
+                                                   seasonal=ts_seasonal, seed=42,
+                                                   cache=forecast_engine.default_cache())
+            bands = forecast_engine.fan_bands(paths, (50, confidence_level))
             
             # Préparation des résultats
             historical = pd.DataFrame({
@@ -3340,23 +3571,57 @@ def _page_analyse_data_science(self):
                 'type': 'Prévision'
             })
             
-            return pd.concat([historical, future], ignore_index=True)
-        
-        if forecast_dim == "Global":
-            forecast_data = generate_forecast(df_kpi, target_var, forecast_years)
+            return pd.concat([historical, future], ignore_index=True), bands
+        
+        def reconciled_forecasts():
+            """Prévisions de tous les nœuds (Total, dimensions, croisements), rendues cohérentes"""
+            leaves = cube.rollup(["date"] + hierarchy_dims, kpis=[])
+            history, S, nodes = hierarchy.hierarchy_series(leaves, hierarchy_dims, target_var)
+            series = {i: history[i].rename(target_var) for i in history.columns}
+            base = forecast_engine.batch_forecast(series, forecast_steps(forecast_years),
+                                                  cache=forecast_engine.default_cache(),
+                                                  orders=choose_orders(series))
+            method = {"Bottom-up": "bottom_up", "Top-down": "top_down", "MinT": "mint"}[reconcile_label]
+            variances = hierarchy.residual_variances(history, season) if method == "mint" else None
+            return history, nodes, hierarchy.reconcile_forecasts(base, history, S, method, variances)
+        
+        if reconcile_label != "Aucune":
+            # Les prévisions affichées s'additionnent d'un niveau à l'autre
+            history, nodes, reconciled = reconciled_forecasts()
+            level = hierarchy.TOTAL if forecast_dim == "Global" else forecast_dim
+            ids = nodes.index[nodes["niveau"] == level]
+            labels = nodes["noeud"]
+            forecast_all = forecast_engine.forecast_frame({labels[i]: reconciled[i] for i in ids},
+                                                          {labels[i]: history[i] for i in ids}, key=forecast_dim)
+            for val, forecast_data in forecast_all.groupby(forecast_dim, sort=False):
+                fig_forecast = px.line(forecast_data, x='date', y='value', color='type',
+                                     title=f"Prévision {target_var} - {val} (réconciliée : {reconcile_label})")
+                st.plotly_chart(fig_forecast, use_container_width=True)
+        elif forecast_dim == "Global":
+            forecast_data, bands = generate_forecast(None, target_var, forecast_years)
             if not forecast_data.empty:
                 fig_forecast = px.line(forecast_data, x='date', y='value', color='type',
-                                     title=f"Prévision {target_var} - Global")
+                                     title=f"Prévision {target_var} - Global "
+                                           f"(bandes 50 % et {confidence_level} %, {forecast_engine.N_PATHS:,} trajectoires)")
+                dates = list(bands["date"])
+                for level, opacity in ((confidence_level, 0.15), (50, 0.3)):
+                    fig_forecast.add_trace(go.Scatter(x=dates + dates[::-1],
+                                                      y=list(bands[f"upper_{level}"]) + list(bands[f"lower_{level}"])[::-1],
+                                                      fill="toself", fillcolor=f"rgba(255, 127, 14, {opacity})",
+                                                      line=dict(width=0), hoverinfo="skip", name=f"IC {level} %"))
                 st.plotly_chart(fig_forecast, use_container_width=True)  # CORRECTION: use_container_width=True
         else:
-            unique_vals = df_kpi[forecast_dim].dropna().unique()
-            for val in unique_vals:
-                subset = df_kpi[df_kpi[forecast_dim] == val]
-                forecast_data = generate_forecast(subset, target_var, forecast_years)
-                if not forecast_data.empty:
-                    fig_forecast = px.line(forecast_data, x='date', y='value', color='type',
-                                         title=f"Prévision {target_var} - {forecast_dim}: {val}")
-                    st.plotly_chart(fig_forecast, use_container_width=True)  # CORRECTION: use_container_width=True
+            # Tous les segments agrégés en une fois, puis ajustés en parallèle
+            segments = cube.rollup(["date", forecast_dim], kpis=target_kpis)
+            series = forecast_engine.segment_series(segments, forecast_dim, target_var)
+            forecasts = forecast_engine.batch_forecast(series, forecast_steps(forecast_years),
+                                                       cache=forecast_engine.default_cache(),
+                                                       orders=choose_orders(series))
+            forecast_all = forecast_engine.forecast_frame(forecasts, series, key=forecast_dim)
+            for val, forecast_data in forecast_all.groupby(forecast_dim, sort=False):
+                fig_forecast = px.line(forecast_data, x='date', y='value', color='type',
+                                     title=f"Prévision {target_var} - {forecast_dim}: {val}")
+                st.plotly_chart(fig_forecast, use_container_width=True)  # CORRECTION: use_container_width=True
     
     with tab3:
         st.subheader("🧪 Tests de Résistance (Stress Tests)")
@@ -3383,8 +3648,8 @@ def _page_analyse_data_science(self):
         df_stress.loc[cat_mask, "incurred_claims"] = df_stress.loc[cat_mask, "incurred_claims"] * cat_event
         
         # Comparaison baseline vs stress
-        base_kpi = self.processor.aggregate_kpis(df_kpi, by=["date"])  # CORRECTION: self.processor.
-        stress_kpi = self.processor.aggregate_kpis(df_stress, by=["date"])  # CORRECTION: self.processor.
+        base_kpi = cube.rollup(["date"], kpis=["combined_ratio"])
+        stress_kpi = self.processor.aggregate_kpis(df_stress, by=["date"], kpis=["combined_ratio"])  # CORRECTION: self.processor.
         
         col1, col2 = st.columns(2)
         with col1:
@@ -3410,21 +3675,22 @@ def _page_analyse_data_science(self):
         
         # Répartition par LOB
         if "lob" in df_kpi.columns:
-            lob_analysis = self.processor.aggregate_kpis(df_kpi, by=["lob"])  # CORRECTION: self.processor.
+            lob_analysis = cube.rollup(["lob"], kpis=[])
             fig_lob = px.pie(lob_analysis, values="earned_premium", names="lob",
                            title="Répartition des Primes par Ligne de Business")
             st.plotly_chart(fig_lob, use_container_width=True)  # CORRECTION: use_container_width=True
         
         # Répartition géographique
         if "region" in df_kpi.columns:
-            region_analysis = self.processor.aggregate_kpis(df_kpi, by=["region"])  # CORRECTION: self.processor.
+            region_analysis = cube.rollup(["region"], kpis=[])
             fig_region = px.bar(region_analysis, x="region", y="earned_premium",
                               title="Primes par Région")
             st.plotly_chart(fig_region, use_container_width=True)  # CORRECTION: use_container_width=True
         
         # Analyse fréquence vs sévérité
         if {"frequency", "severity"}.issubset(df_kpi.columns):
-            freq_sev_analysis = self.processor.aggregate_kpis(df_kpi, by=["lob"] if "lob" in df_kpi.columns else ["region"])  # CORRECTION: self.processor.
+            freq_sev_analysis = cube.rollup(["lob"] if "lob" in df_kpi.columns else ["region"],
+                                            kpis=["frequency", "severity"])
             fig_scatter = px.scatter(freq_sev_analysis, x="frequency", y="severity",
                                    size="earned_premium", hover_name=freq_sev_analysis.index,
                                    title="Fréquence vs Sévérité par Segment")
@@ -3433,12 +3699,23 @@ def _page_analyse_data_science(self):
     with tab5:
         st.subheader("📤 Export des Données et Rapports")
         
-        # Export CSV
+        # Export CSV : toutes les colonnes du fichier, pas seulement celles des pages KPI
+        if use_demo_data:
+            df_export = df_kpi
+        else:
+            def load_export():
+                if not store.exists(data_key):
+                    # Dataset Parquet évincé : reconstruit depuis le fichier importé
+                    prepared, load_reports = prepare(parse_cache.read_upload(uploaded_file, cache), rename_dict)
+                    store.write(prepared, data_key, ingestion.reports_to_meta(*load_reports))
+                return self.processor.compute_kpis(store.read(data_key, filters=lob_filter))  # CORRECTION: self.processor.
+            export_key = dataset_store.content_fingerprint(data_key.encode("utf-8"), {"export": selected_lobs})
+            df_export = cache.get_or_create(export_key, load_export)
         st.markdown("### 📊 Données Brutes avec KPI")
-        st.dataframe(df_kpi.head(100))
+        st.dataframe(df_export.head(100))
         
         # CORRECTION: Implémentation du bouton de téléchargement
-        csv_data = df_kpi.to_csv(index=False)
+        csv_data = df_export.to_csv(index=False)
         st.download_button(
             label="📥 Télécharger les données KPI (CSV)",
             data=csv_data,
@@ -3448,7 +3725,7 @@ def _page_analyse_data_science(self):
         
         # Export agrégé
         st.markdown("### 📈 Données Agrégées")
-        aggregated_data = self.processor.aggregate_kpis(df_kpi, by=["date"])  # CORRECTION: self.processor.
+        aggregated_data = cube.rollup(["date"])
         st.dataframe(aggregated_data)
         
         # CORRECTION: Implémentation du bouton de téléchargement agrégé
@@ -9,6 +9,11 @@ import io
 import base64
 from statsmodels.tsa.statespace.sarimax import SARIMAX
 
+import demo_data
+import forecast_engine
+import kpi_engine
+import parse_cache
+
 
 
 # =============================================================================
@@ -1123,129 +1128,32 @@ SCHEMA = {
 REQUIRED_BASE = ["date", "earned_premium", "incurred_claims"]
 
 def _infer_date_col(s: pd.Series) -> pd.Series:
-    """Tente de parser une colonne date."""
-    try:
-        parsed = pd.to_datetime(s, errors="coerce", dayfirst=True)
-        if parsed.notna().mean() > 0.6:
-            return parsed
-    except Exception:
-        pass
-    if s.dtype.kind in "if":
-        return pd.to_datetime(s.astype(int).astype(str) + "-01-01", errors="coerce")
-    return pd.to_datetime(s, errors="coerce")
+    """Tente de parser une colonne date (kpi_engine)."""
+    return kpi_engine.infer_date_col(s)
 
 def make_demo_data(periods=16, seed=42, freq="Q"):
-    """Jeu de données de démonstration."""
-    rng = np.random.default_rng(seed)
-    idx = pd.period_range("2022Q1", periods=periods, freq=freq).to_timestamp()
-    lobs = ["Property Cat", "Casualty", "Vie", "Santé"]
-    regions = ["EU", "NA", "Asia"]
-    rows = []
-    for dt in idx:
-        for lob in lobs:
-            for region in regions[:2]:  # Réduire la combinatoire
-                gwp = rng.normal(50, 8) * 100000  # Échelle plus réaliste
-                ced = gwp * rng.uniform(0.15, 0.45)
-                ep = gwp * rng.uniform(0.75, 0.95)
-                cnt = rng.poisson(110 if lob == "Property Cat" else 85)
-                expo = rng.integers(900, 1600)
-                sev = rng.lognormal(mean=9.35 if lob == "Property Cat" else 9.1, sigma=0.35)
-                inc = float(cnt) * float(sev)
-                paid = inc * rng.uniform(0.6, 0.9)
-                ibnr = inc * rng.uniform(0.06, 0.18)
-                rbns = inc * rng.uniform(0.05, 0.15)
-                acq = ep * rng.uniform(0.08, 0.14)
-                adm = ep * rng.uniform(0.05, 0.09)
-                inv = gwp * rng.uniform(0.01, 0.03)
-                scr = ep * rng.uniform(0.28, 0.42)
-                own = scr * rng.uniform(1.25, 1.9)
-                rows.append([
-                    dt, "CedantA", lob, region, gwp, ced, ep, inc, paid, ibnr, rbns,
-                    acq, adm, cnt, expo, scr, own, inv
-                ])
-    return pd.DataFrame(rows, columns=[
-        "date", "cedant", "lob", "region", "gross_premium", "ceded_premium", "earned_premium",
-        "incurred_claims", "paid_claims", "ibnr", "rbns", "acq_expense", "adm_expense",
-        "claims_count", "exposure", "scr", "own_funds", "investment_income"
-    ])
+    """Jeu de données de démonstration (générateur vectorisé demo_data)."""
+    return demo_data.make_demo_data(periods, seed, freq)
 
 def auto_map_columns(df: pd.DataFrame):
-    """Détecte automatiquement les correspondances colonnes utilisateur -> schéma."""
-    mapping = {}
-    cols_lower = {c.lower(): c for c in df.columns}
-    for key, aliases in SCHEMA.items():
-        found = None
-        for a in aliases:
-            if a in cols_lower:
-                found = cols_lower[a]
-                break
-        mapping[key] = found
-    return mapping
+    """Détecte automatiquement les correspondances colonnes utilisateur -> schéma (kpi_engine)."""
+    return kpi_engine.auto_map_columns(df)
 
 def compute_kpis(d: pd.DataFrame) -> pd.DataFrame:
-    """Calcule les ratios KPI techniques/financiers/risque."""
-    df = d.copy()
-    ep = df["earned_premium"].replace(0, np.nan)
-    gwp = df.get("gross_premium", pd.Series(np.nan, index=df.index))
-    ced = df.get("ceded_premium", pd.Series(0.0, index=df.index))
-
-    df["loss_ratio"] = df["incurred_claims"] / ep
-    df["acq_ratio"] = df.get("acq_expense", 0) / ep
-    df["adm_ratio"] = df.get("adm_expense", 0) / ep
-    df["expense_ratio"] = df["acq_ratio"].fillna(0) + df["adm_ratio"].fillna(0)
-    df["combined_ratio"] = df["loss_ratio"].fillna(0) + df["expense_ratio"].fillna(0)
-    df["operating_ratio"] = df["combined_ratio"] - (df.get("investment_income", 0) / ep)
-    df["cession_ratio"] = ced / gwp.replace(0, np.nan)
-    df["retention_ratio"] = (gwp - ced) / gwp.replace(0, np.nan)
-
-    if {"claims_count", "exposure"}.issubset(df.columns):
-        df["frequency"] = df["claims_count"] / df["exposure"].replace(0, np.nan)
-    if {"incurred_claims", "claims_count"}.issubset(df.columns):
-        df["severity"] = df["incurred_claims"] / df["claims_count"].replace(0, np.nan)
-
-    if {"ibnr", "rbns"}.issubset(df.columns):
-        df["total_reserves"] = df["ibnr"].fillna(0) + df["rbns"].fillna(0)
-        df["reserve_coverage"] = df["total_reserves"] / df["incurred_claims"].replace(0, np.nan)
-
-    if {"scr", "own_funds"}.issubset(df.columns):
-        df["solvency_ratio"] = df["own_funds"] / df["scr"].replace(0, np.nan)
-
-    return df
+    """Calcule les ratios KPI techniques/financiers/risque (noyau colonnaire kpi_engine)."""
+    return kpi_engine.compute_kpis(d)
 
 def aggregate_kpis(d: pd.DataFrame, by=["date"]) -> pd.DataFrame:
-    """Agrège par dimensions et recalcule les KPI au niveau agrégé."""
-    grp = d.groupby(by, dropna=False).agg({
-        "gross_premium": "sum", "ceded_premium": "sum", "earned_premium": "sum",
-        "incurred_claims": "sum", "paid_claims": "sum", "ibnr": "sum", "rbns": "sum",
-        "acq_expense": "sum", "adm_expense": "sum", "investment_income": "sum",
-        "claims_count": "sum", "exposure": "sum", "scr": "sum", "own_funds": "sum"
-    }).reset_index()
-    grp = compute_kpis(grp)
-    return grp
+    """Agrège par dimensions et recalcule les KPI au niveau agrégé (kpi_engine)."""
+    return kpi_engine.aggregate_kpis(d, by=by)
 
 def sarimax_forecast(ts: pd.Series, steps: int, order=(1,1,1), seasonal=(0,1,1,4)) -> pd.Series:
-    """Prévision SARIMAX avec fallback naïf si historique insuffisant."""
-    ts = ts.astype(float).replace([np.inf, -np.inf], np.nan).dropna()
-    if ts.shape[0] < max(24, steps):
-        last = ts.iloc[-1] if ts.shape[0] else 0.0
-        idx = pd.date_range(datetime.today(), periods=steps, freq="MS")
-        return pd.Series([last] * steps, index=idx)
-    try:
-        model = SARIMAX(ts, order=order, seasonal_order=seasonal,
-                        enforce_stationarity=False, enforce_invertibility=False)
-        res = model.fit(disp=False)
-        fc = res.get_forecast(steps=steps).predicted_mean
-        return fc
-    except Exception:
-        last = ts.iloc[-1] if ts.shape[0] else 0.0
-        idx = pd.date_range(ts.index[-1] + pd.offsets.MonthBegin(1), periods=steps, freq="MS")
-        return pd.Series([last] * steps, index=idx)
+    """Prévision SARIMAX avec fallback naïf si historique insuffisant (forecast_engine, résultats en cache)."""
+    return forecast_engine.sarimax_forecast(ts, steps, order, seasonal, cache=forecast_engine.default_cache())
 
 def add_month_start(df: pd.DataFrame) -> pd.DataFrame:
-    """Aligne les dates sur le début de mois."""
-    out = df.copy()
-    out["date"] = pd.to_datetime(out["date"], errors="coerce").dt.to_period("M").dt.to_timestamp()
-    return out
+    """Aligne les dates sur le début de mois (kpi_engine)."""
+    return kpi_engine.add_month_start(df)
 
 def download_button(df: pd.DataFrame, filename: str):
     """Lien de téléchargement CSV."""
@@ -3393,10 +3301,9 @@ elif section == "📊 Analyse Data Science":
         df_raw = make_demo_data(periods=16, freq="Q" if freq == "Trimestrielle" else "M")
         mapping = auto_map_columns(df_raw)
     elif uploaded_file is not None:
-        if uploaded_file.name.endswith('.csv'):
-            df_raw = pd.read_csv(uploaded_file)
-        else:
-            df_raw = pd.read_excel(uploaded_file)
+        # Fichier parsé une seule fois par session (cache partagé entre les pages)
+        cache = parse_cache.session_cache(st.session_state)
+        df_raw = parse_cache.read_upload(uploaded_file, cache)
         mapping = auto_map_columns(df_raw)
         
         # Interface de mapping manuel
@@ -3418,9 +3325,14 @@ elif section == "📊 Analyse Data Science":
     # Application du mapping
     if mapping:
         rename_dict = {v: k for k, v in mapping.items() if v is not None}
-        df = df_raw.rename(columns=rename_dict)
-        df["date"] = _infer_date_col(df["date"])
-        df = add_month_start(df)
+        if use_demo_data:
+            df = df_raw.rename(columns=rename_dict)
+            df["date"] = _infer_date_col(df["date"])
+            df = add_month_start(df)
+        else:
+            # Données renommées et datées, gardées en cache pour ce mapping
+            df = parse_cache.read_upload(uploaded_file, cache, mapping=rename_dict,
+                                         prepare=lambda raw: kpi_engine.prepare_frame(raw, mapping))
         df_kpi = compute_kpis(df)
     
     # Métriques principales
@@ -0,0 +1,844 @@
+# =============================================================================
+# MOTEUR DE PRÉVISION - SANS INTERFACE
+# =============================================================================
+# Prévisions SARIMAX des séries KPI agrégées, importables par les scripts
+# Streamlit comme par les traitements batch. Les séries de plusieurs segments
+# (lob, région...) sont ajustées ensemble dans un pool de processus.
+#
+# Les résultats sont mis en cache sous l'empreinte de la série (valeurs et
+# index), de l'ordre du modèle et de l'horizon : un rerun Streamlit ne
+# réajuste rien. Les paramètres ajustés sont conservés avec la prévision, de
+# sorte qu'un autre horizon sur la même série se calcule sans réajustement.
+import hashlib
+import json
+import os
+import pickle
+import threading
+import warnings
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from scipy.stats import norm
+from statsmodels.tsa.seasonal import STL
+from statsmodels.tsa.statespace.sarimax import SARIMAX
+from statsmodels.tsa.stattools import kpss
+
+from dataset_store import DEFAULT_STORE_DIR
+
+
+# =============================================================================
+# CACHE DES PRÉVISIONS
+# =============================================================================
+def series_key(ts: pd.Series, order, seasonal) -> str:
+    """Empreinte d'une série (valeurs et index) et de l'ordre du modèle."""
+    h = hashlib.sha256(pd.util.hash_pandas_object(ts, index=True).to_numpy().tobytes())
+    h.update(json.dumps([list(order), list(seasonal)]).encode("utf-8"))
+    return h.hexdigest()[:32]
+
+
+class ForecastCache:
+    """Cache LRU des prévisions et paramètres ajustés, en mémoire avec débordement sur disque.
+
+    Les entrées évincées de la mémoire sont écrites sur disque (une par
+    fichier) et y sont relues au besoin ; au-delà de `disk_max_mb`, les
+    fichiers les plus anciens sont supprimés. Le disque est partagé entre
+    sessions et survit aux redémarrages.
+    """
+
+    def __init__(self, max_entries: int = 512, root: str = os.path.join(DEFAULT_STORE_DIR, "forecasts"),
+                 disk_max_mb: float = 256):
+        self.max_entries = max_entries
+        self.root = root
+        self.disk_max_bytes = int(disk_max_mb * 1e6)
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk_bytes = None   # taille estimée du répertoire, mesurée au premier débordement
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, f"{key}.pkl")
+
+    def get(self, key: str):
+        """Entrée en cache (mémoire puis disque), sinon None."""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+        try:
+            with open(self._path(key), "rb") as f:
+                value = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        # Promue en mémoire ; son fichier existe déjà, seules les entrées évincées sont écrites
+        self.put(key, value)
+        return value
+
+    def put(self, key: str, value, persist: bool = False):
+        """Ajoute une entrée ; les plus anciennes au-delà de max_entries débordent sur disque.
+
+        Avec `persist`, l'entrée est aussi écrite sur disque immédiatement,
+        en remplaçant le fichier existant.
+        """
+        if persist:
+            self._spill(key, value, overwrite=True)
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            evicted = []
+            while len(self._entries) > self.max_entries:
+                evicted.append(self._entries.popitem(last=False))
+        for old_key, old_value in evicted:
+            self._spill(old_key, old_value)
+
+    def _spill(self, key: str, value, overwrite: bool = False):
+        """Écrit l'entrée sur disque (fichier temporaire puis remplacement atomique).
+
+        Sans `overwrite`, un fichier existant est conservé tel quel.
+        """
+        path = self._path(key)
+        previous = os.path.getsize(path) if os.path.exists(path) else None
+        if previous is not None and not overwrite:
+            return
+        os.makedirs(self.root, exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+        with self._lock:
+            if self._disk_bytes is None:
+                self._disk_bytes = self._scan_disk()[1]
+            else:
+                self._disk_bytes += os.path.getsize(path) - (previous or 0)
+            over = self._disk_bytes > self.disk_max_bytes
+        if over:
+            self._trim_disk()
+
+    def _scan_disk(self):
+        """Fichiers du cache disque (du plus ancien au plus récent) et taille totale."""
+        files = []
+        for entry in os.scandir(self.root):
+            if entry.name.endswith(".pkl"):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+        files.sort()
+        return files, sum(size for _, size, _ in files)
+
+    def _trim_disk(self):
+        """Supprime les fichiers les plus anciens jusqu'au budget disque (répertoire relu une fois)."""
+        files, total = self._scan_disk()
+        for _, size, path in files:
+            if total <= self.disk_max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+        with self._lock:
+            self._disk_bytes = total
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_DEFAULT_CACHE = None
+
+
+def default_cache() -> ForecastCache:
+    """Cache de prévisions du processus, partagé par toutes les sessions."""
+    global _DEFAULT_CACHE
+    if _DEFAULT_CACHE is None:
+        _DEFAULT_CACHE = ForecastCache()
+    return _DEFAULT_CACHE
+
+
+# =============================================================================
+# PRÉVISIONS SARIMAX
+# =============================================================================
+def _clean(ts: pd.Series) -> pd.Series:
+    return ts.astype(float).replace([np.inf, -np.inf], np.nan).dropna()
+
+
+def _fit_model(ts: pd.Series, order, seasonal, params=None):
+    """Modèle SARIMAX ajusté, ou seulement filtré avec `params`."""
+    model = SARIMAX(ts, order=order, seasonal_order=seasonal,
+                    enforce_stationarity=False, enforce_invertibility=False)
+    return model.filter(params) if params is not None else model.fit(disp=False)
+
+
+def _fit_forecast(ts: pd.Series, steps: int, order, seasonal, params=None):
+    """Prévision d'une série nettoyée et paramètres ajustés (None si repli naïf).
+
+    Avec `params`, le modèle est seulement filtré avec ces paramètres, sans ajustement.
+    """
+    try:
+        res = _fit_model(ts, order, seasonal, params)
+        return res.get_forecast(steps=steps).predicted_mean, np.asarray(res.params)
+    except Exception:
+        return naive_forecast(ts, steps), None
+
+
+def _cache_lookup(cache: ForecastCache, ts: pd.Series, steps: int, order, seasonal):
+    """(clé du modèle, prévision en cache ou None, entrée du modèle en cache ou None)."""
+    key = series_key(ts, order, seasonal)
+    fc = cache.get(f"{key}-{steps}")
+    return key, fc, (cache.get(key) if fc is None else None)
+
+
+def _cache_store(cache: ForecastCache, key: str, steps: int, fc: pd.Series, params):
+    cache.put(key, {"params": params})
+    cache.put(f"{key}-{steps}", fc)
+
+
+def sarimax_forecast(ts: pd.Series, steps: int, order=(1,1,1), seasonal=(0,1,1,4),
+                     cache: ForecastCache = None) -> pd.Series:
+    """Prévision SARIMAX avec fallback naïf si historique insuffisant.
+
+    Avec `cache`, une série déjà prévue (mêmes valeurs, index, ordres et
+    horizon) est servie sans calcul ; pour un autre horizon, les paramètres
+    ajustés en cache évitent un nouvel ajustement.
+    """
+    ts = _clean(ts)
+    if ts.shape[0] < max(24, steps):
+        last = ts.iloc[-1] if ts.shape[0] else 0.0
+        idx = pd.date_range(datetime.today(), periods=steps, freq="MS")
+        return pd.Series([last] * steps, index=idx)
+    if cache is None:
+        return _fit_forecast(ts, steps, order, seasonal)[0]
+    key, fc, state = _cache_lookup(cache, ts, steps, order, seasonal)
+    if fc is None:
+        if state is not None and state["params"] is None:
+            fc, params = naive_forecast(ts, steps), None
+        else:
+            fc, params = _fit_forecast(ts, steps, order, seasonal, state and state["params"])
+        _cache_store(cache, key, steps, fc, params)
+    return fc.copy()
+
+
+def naive_forecast(ts: pd.Series, steps: int) -> pd.Series:
+    """Dernière valeur observée prolongée sur `steps` mois."""
+    last = ts.iloc[-1] if ts.shape[0] else 0.0
+    start = ts.index[-1] + pd.offsets.MonthBegin(1) if ts.shape[0] else datetime.today()
+    idx = pd.date_range(start, periods=steps, freq="MS")
+    return pd.Series([last] * steps, index=idx)
+
+
+def forecast_kpis(agg: pd.DataFrame, targets: list, steps: int,
+                  order=None, seasonal=None, workers: int = 1) -> pd.DataFrame:
+    """Prévisions des colonnes `targets` d'un agrégat par date, au format long.
+
+    Sans `order`/`seasonal`, la saison est déduite de l'espacement des dates
+    (infer_season) et l'ordre de chaque colonne est choisi par select_orders.
+    Colonnes du résultat : date, kpi, forecast.
+    """
+    series = agg.set_index("date").sort_index()
+    if order is None or seasonal is None:
+        chosen, _ = select_orders({t: series[t] for t in targets}, infer_season(series.index), workers=workers)
+    else:
+        chosen = {t: (order, seasonal) for t in targets}
+    frames = []
+    for target in targets:
+        fc = sarimax_forecast(series[target], steps, *chosen[target])
+        frames.append(pd.DataFrame({"date": fc.index, "kpi": target, "forecast": fc.to_numpy()}))
+    if not frames:
+        return pd.DataFrame(columns=["date", "kpi", "forecast"])
+    return pd.concat(frames, ignore_index=True)
+
+
+# =============================================================================
+# PRÉVISIONS PAR SEGMENT EN PARALLÈLE
+# =============================================================================
+def segment_series(agg: pd.DataFrame, dim: str, target: str) -> dict:
+    """Séries {valeur de la dimension: série datée de `target`} d'un agrégat par (date, dim)."""
+    agg = agg.sort_values("date")
+    return {val: g.set_index("date")[target] for val, g in agg.groupby(dim, observed=True, sort=True)}
+
+
+def _forecast_one(ts: pd.Series, steps: int, order, seasonal, params=None):
+    """Tâche du pool : (prévision, paramètres ajustés), repli naïf en cas d'échec."""
+    try:
+        return _fit_forecast(ts, steps, order, seasonal, params)
+    except Exception:
+        return naive_forecast(ts, steps), None
+
+
+def batch_forecast(series: dict, steps: int, order=(1,1,1), seasonal=(0,1,1,4),
+                   workers: int = None, cache: ForecastCache = None, orders: dict = None) -> dict:
+    """Prévisions SARIMAX de plusieurs séries ({segment: série}), ajustées dans un pool de processus.
+
+    Chaque série échouée (ajustement, processus interrompu) retombe sur la
+    prévision naïve. `workers` vaut par défaut le nombre de cœurs ; avec
+    workers=1 ou une seule série à ajuster, le calcul reste dans le processus
+    courant. Avec `cache`, seules les séries absentes du cache sont ajustées.
+    `orders` ({segment: (order, seasonal)}, cf. select_orders) remplace
+    l'ordre commun pour les segments qu'il contient.
+    Retourne {segment: série prévue}, dans l'ordre de `series`.
+    """
+    results = {}
+    todo = {}   # segment -> (série nettoyée, clé du modèle, paramètres en cache, ordre, ordre saisonnier)
+    for k, ts in series.items():
+        k_order, k_seasonal = (orders or {}).get(k, (order, seasonal))
+        clean = _clean(ts)
+        if clean.shape[0] < max(24, steps):
+            results[k] = sarimax_forecast(clean, steps, k_order, k_seasonal)
+            continue
+        key, state = None, None
+        if cache is not None:
+            key, fc, state = _cache_lookup(cache, clean, steps, k_order, k_seasonal)
+            if fc is not None:
+                results[k] = fc.copy()
+                continue
+            if state is not None and state["params"] is None:
+                results[k] = naive_forecast(clean, steps)
+                _cache_store(cache, key, steps, results[k], None)
+                continue
+        todo[k] = (clean, key, state and state["params"], k_order, k_seasonal)
+
+    workers = min(workers or os.cpu_count() or 1, len(todo))
+    fitted = {}
+    if workers <= 1:
+        fitted = {k: _forecast_one(ts, steps, o, so, params) for k, (ts, _, params, o, so) in todo.items()}
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {k: pool.submit(_forecast_one, ts, steps, o, so, params)
+                       for k, (ts, _, params, o, so) in todo.items()}
+            for k, fut in futures.items():
+                try:
+                    fitted[k] = fut.result()
+                except Exception:
+                    fitted[k] = (naive_forecast(todo[k][0], steps), None)
+    for k, (fc, params) in fitted.items():
+        if cache is not None:
+            _cache_store(cache, todo[k][1], steps, fc, params)
+            fc = fc.copy()
+        results[k] = fc
+    return {k: results[k] for k in series}
+
+
+def forecast_frame(forecasts: dict, series: dict = None, key: str = "segment") -> pd.DataFrame:
+    """Résultats de batch_forecast en un seul frame long : segment, date, value, type.
+
+    Avec `series`, l'historique de chaque segment précède sa prévision.
+    """
+    frames = []
+    for k, fc in forecasts.items():
+        if series is not None:
+            ts = series[k]
+            frames.append(pd.DataFrame({key: k, "date": ts.index, "value": ts.to_numpy(), "type": "Historique"}))
+        frames.append(pd.DataFrame({key: k, "date": fc.index, "value": fc.to_numpy(), "type": "Prévision"}))
+    if not frames:
+        return pd.DataFrame(columns=[key, "date", "value", "type"])
+    return pd.concat(frames, ignore_index=True)
+
+
+# =============================================================================
+# SÉLECTION AUTOMATIQUE DE L'ORDRE
+# =============================================================================
+# Nombre maximal d'itérations d'un candidat : au-delà, il est écarté comme non convergent
+SEARCH_MAXITER = 50
+# (P, Q) saisonniers candidats ; D est fixé avant la recherche
+SEASONAL_CANDIDATES = [(0, 0), (0, 1), (1, 0)]
+# Différenciation : force saisonnière (STL) au-delà de laquelle D = 1, seuil du test KPSS pour d = 1
+SEASONAL_STRENGTH_MIN = 0.64
+KPSS_ALPHA = 0.05
+ORDER_REPORT_COLUMNS = ["segment", "order", "seasonal", "aic", "bic", "candidats", "écartés", "source"]
+
+
+def season_length(freq: str) -> int:
+    """Période saisonnière selon la fréquence des données (1 : pas de saisonnalité)."""
+    return {"Mensuelle": 12, "M": 12, "MS": 12, "Trimestrielle": 4, "Q": 4, "QS": 4}.get(freq, 1)
+
+
+def infer_season(dates) -> int:
+    """Période saisonnière déduite de l'écart médian (en mois) entre dates successives."""
+    dates = pd.DatetimeIndex(pd.to_datetime(dates)).unique().sort_values()
+    if len(dates) < 3:
+        return 1
+    months = np.diff(dates.year * 12 + dates.month)
+    return {1: 12, 3: 4}.get(int(np.median(months)), 1)
+
+
+def default_orders(season: int):
+    """Ordre historique (1,1,1) et saisonnier (0,1,1,s), sans saisonnalité si s <= 1."""
+    return (1, 1, 1), ((0, 1, 1, season) if season > 1 else (0, 0, 0, 0))
+
+
+def differencing_orders(ts: pd.Series, season: int):
+    """Ordres de différenciation (d, D), fixés avant la comparaison des candidats.
+
+    D = 1 si la force saisonnière d'une décomposition STL dépasse
+    SEASONAL_STRENGTH_MIN ; d = 1 si le test KPSS rejette la stationnarité
+    de la série (après différence saisonnière si D = 1).
+    """
+    y = _clean(ts).to_numpy(dtype=float)
+    D = 0
+    if season > 1 and y.shape[0] >= 2 * season + 1:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            stl = STL(y, period=season, robust=True).fit()
+        deseasonalized = np.var(stl.resid + stl.seasonal)
+        strength = 1 - np.var(stl.resid) / deseasonalized if deseasonalized > 0 else 0.0
+        D = int(strength > SEASONAL_STRENGTH_MIN)
+    if D:
+        y = y[season:] - y[:-season]
+    d = 0
+    if y.shape[0] >= 8 and np.ptp(y) > 0:
+        try:
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+                d = int(kpss(y, regression="c", nlags="auto")[1] < KPSS_ALPHA)
+        except Exception:
+            d = 0
+    return d, D
+
+
+def order_grid(season: int, max_p: int = 2, max_q: int = 2, d: int = 1, D: int = 1) -> list:
+    """Grille bornée des (order, seasonal) candidats à différenciation (d, D) fixée : p + q <= max(max_p, max_q)."""
+    arma = [(p, q) for p in range(max_p + 1) for q in range(max_q + 1) if p + q <= max(max_p, max_q)]
+    orders = [(p, d, q) for p, q in arma]
+    if season > 1:
+        seasonals = [(P, D, Q, season) for P, Q in SEASONAL_CANDIDATES]
+    else:
+        seasonals = [(0, 0, 0, 0)]
+    return [(o, so) for o in orders for so in seasonals]
+
+
+def _score_candidate(ts: pd.Series, order, seasonal, maxiter: int = SEARCH_MAXITER):
+    """(aic, bic) d'un candidat, ou None s'il échoue ou ne converge pas."""
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            model = SARIMAX(ts, order=order, seasonal_order=seasonal,
+                            enforce_stationarity=False, enforce_invertibility=False)
+            res = model.fit(disp=False, maxiter=maxiter)
+    except Exception:
+        return None
+    if not res.mle_retvals.get("converged", True) or not np.isfinite([res.aic, res.bic]).all():
+        return None
+    return float(res.aic), float(res.bic)
+
+
+def _order_cache_key(namespace: str, segment, season: int, criterion: str) -> str:
+    # "d-fixe" : les choix antérieurs comparaient des candidats de différenciations différentes
+    payload = json.dumps([namespace, str(segment), season, criterion, "d-fixe"])
+    return "order-" + hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+
+
+def select_orders(series: dict, season: int, criterion: str = "aic", workers: int = None,
+                  cache: ForecastCache = None, namespace: str = "", refresh: bool = False,
+                  grid: list = None):
+    """Choisit l'ordre SARIMAX de chaque segment par AIC ou BIC sur une grille bornée.
+
+    Les vraisemblances ne sont comparables qu'à différenciation égale : d et D
+    sont d'abord fixés par segment (differencing_orders), puis seuls
+    (p, q, P, Q) sont départagés par le critère. Une `grid` explicite est
+    restreinte aux candidats de cette différenciation.
+    Tous les couples (segment, candidat) sont ajustés dans un pool de
+    processus ; un candidat qui échoue ou ne converge pas en SEARCH_MAXITER
+    itérations est écarté. Avec `cache`, le choix est conservé par
+    (namespace, segment, saison, critère) : `namespace` doit identifier le jeu
+    de données (empreinte du fichier et du mapping, paramètres de la démo),
+    de sorte que seuls les ajustements suivants sur ce même jeu sautent la
+    recherche (sauf `refresh`). Sans namespace, le choix n'est réutilisé que
+    pour une série identique.
+    Retourne ({segment: (order, seasonal)}, rapport par segment).
+    """
+    column = {"aic": 0, "bic": 1}[criterion]
+    chosen, rows, tasks, keys = {}, [], [], {}
+    for k, ts in series.items():
+        clean = _clean(ts)
+        cached = None
+        if cache is not None:
+            keys[k] = _order_cache_key(namespace or series_key(clean, (), ()), k, season, criterion)
+        if cache is not None and not refresh:
+            cached = cache.get(keys[k])
+        if cached is not None:
+            chosen[k] = (tuple(cached["order"]), tuple(cached["seasonal"]))
+            rows.append(dict(cached, segment=k, source="cache"))
+        elif clean.shape[0] < 24:
+            chosen[k] = default_orders(season)
+            rows.append({"segment": k, "order": chosen[k][0], "seasonal": chosen[k][1],
+                         "source": "historique insuffisant"})
+        else:
+            d, D = differencing_orders(clean, season)
+            candidates = order_grid(season, d=d, D=D) if grid is None else \
+                [(o, so) for o, so in grid if o[1] == d and (so[1] == D or season <= 1)]
+            if not candidates:
+                chosen[k] = default_orders(season)
+                rows.append({"segment": k, "order": chosen[k][0], "seasonal": chosen[k][1],
+                             "source": f"défaut (aucun candidat avec d={d}, D={D})"})
+            tasks += [(k, clean, o, so) for o, so in candidates]
+
+    workers = min(workers or os.cpu_count() or 1, len(tasks))
+    if workers <= 1:
+        scores = [_score_candidate(ts, o, so) for _, ts, o, so in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            args = list(zip(*[(ts, o, so) for _, ts, o, so in tasks]))
+            scores = list(pool.map(_score_candidate, *args, chunksize=max(1, len(tasks) // (4 * workers))))
+
+    best = {}   # segment -> (critère, aic, bic, order, seasonal)
+    tried = {}
+    for (k, _, o, so), score in zip(tasks, scores):
+        n_ok, n_total = tried.get(k, (0, 0))
+        tried[k] = (n_ok + (score is not None), n_total + 1)
+        if score is not None and (k not in best or score[column] < best[k][0]):
+            best[k] = (score[column], score[0], score[1], o, so)
+    for k, (n_ok, n_total) in tried.items():
+        if k in best:
+            _, aic, bic, o, so = best[k]
+            source = criterion.upper()
+        else:
+            (o, so), aic, bic, source = default_orders(season), np.nan, np.nan, "défaut (aucun candidat convergent)"
+        chosen[k] = (o, so)
+        entry = {"order": o, "seasonal": so, "aic": aic, "bic": bic,
+                 "candidats": n_total, "écartés": n_total - n_ok}
+        if cache is not None and k in best:
+            cache.put(keys[k], entry, persist=True)
+        rows.append(dict(entry, segment=k, source=source))
+
+    report = pd.DataFrame(rows, columns=ORDER_REPORT_COLUMNS)
+    report[["candidats", "écartés"]] = report[["candidats", "écartés"]].astype("Int64")
+    order_of = {k: i for i, k in enumerate(series)}
+    report = report.sort_values("segment", key=lambda c: c.map(order_of), ignore_index=True)
+    return {k: chosen[k] for k in series}, report
+
+
+# =============================================================================
+# LISSAGE EXPONENTIEL VECTORISÉ (HOLT-WINTERS ADDITIF)
+# =============================================================================
+# Toutes les séries (lignes d'un tableau 2-D aux dates alignées) et toutes les
+# combinaisons de paramètres candidates avancent ensemble dans une seule
+# boucle sur le temps. Les paramètres sont choisis par grille grossière puis
+# affinés localement autour du meilleur point de chaque série.
+ALPHA_GRID = np.linspace(0.1, 0.9, 9)
+BETA_GRID = np.array([0.0, 0.05, 0.1, 0.2, 0.3])
+GAMMA_GRID = np.array([0.0, 0.1, 0.2, 0.3, 0.5])
+PHI_GRID = np.array([0.8, 0.9, 0.98])
+# Séries traitées par bloc (borne la mémoire des états saisonniers)
+ETS_BLOCK = 1000
+
+
+def _hw_init(y: np.ndarray, season: int):
+    """Niveau, tendance et saisons initiaux de chaque série (n, T)."""
+    n, T = y.shape
+    if season > 1:
+        first, second = np.nanmean(y[:, :season], axis=1), np.nanmean(y[:, season:2 * season], axis=1)
+        level, trend = first, (second - first) / season
+        seasonal = np.nan_to_num(y[:, :season] - first[:, None])
+    else:
+        level = y[:, 0]
+        trend = (y[:, 1] - y[:, 0]) if T > 1 else np.zeros(n)
+        seasonal = np.zeros((n, 1))
+    return level, np.nan_to_num(trend), seasonal
+
+
+def _hw_run(y: np.ndarray, alpha, beta, gamma, phi, season: int, trend: bool):
+    """Somme des erreurs à un pas au carré et états finaux, par (série, combinaison).
+
+    `y` est (n, T) ; les paramètres sont (n ou 1, c). Une valeur manquante
+    est remplacée par sa prévision : l'erreur est nulle et les états sont prolongés.
+    """
+    n, T = y.shape
+    c = np.broadcast_shapes(alpha.shape, beta.shape, gamma.shape, phi.shape)[1]
+    m = max(season, 1)
+    level0, trend0, seasonal0 = _hw_init(y, season)
+    level = np.repeat(level0[:, None], c, axis=1)
+    slope = np.repeat(trend0[:, None], c, axis=1) if trend else np.zeros((n, c))
+    seasonal = np.repeat(seasonal0[:, None, :], c, axis=1)
+    sse = np.zeros((n, c))
+    start = m if season > 1 else 1
+    for t in range(T):
+        obs = y[:, t][:, None]
+        s_t = seasonal[:, :, t % m]
+        damped = phi * slope
+        fitted = level + damped + s_t
+        obs = np.where(np.isnan(obs), fitted, obs)
+        if t >= start:
+            sse += (obs - fitted) ** 2
+        new_level = alpha * (obs - s_t) + (1 - alpha) * (level + damped)
+        if trend:
+            slope = beta * (new_level - level) + (1 - beta) * damped
+        if season > 1:
+            seasonal[:, :, t % m] = gamma * (obs - new_level) + (1 - gamma) * s_t
+        level = new_level
+    return sse, level, slope, seasonal
+
+
+def _grid(season: int, trend: bool, damped: bool) -> np.ndarray:
+    """Combinaisons (alpha, beta, gamma, phi) de la grille grossière, en colonnes."""
+    axes = [ALPHA_GRID, BETA_GRID if trend else [0.0], GAMMA_GRID if season > 1 else [0.0],
+            PHI_GRID if (trend and damped) else [1.0]]
+    return np.array(np.meshgrid(*axes, indexing="ij")).reshape(4, -1)
+
+
+def _ets_fit(y: np.ndarray, season: int, trend: bool, damped: bool, refine: int):
+    """Paramètres (4, n), SSE (n,) et états finaux (niveau, pente, saisons (n, m)) d'un bloc de séries."""
+    n, T = y.shape
+    combos = _grid(season, trend, damped)
+    params = [np.broadcast_to(p[None, :], (n, combos.shape[1])) for p in combos]
+    sse = _hw_run(y, *params, season, trend)[0]
+    best = np.argmin(np.where(np.isfinite(sse), sse, np.inf), axis=1)
+    point = np.array([p[np.arange(n), best] for p in params])   # (4, n)
+
+    # Affinage local : pas divisé par deux à chaque tour, autour du meilleur point de chaque série
+    step = np.array([0.05, 0.025 if trend else 0.0, 0.05 if season > 1 else 0.0, 0.02 if (trend and damped) else 0.0])
+    offsets = np.array(np.meshgrid(*[[-1.0, 0.0, 1.0]] * 4, indexing="ij")).reshape(4, -1)
+    offsets = np.unique(offsets * (step[:, None] != 0), axis=1)
+    bounds = np.array([[0.01, 0.99], [0.0, 0.99], [0.0, 0.99], [0.8, 1.0]])
+    for _ in range(refine):
+        cand = np.clip(point[:, :, None] + offsets[:, None, :] * step[:, None, None],
+                       bounds[:, :1, None], bounds[:, 1:, None])   # (4, n, c)
+        sse = _hw_run(y, *cand, season, trend)[0]
+        best = np.argmin(np.where(np.isfinite(sse), sse, np.inf), axis=1)
+        point = cand[:, np.arange(n), best]
+        step = step / 2
+
+    sse, level, slope, seasonal = _hw_run(y, *[p[:, None] for p in point], season, trend)
+    return point, sse[:, 0], level[:, 0], slope[:, 0], seasonal[:, 0]
+
+
+def _ets_states(values, season: int, trend: bool, damped: bool, refine: int):
+    """Ajustement par blocs de ETS_BLOCK séries : (y, saison retenue, paramètres, SSE, niveau, pente, saisons)."""
+    y = np.atleast_2d(np.asarray(values, dtype=float))
+    if season > 1 and y.shape[1] < 2 * season:
+        season = 0
+    fits = [_ets_fit(y[lo:lo + ETS_BLOCK], season, trend, damped, refine) for lo in range(0, y.shape[0], ETS_BLOCK)]
+    if not fits:
+        return y, season, np.empty((4, 0)), np.empty(0), np.empty(0), np.empty(0), np.empty((0, max(season, 1)))
+    point = np.concatenate([f[0] for f in fits], axis=1)
+    sse, level, slope, seasonal = (np.concatenate([f[i] for f in fits]) for i in range(1, 5))
+    return y, season, point, sse, level, slope, seasonal
+
+
+def _last_observed(y: np.ndarray) -> np.ndarray:
+    return np.nan_to_num(pd.DataFrame(y).ffill(axis=1).to_numpy()[:, -1])
+
+
+def ets_forecast(values, steps: int, season: int = 0, trend: bool = True, damped: bool = False,
+                 refine: int = 2):
+    """Holt-Winters additif ajusté et prévu sur un tableau 2-D de séries alignées (séries × dates).
+
+    `season` est la période saisonnière (0 ou 1 : sans saisonnalité ; il faut
+    au moins deux saisons d'historique, sinon la saisonnalité est ignorée),
+    `damped` amortit la tendance. Alpha, bêta, gamma (et phi) minimisent
+    l'erreur quadratique à un pas de chaque série. Une prévision non finie
+    (série vide ou trop courte) est remplacée par la dernière valeur observée.
+    Retourne (prévisions (n_séries, steps), paramètres par série).
+    """
+    y, season, point, sse, level, slope, seasonal = _ets_states(values, season, trend, damped, refine)
+    T = y.shape[1]
+    h = np.arange(1, steps + 1)
+    trend_path = np.cumsum(point[3][:, None] ** h, axis=1) if trend else np.zeros((y.shape[0], steps))
+    forecast = level[:, None] + slope[:, None] * trend_path + seasonal[:, (T + h - 1) % max(season, 1)]
+
+    # Repli naïf : dernière valeur observée
+    bad = ~np.isfinite(forecast).all(axis=1)
+    if bad.any():
+        forecast[bad] = _last_observed(y[bad])[:, None]
+    params = pd.DataFrame({"alpha": point[0], "beta": point[1], "gamma": point[2], "phi": point[3], "sse": sse})
+    return forecast, params
+
+
+def ets_batch_forecast(series: dict, steps: int, season: int = 0, trend: bool = True,
+                       damped: bool = False) -> dict:
+    """Équivalent de batch_forecast par lissage exponentiel vectorisé : {segment: série prévue}.
+
+    Les séries sont alignées sur l'union de leurs dates ; un début manquant
+    est rempli par la première valeur observée.
+    """
+    if not series:
+        return {}
+    frame = pd.DataFrame({k: _clean(ts) for k, ts in series.items()}).sort_index().bfill()
+    forecast, _ = ets_forecast(frame.T.to_numpy(), steps, season, trend, damped)
+    freq = pd.infer_freq(frame.index) if len(frame.index) >= 3 else None
+    idx = pd.date_range(frame.index[-1], periods=steps + 1, freq=freq or "MS")[1:]
+    return {k: pd.Series(forecast[i], index=idx, name=ts.name) for i, (k, ts) in enumerate(series.items())}
+
+
+# =============================================================================
+# INTERVALLES DE PRÉVISION ET TRAJECTOIRES SIMULÉES
+# =============================================================================
+# Les intervalles analytiques viennent du modèle SARIMAX ajusté. Les
+# trajectoires futures sont tirées par lots : l'état du filtre de Kalman en
+# fin d'historique est échantillonné puis propagé par l'équation d'état,
+# toutes les trajectoires d'un lot avançant ensemble. Leurs quantiles donnent
+# les bandes des graphiques en éventail. Un ratio (ratio combiné...) est
+# simulé directement à partir de sa propre série : ses composantes sont trop
+# corrélées pour être tirées indépendamment.
+N_PATHS = 10_000
+# Trajectoires simulées ensemble (borne la mémoire des états)
+SIM_BATCH = 2_000
+FAN_LEVELS = (50, 80, 95)
+
+
+def _fitted_model(ts: pd.Series, steps: int, order, seasonal, cache: ForecastCache = None):
+    """Modèle SARIMAX ajusté (paramètres en cache réutilisés), ou None si historique court ou échec."""
+    if ts.shape[0] < max(24, steps):
+        return None
+    key, state = None, None
+    if cache is not None:
+        key, _, state = _cache_lookup(cache, ts, steps, order, seasonal)
+        if state is not None and state["params"] is None:
+            return None
+    try:
+        res = _fit_model(ts, order, seasonal, state and state["params"])
+    except Exception:
+        return None
+    if cache is not None and state is None:
+        _cache_store(cache, key, steps, res.get_forecast(steps=steps).predicted_mean, np.asarray(res.params))
+    return res
+
+
+def _fallback_index(ts: pd.Series, steps: int) -> pd.DatetimeIndex:
+    """Dates du repli naïf, identiques à celles de sarimax_forecast."""
+    if ts.shape[0] < max(24, steps):
+        return pd.date_range(datetime.today(), periods=steps, freq="MS")
+    return naive_forecast(ts, steps).index
+
+
+def _walk_sigma(ts: pd.Series) -> float:
+    """Écart-type des variations d'une période (0 si incalculable)."""
+    sigma = ts.diff().std() if ts.shape[0] > 2 else 0.0
+    return float(sigma) if np.isfinite(sigma) else 0.0
+
+
+def _sqrt_psd(cov: np.ndarray) -> np.ndarray:
+    """Racine L (L @ L.T = cov) d'une covariance semi-définie positive."""
+    w, v = np.linalg.eigh((cov + cov.T) / 2)
+    return v * np.sqrt(np.clip(w, 0.0, None))
+
+
+def _state_space_paths(res, steps: int, n_paths: int, rng, batch: int) -> np.ndarray:
+    """Trajectoires (n_paths, steps) propagées depuis l'état prédit après la dernière observation."""
+    fr = res.filter_results
+    design, obs_intercept = fr.design[:, :, -1], fr.obs_intercept[:, -1]
+    transition, state_intercept = fr.transition[:, :, -1], fr.state_intercept[:, -1]
+    shock = fr.selection[:, :, -1] @ _sqrt_psd(fr.state_cov[:, :, -1])
+    obs_sd = np.sqrt(max(fr.obs_cov[0, 0, -1], 0.0))
+    start = _sqrt_psd(fr.predicted_state_cov[:, :, -1])
+    paths = np.empty((n_paths, steps))
+    for lo in range(0, n_paths, batch):
+        k = min(batch, n_paths - lo)
+        x = fr.predicted_state[:, -1][:, None] + start @ rng.standard_normal((start.shape[1], k))
+        for t in range(steps):
+            paths[lo:lo + k, t] = (design @ x)[0] + obs_intercept[0] + obs_sd * rng.standard_normal(k)
+            x = transition @ x + state_intercept[:, None] + shock @ rng.standard_normal((shock.shape[1], k))
+    return paths
+
+
+def forecast_interval(ts: pd.Series, steps: int, order=(1,1,1), seasonal=(0,1,1,4), level: float = 0.9,
+                      cache: ForecastCache = None) -> pd.DataFrame:
+    """Prévision et intervalle au niveau `level` : colonnes date, forecast, lower, upper.
+
+    Intervalle analytique du modèle ajusté ; pour un historique court ou un
+    ajustement échoué, celui d'une marche aléatoire depuis la dernière valeur.
+    """
+    ts = _clean(ts)
+    res = _fitted_model(ts, steps, order, seasonal, cache)
+    if res is not None:
+        pred = res.get_forecast(steps=steps)
+        bounds = pred.conf_int(alpha=1 - level).to_numpy()
+        return pd.DataFrame({"date": pred.predicted_mean.index, "forecast": pred.predicted_mean.to_numpy(),
+                             "lower": bounds[:, 0], "upper": bounds[:, 1]})
+    last = ts.iloc[-1] if ts.shape[0] else 0.0
+    half = norm.ppf(0.5 + level / 2) * _walk_sigma(ts) * np.sqrt(np.arange(1, steps + 1))
+    return pd.DataFrame({"date": _fallback_index(ts, steps), "forecast": last,
+                         "lower": last - half, "upper": last + half})
+
+
+def simulate_paths(ts: pd.Series, steps: int, n_paths: int = N_PATHS, order=(1,1,1), seasonal=(0,1,1,4),
+                   seed=None, cache: ForecastCache = None, batch: int = SIM_BATCH) -> pd.DataFrame:
+    """Trajectoires futures simulées : `n_paths` lignes, une colonne par date prévue.
+
+    Le modèle est ajusté une fois (ou repris du cache, c'est alors celui de
+    sarimax_forecast), puis les trajectoires sont tirées par lots de `batch`.
+    Avec `cache` et une graine fixée, le tirage lui-même est conservé à côté
+    de l'ajustement : un rerun ne le refait pas. Repli : marche aléatoire
+    depuis la dernière valeur.
+    """
+    ts = _clean(ts)
+    key = None
+    if cache is not None and seed is not None:
+        key = f"{series_key(ts, order, seasonal)}-{steps}-paths-{n_paths}-{seed}"
+        cached = cache.get(key)
+        if cached is not None:
+            return cached.copy()
+    rng = np.random.default_rng(seed)
+    res = _fitted_model(ts, steps, order, seasonal, cache)
+    if res is None:
+        last = ts.iloc[-1] if ts.shape[0] else 0.0
+        paths = last + np.cumsum(rng.normal(0.0, _walk_sigma(ts), (n_paths, steps)), axis=1)
+        frame = pd.DataFrame(paths, columns=_fallback_index(ts, steps))
+    else:
+        paths = _state_space_paths(res, steps, n_paths, rng, batch)
+        frame = pd.DataFrame(paths, columns=res.get_forecast(steps=steps).predicted_mean.index)
+    if key is not None:
+        cache.put(key, frame)
+        frame = frame.copy()
+    return frame
+
+
+def fan_bands(paths: pd.DataFrame, levels=FAN_LEVELS) -> pd.DataFrame:
+    """Bandes d'un graphique en éventail : date, median, mean, lower_<niveau>, upper_<niveau>."""
+    values = np.asarray(paths, dtype=float)
+    probs = [0.5] + [p for lvl in levels for p in (0.5 - lvl / 200, 0.5 + lvl / 200)]
+    q = np.nanquantile(values, probs, axis=0)
+    bands = pd.DataFrame({"date": paths.columns, "median": q[0], "mean": np.nanmean(values, axis=0)})
+    for i, lvl in enumerate(levels):
+        bands[f"lower_{lvl}"] = q[1 + 2 * i]
+        bands[f"upper_{lvl}"] = q[2 + 2 * i]
+    return bands
+
+
+def ets_simulate(values, steps: int, n_paths: int = N_PATHS, season: int = 0, trend: bool = True,
+                 damped: bool = False, seed=None, batch: int = SIM_BATCH) -> np.ndarray:
+    """Trajectoires futures du Holt-Winters vectorisé : tableau (séries, trajectoires, pas).
+
+    Les erreurs sont gaussiennes, de l'écart-type des erreurs à un pas de
+    chaque série, et propagées par les équations de lissage. Toutes les
+    séries avancent ensemble, par lots de `batch` trajectoires.
+    """
+    y, season, point, sse, level, slope, seasonal = _ets_states(values, season, trend, damped, 2)
+    n, T = y.shape
+    m = max(season, 1)
+    sigma = np.sqrt(sse / max(T - (m if season > 1 else 1), 1))[:, None]
+    alpha, beta, gamma, phi = (p[:, None] for p in point)
+    rng = np.random.default_rng(seed)
+    paths = np.empty((n, n_paths, steps))
+    for lo in range(0, n_paths, batch):
+        k = min(batch, n_paths - lo)
+        lvl, b = np.repeat(level[:, None], k, axis=1), np.repeat(slope[:, None], k, axis=1)
+        s = np.repeat(seasonal[:, None, :], k, axis=1)
+        for t in range(steps):
+            phase = (T + t) % m
+            err = sigma * rng.standard_normal((n, k))
+            damped_b = phi * b
+            paths[:, lo:lo + k, t] = lvl + damped_b + s[:, :, phase] + err
+            lvl = lvl + damped_b + alpha * err
+            if trend:
+                b = damped_b + alpha * beta * err
+            if season > 1:
+                s[:, :, phase] += gamma * (1 - alpha) * err
+
+    # Repli naïf : dernière valeur observée, sans dispersion
+    bad = ~np.isfinite(paths).all(axis=(1, 2))
+    if bad.any():
+        paths[bad] = _last_observed(y[bad])[:, None, None]
+    return paths
@@ -21,6 +21,9 @@ from reportlab.pdfgen import canvas as pdf_canvas
 from reportlab.lib.pagesizes import A4
 from reportlab.lib.units import cm
 
+import demo_data
+import parse_cache
+
 # ================================================================
 # CONFIGURATION GÉNÉRALE
 # ================================================================
@@ -196,30 +199,15 @@ elif section == "📈 Analyse & KPI Réassurance":
     demo = st.sidebar.toggle("Utiliser données démo", value=(up is None))
 
     def make_demo(periods=16, seed=42):
-        rng = np.random.default_rng(seed)
-        idx = pd.period_range("2022Q1", periods=periods, freq="Q").to_timestamp()
-        data = []
-        for dt in idx:
-            gwp = rng.normal(50, 8)
-            ced = gwp * rng.uniform(0.2, 0.4)
-            ep = gwp * rng.uniform(0.8, 0.95)
-            inc = gwp * rng.uniform(0.5, 0.8)
-            paid = inc * rng.uniform(0.7, 0.9)
-            acq = ep * rng.uniform(0.1, 0.15)
-            adm = ep * rng.uniform(0.05, 0.1)
-            inv = gwp * 0.02
-            scr = ep * 0.35
-            own = scr * 1.5
-            data.append([dt, gwp, ced, ep, inc, paid, acq, adm, inv, scr, own])
-        return pd.DataFrame(data, columns=[
-            "date", "gross_premium", "ceded_premium", "earned_premium", "incurred_claims",
-            "paid_claims", "acq_expense", "adm_expense", "investment_income", "scr", "own_funds"
-        ])
+        # Un seul segment du générateur vectorisé, à l'échelle des ratios de cette page
+        demo = demo_data.make_demo_data(periods, seed, "Q", lobs=["Property Cat"], regions=["EU"],
+                                        premium_scale=1.0, severity_scale=2.5e-5)
+        return demo.drop(columns=["cedant", "lob", "region", "ibnr", "rbns", "claims_count", "exposure"])
 
     if demo:
         df = make_demo()
     elif up:
-        df = pd.read_csv(up) if up.name.endswith(".csv") else pd.read_excel(up)
+        df = parse_cache.read_upload(up, parse_cache.session_cache(st.session_state))
     else:
         st.stop()
 
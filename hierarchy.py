@@ -0,0 +1,184 @@
+# =============================================================================
+# PRÉVISIONS HIÉRARCHIQUES - MATRICE DE SOMMATION ET RÉCONCILIATION
+# =============================================================================
+# Les feuilles sont les combinaisons des dimensions (ex. lob × région) ; chaque
+# sous-ensemble de dimensions forme un niveau agrégé (Total, lob, région...).
+# La matrice de sommation S (nœuds × feuilles) est creuse : une prévision
+# cohérente s'écrit S @ b, où b est la prévision des feuilles. Les méthodes
+# bottom-up, top-down et MinT ne manipulent que des produits creux, ce qui
+# reste rapide sur des hiérarchies de plusieurs milliers de feuilles.
+from itertools import combinations
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+import forecast_engine
+
+TOTAL = "Total"
+# Libellé des valeurs de dimension manquantes (un nœud à part entière)
+UNKNOWN = "Inconnu"
+METHODS = ("bottom_up", "top_down", "mint")
+# Convergence du gradient conjugué (résidu relatif)
+CG_TOL = 1e-10
+
+
+def summing_matrix(leaves: pd.DataFrame):
+    """Matrice de sommation creuse et description des nœuds.
+
+    `leaves` contient une ligne par feuille (colonnes = dimensions), dans
+    l'ordre des colonnes de S. Les nœuds sont rangés du Total aux feuilles ;
+    `nodes` indique pour chacun son niveau et la valeur de chaque dimension
+    (NA si la dimension est agrégée).
+    """
+    dims = list(leaves.columns)
+    leaves = _fill_unknown(leaves, dims)
+    m = len(leaves)
+    rows, cols, frames, offset = [], [], [], 0
+    for size in range(len(dims) + 1):
+        for level in combinations(dims, size):
+            if level:
+                codes = leaves.groupby(list(level), sort=True, observed=True).ngroup().to_numpy()
+                keys = leaves[list(level)].drop_duplicates().sort_values(list(level))
+            else:
+                codes = np.zeros(m, dtype=np.int64)
+                keys = pd.DataFrame(index=[0])
+            node = pd.DataFrame({"niveau": " × ".join(level) or TOTAL}, index=range(len(keys)))
+            for d in dims:
+                node[d] = keys[d].to_numpy() if d in level else pd.NA
+            frames.append(node)
+            rows.append(offset + codes)
+            cols.append(np.arange(m))
+            offset += len(keys)
+    S = sparse.csr_matrix((np.ones(len(rows) * m), (np.concatenate(rows), np.concatenate(cols))),
+                          shape=(offset, m))
+    nodes = pd.concat(frames, ignore_index=True)
+    nodes["noeud"] = [_label(r, dims) for r in nodes[dims].itertuples(index=False)]
+    return S, nodes
+
+
+def _fill_unknown(frame: pd.DataFrame, dims) -> pd.DataFrame:
+    """Remplace les valeurs manquantes des dimensions par UNKNOWN : groupby
+    les écarterait (ou ngroup les coderait -1, rattachées au dernier nœud)."""
+    out = frame.copy(deep=False)
+    for d in dims:
+        s = out[d]
+        if not s.isna().any():
+            continue
+        if isinstance(s.dtype, pd.CategoricalDtype) and UNKNOWN not in s.cat.categories:
+            s = s.cat.add_categories([UNKNOWN])
+        out[d] = s.fillna(UNKNOWN)
+    return out
+
+
+def _label(values, dims) -> str:
+    parts = [str(v) for v in values if not pd.isna(v)]
+    return " / ".join(parts) if parts else TOTAL
+
+
+def hierarchy_series(df: pd.DataFrame, dims: list, target: str, date_col: str = "date"):
+    """Historique de tous les nœuds (dates × nœuds), matrice S et nœuds.
+
+    Les feuilles sont agrégées puis sommées par S : les niveaux agrégés sont
+    cohérents par construction. Une feuille absente à une date vaut 0 ; une
+    dimension manquante est rangée sous UNKNOWN.
+    """
+    df = _fill_unknown(df[[date_col] + list(dims) + [target]], dims)
+    leaf = df.groupby([date_col] + list(dims), observed=True)[target].sum().unstack(list(dims), fill_value=0.0)
+    leaf = leaf.sort_index().sort_index(axis=1)
+    leaves = leaf.columns.to_frame(index=False)
+    S, nodes = summing_matrix(leaves)
+    history = pd.DataFrame((S @ leaf.to_numpy(dtype=float).T).T, index=leaf.index)
+    return history, S, nodes
+
+
+def residual_variances(history: pd.DataFrame, season: int = 0) -> np.ndarray:
+    """Variance des erreurs à un pas de chaque nœud (lissage exponentiel vectorisé)."""
+    _, params = forecast_engine.ets_forecast(history.T.to_numpy(), 1, season)
+    return params["sse"].to_numpy() / max(len(history) - 1, 1)
+
+
+def _solve_normal(S, winv: np.ndarray, rhs: np.ndarray) -> np.ndarray:
+    """Résout (S' W⁻¹ S) x = rhs par gradient conjugué préconditionné (Jacobi).
+
+    Le Total rend S' W⁻¹ S dense : elle n'est jamais formée, seuls des
+    produits par S et S' sont calculés. Toutes les colonnes de `rhs` sont
+    résolues ensemble.
+    """
+    St = S.T.tocsr()
+
+    def apply(x):
+        return St @ (winv[:, None] * (S @ x))
+
+    diag = St @ winv
+    x = np.zeros_like(rhs)
+    r = rhs.copy()
+    z = r / diag[:, None]
+    p = z.copy()
+    rz = (r * z).sum(axis=0)
+    norm = np.maximum(np.linalg.norm(rhs, axis=0), 1e-300)
+    for _ in range(S.shape[1]):
+        if (np.linalg.norm(r, axis=0) <= CG_TOL * norm).all():
+            break
+        q = apply(p)
+        step = rz / np.where((p * q).sum(axis=0) == 0, 1.0, (p * q).sum(axis=0))
+        x += step * p
+        r -= step * q
+        z = r / diag[:, None]
+        rz_new = (r * z).sum(axis=0)
+        p = z + (rz_new / np.where(rz == 0, 1.0, rz)) * p
+        rz = rz_new
+    return x
+
+
+def reconcile(base, S, method: str = "mint", variances=None, proportions=None) -> np.ndarray:
+    """Prévisions cohérentes (nœuds × horizons) à partir des prévisions de base.
+
+    - bottom_up : somme des prévisions des feuilles ;
+    - top_down : prévision du Total répartie selon `proportions` (une par feuille) ;
+    - mint : moindres carrés pondérés par l'inverse de `variances` (une par
+      nœud, estimateur diagonal de MinT), ou par le nombre de feuilles de
+      chaque nœud à défaut.
+    """
+    base = np.asarray(base, dtype=float)
+    n, m = S.shape
+    if method == "bottom_up":
+        bottom = base[n - m:]
+    elif method == "top_down":
+        if proportions is None:
+            raise ValueError("top_down : proportions des feuilles requises")
+        bottom = np.asarray(proportions, dtype=float)[:, None] * base[0]
+    elif method == "mint":
+        if variances is None:
+            variances = np.asarray(S.sum(axis=1)).ravel()
+        variances = np.asarray(variances, dtype=float)
+        positive = variances[np.isfinite(variances) & (variances > 0)]
+        floor = positive.min() * 1e-6 if positive.size else 1.0
+        winv = 1.0 / np.where(np.isfinite(variances) & (variances > 0), variances, floor)
+        bottom = _solve_normal(S, winv, S.T @ (winv[:, None] * base))
+    else:
+        raise ValueError(f"Méthode inconnue : {method} (attendu : {', '.join(METHODS)})")
+    return S @ bottom
+
+
+def historical_proportions(history: pd.DataFrame, S) -> np.ndarray:
+    """Part moyenne de chaque feuille dans le Total sur l'historique."""
+    n, m = S.shape
+    total = history.iloc[:, 0].sum()
+    leaves = history.iloc[:, n - m:].sum().to_numpy()
+    return leaves / total if total else np.full(m, 1.0 / m)
+
+
+def reconcile_forecasts(forecasts: dict, history: pd.DataFrame, S, method: str = "mint",
+                        variances=None) -> dict:
+    """Réconcilie un dictionnaire {nœud: série prévue} (nœuds numérotés comme S).
+
+    Les prévisions sont alignées par pas d'horizon (même nombre de pas) ;
+    l'index du résultat est celui du Total.
+    """
+    ids = sorted(forecasts)
+    index = forecasts[ids[0]].index
+    base = np.vstack([forecasts[i].to_numpy(dtype=float) for i in ids])
+    proportions = historical_proportions(history, S) if method == "top_down" else None
+    coherent = reconcile(base, S, method, variances, proportions)
+    return {i: pd.Series(coherent[i], index=index, name=forecasts[i].name) for i in ids}
@@ -0,0 +1,70 @@
+# =============================================================================
+# INGESTION EN MASSE DES BORDEREAUX
+# =============================================================================
+# Lit en parallèle tous les bordereaux d'un répertoire (ou d'un motif glob),
+# les valide contre SCHEMA et les écrit dans un seul dataset Parquet
+# partitionné, chaque ligne étant marquée par son fichier source.
+#
+# Usage : python ingest_bordereaux.py bordereaux/ --workers 4
+#         python ingest_bordereaux.py "bordereaux/CedantA_*.csv" --store .reassurance_store
+#         python ingest_bordereaux.py bordereaux/ --kpi-table kpi.csv --by date,lob
+#
+# Avec --kpi-table, l'état de l'agrégat est conservé entre deux exécutions
+# (--kpi-state) : seuls les fichiers nouveaux ou modifiés sont réagrégés.
+import argparse
+import json
+import sys
+
+import dataset_store
+import ingestion
+import kpi_engine
+
+
+def _progress(i: int, total: int, row: dict):
+    status = row["status"] if row["status"] == "ok" else f"{row['status']} ({row['error']})"
+    print(f"[{i}/{total}] {row['file']} : {row['rows']:,} lignes, {row['anomalies']:,} anomalies, "
+          f"{row['seconds']:.2f} s - {status}", file=sys.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Ingestion parallèle d'un répertoire de bordereaux")
+    parser.add_argument("source", help="Répertoire ou motif glob des bordereaux (CSV, Excel, Parquet)")
+    parser.add_argument("--store", default=dataset_store.DEFAULT_STORE_DIR, help="Répertoire du store Parquet")
+    parser.add_argument("--workers", type=int, default=None, help="Processus de lecture (défaut : nombre de cœurs)")
+    parser.add_argument("--mapping", help="Fichier JSON {colonne schéma: colonne source}")
+    parser.add_argument("--float32", action="store_true", help="Mesures flottantes en float32")
+    parser.add_argument("--kpi-table", help="Table KPI (CSV ou Parquet) agrégée au fil des fichiers lus")
+    parser.add_argument("--by", default="date", help="Dimensions de la table KPI, séparées par des virgules")
+    parser.add_argument("--kpi-state", help="État de l'agrégat entre deux exécutions "
+                                            "(défaut : <kpi-table>.state.pkl)")
+    args = parser.parse_args(argv)
+
+    mapping = None
+    if args.mapping:
+        with open(args.mapping, encoding="utf-8") as f:
+            mapping = json.load(f)
+    kpi_table, state_path = None, None
+    if args.kpi_table:
+        state_path = args.kpi_state or f"{args.kpi_table}.state.pkl"
+        kpi_table = ingestion.IncrementalKpiTable.load(state_path)
+        stale = [p for p in ingestion.list_bordereaux(args.source) if not kpi_table.is_current(p)]
+        print(f"Table KPI : {len(stale)} fichiers nouveaux ou modifiés à agréger", file=sys.stderr)
+    key, summary = ingestion.ingest_directory(
+        args.source, dataset_store.ParquetDatasetStore(args.store), args.workers,
+        mapping, _progress, args.float32, kpi_table,
+    )
+    if kpi_table is not None and key is not None:
+        kpi_table.save(state_path)
+        by = args.by.split(",")
+        kpi_engine.export_table(kpi_table.frame(by).sort_values(by), args.kpi_table)
+    print(summary.to_string(index=False), file=sys.stderr)
+    failed = int((summary["status"] != "ok").sum())
+    print(f"{len(summary)} fichiers, {int(summary['rows'].sum()):,} lignes, "
+          f"{summary['seconds'].sum():.2f} s cumulées, {failed} en erreur", file=sys.stderr)
+    if key is not None:
+        print(key)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
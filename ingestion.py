@@ -0,0 +1,417 @@
+# =============================================================================
+# INGESTION DES BORDEREAUX - TYPAGE ET CONTRÔLES
+# =============================================================================
+# Étapes appliquées aux données après le renommage via SCHEMA, sans
+# dépendance à Streamlit.
+import glob
+import io
+import json
+import os
+import pickle
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+import numpy as np
+import openpyxl
+import pandas as pd
+
+import column_mapping
+import dataset_store
+from kpi_engine import (DIMENSIONS, REQUIRED_BASE, SUM_MEASURES, IncrementalAggregator,
+                        add_month_start, apply_mapping, infer_date_col)
+
+# Dimensions qualitatives converties en catégories
+CATEGORY_COLUMNS = [d for d in DIMENSIONS if d != "date"]
+
+
+# =============================================================================
+# TYPAGE COMPACT
+# =============================================================================
+def compact_dtypes(df: pd.DataFrame, float32: bool = False) -> pd.DataFrame:
+    """Convertit les dimensions en catégories et réduit les types des mesures.
+
+    Les entiers (claims_count, exposure...) sont ramenés au plus petit type
+    entier suffisant. Les flottants restent en float64 sauf si float32=True.
+    """
+    out = df.copy(deep=False)
+    for col in CATEGORY_COLUMNS:
+        if col not in out.columns or isinstance(out[col].dtype, pd.CategoricalDtype):
+            continue
+        if pd.api.types.is_string_dtype(out[col].dtype):
+            out[col] = out[col].astype("category")
+    for col in SUM_MEASURES:
+        if col not in out.columns:
+            continue
+        kind = out[col].dtype.kind
+        if kind in "iu":
+            out[col] = pd.to_numeric(out[col], downcast="unsigned" if out[col].min() >= 0 else "integer")
+        elif kind == "f" and float32:
+            out[col] = out[col].astype(np.float32)
+    return out
+
+
+def memory_report(before: pd.DataFrame, after: pd.DataFrame) -> pd.DataFrame:
+    """Empreinte mémoire par colonne (Mo) avant/après, avec une ligne de total."""
+    mb_before = before.memory_usage(deep=True, index=False) / 1e6
+    mb_after = after.memory_usage(deep=True, index=False) / 1e6
+    report = pd.DataFrame({
+        "type_avant": before.dtypes.astype(str),
+        "type_apres": after.dtypes.reindex(before.columns).astype(str),
+        "mo_avant": mb_before,
+        "mo_apres": mb_after.reindex(before.columns),
+    })
+    report.loc["TOTAL"] = ["", "", mb_before.sum(), mb_after.sum()]
+    report["gain_%"] = (1 - report["mo_apres"] / report["mo_avant"].replace(0, np.nan)) * 100
+    return report
+
+
+# =============================================================================
+# VALIDATION ET COERCITION
+# =============================================================================
+# Montants qui ne peuvent pas être négatifs (les produits financiers le peuvent)
+NON_NEGATIVE_COLUMNS = [m for m in SUM_MEASURES if m != "investment_income"]
+REPORT_COLUMNS = ["regle", "colonne", "nb_lignes", "lignes"]
+
+
+def _to_numeric(s: pd.Series):
+    """Conversion numérique ; les échecs sont retentés au format français ("1 234,5").
+
+    Retourne (série numérique, masque des valeurs non convertibles).
+    """
+    num = pd.to_numeric(s, errors="coerce")
+    failed = num.isna().to_numpy() & s.notna().to_numpy()
+    if failed.any():
+        retry = (s[failed].astype(str)
+                 .str.replace("[\\s\u00a0\u202f]", "", regex=True)
+                 .str.replace(",", ".", regex=False))
+        fixed = pd.to_numeric(retry, errors="coerce")
+        num = num.astype(np.float64)
+        num[failed] = fixed.to_numpy()
+        failed[failed] = fixed.isna().to_numpy()
+    return num, failed
+
+
+def validate_frame(df: pd.DataFrame, max_examples: int = 10):
+    """Coerce les mesures SCHEMA en numérique et signale les anomalies, en un passage.
+
+    Règles : valeur non numérique, montant négatif, sinistres payés
+    supérieurs aux sinistres encourus, prime acquise nulle, date manquante.
+    Retourne (DataFrame coercé, rapport) ; le rapport compte une ligne par
+    règle et colonne en anomalie, avec le nombre de lignes et les premiers
+    index concernés. Les valeurs non convertibles deviennent NaN.
+    """
+    out = df.copy(deep=False)
+    checks = []
+    values = {}
+    for col in SUM_MEASURES:
+        if col not in out.columns:
+            continue
+        if out[col].dtype.kind not in "iufb":
+            out[col], failed = _to_numeric(out[col])
+            checks.append(("non_numerique", col, failed))
+        values[col] = out[col].to_numpy(dtype=np.float64, na_value=np.nan)
+
+    with np.errstate(invalid="ignore"):
+        for col in NON_NEGATIVE_COLUMNS:
+            if col in values:
+                checks.append(("montant_negatif", col, values[col] < 0))
+        if "paid_claims" in values and "incurred_claims" in values:
+            checks.append(("paye_superieur_encouru", "paid_claims",
+                           values["paid_claims"] > values["incurred_claims"]))
+        if "earned_premium" in values:
+            checks.append(("prime_acquise_nulle", "earned_premium", values["earned_premium"] == 0))
+    if "date" in out.columns:
+        checks.append(("date_manquante", "date", out["date"].isna().to_numpy()))
+
+    rows = []
+    for rule, col, mask in checks:
+        hits = np.flatnonzero(mask)
+        if len(hits):
+            rows.append([rule, col, len(hits), out.index[hits[:max_examples]].tolist()])
+    return out, pd.DataFrame(rows, columns=REPORT_COLUMNS)
+
+
+# =============================================================================
+# RAPPORTS DE CHARGEMENT
+# =============================================================================
+LOAD_REPORTS = ("validation", "memory")
+
+
+def reports_to_meta(validation: pd.DataFrame, memory: pd.DataFrame) -> dict:
+    """Rapports de validation et d'empreinte mémoire, sérialisés pour les
+    métadonnées JSON d'un dataset (relus à chaque ouverture)."""
+    reports = dict(zip(LOAD_REPORTS, (validation, memory)))
+    return {"load_reports": {name: json.loads(rep.to_json(orient="split")) for name, rep in reports.items()}}
+
+
+def reports_from_meta(meta: dict):
+    """(validation, memory) relus depuis les métadonnées d'un dataset ; None si absents."""
+    stored = meta.get("load_reports") or {}
+    return tuple(pd.DataFrame(**stored[name]) if name in stored else None for name in LOAD_REPORTS)
+
+
+# =============================================================================
+# CLASSEURS EXCEL MULTI-FEUILLES
+# =============================================================================
+def _read_sheet(data: bytes, sheet: str, mapping: dict, chunk_rows: int):
+    """Lit une feuille en lecture seule, ligne à ligne, par blocs de `chunk_rows`."""
+    t0 = time.perf_counter()
+    wb = openpyxl.load_workbook(io.BytesIO(data), read_only=True, data_only=True)
+    try:
+        rows = wb[sheet].iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return None, time.perf_counter() - t0
+        header = [f"col_{i}" if h is None else str(h) for i, h in enumerate(header)]
+        chunks, buf = [], []
+        for row in rows:
+            if any(v is not None for v in row):
+                buf.append(row)
+            if len(buf) >= chunk_rows:
+                chunks.append(pd.DataFrame.from_records(buf, columns=header))
+                buf = []
+        if buf or not chunks:
+            chunks.append(pd.DataFrame.from_records(buf, columns=header))
+    finally:
+        wb.close()
+    frame = pd.concat(chunks, ignore_index=True) if len(chunks) > 1 else chunks[0]
+    if mapping is not None:
+        frame = apply_mapping(frame, mapping)
+    frame["source_sheet"] = sheet
+    return frame, time.perf_counter() - t0
+
+
+def read_excel_streaming(source, mapping: dict = None, sheets=None, workers: int = 4,
+                         chunk_rows: int = 10_000, float32: bool = False,
+                         measure_memory: bool = False):
+    """Charge un classeur multi-feuilles (une feuille par année ou par LOB).
+
+    Chaque feuille est lue en mode lecture seule (sans construire le modèle
+    complet du classeur) dans un thread. Les feuilles sont concaténées, avec
+    une colonne source_sheet. Avec `mapping`, les colonnes sont renommées
+    vers SCHEMA puis typées par compact_dtypes ; sans `mapping`, les en-têtes
+    d'origine sont conservés et le typage est laissé à l'appelant, une fois
+    le mapping confirmé. Retourne (DataFrame, rapport) ; le rapport donne
+    lignes et secondes par feuille, et une ligne TOTAL avec le pic mémoire
+    (Mo, mesuré si measure_memory=True).
+    """
+    if isinstance(source, (bytes, bytearray)):
+        data = bytes(source)
+    elif hasattr(source, "getvalue"):
+        data = source.getvalue()
+    elif hasattr(source, "read"):
+        data = source.read()
+    else:
+        with open(source, "rb") as f:
+            data = f.read()
+
+    t0 = time.perf_counter()
+    if measure_memory:
+        tracemalloc.start()
+    try:
+        if sheets is None:
+            wb = openpyxl.load_workbook(io.BytesIO(data), read_only=True)
+            sheets = wb.sheetnames
+            wb.close()
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(sheets)))) as pool:
+            results = list(pool.map(lambda sh: _read_sheet(data, sh, mapping, chunk_rows), sheets))
+        frames = [frame for frame, _ in results if frame is not None]
+        df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+        if mapping is not None:
+            df = compact_dtypes(df, float32=float32)
+        peak = tracemalloc.get_traced_memory()[1] / 1e6 if measure_memory else np.nan
+    finally:
+        if measure_memory:
+            tracemalloc.stop()
+
+    report = pd.DataFrame({
+        "lignes": [0 if frame is None else len(frame) for frame, _ in results],
+        "secondes": [seconds for _, seconds in results],
+        "pic_mo": np.nan,
+    }, index=list(sheets))
+    report.loc["TOTAL"] = [len(df), time.perf_counter() - t0, peak]
+    return df, report
+
+
+# =============================================================================
+# INGESTION D'UN RÉPERTOIRE DE BORDEREAUX
+# =============================================================================
+BORDEREAU_EXTENSIONS = (".csv", ".xlsx", ".xlsm", ".parquet")
+SUMMARY_COLUMNS = ["file", "rows", "anomalies", "status", "error", "seconds"]
+
+
+def list_bordereaux(source: str) -> list:
+    """Fichiers d'un répertoire, ou correspondant à un motif glob, triés par nom."""
+    pattern = os.path.join(source, "*") if os.path.isdir(source) else source
+    return sorted(p for p in glob.glob(pattern) if p.lower().endswith(BORDEREAU_EXTENSIONS))
+
+
+def load_bordereau(path: str, mapping: dict = None) -> pd.DataFrame:
+    """Lit un bordereau, le renomme vers SCHEMA, vérifie les colonnes obligatoires,
+    normalise ses dates et valide ses mesures. Chaque ligne est marquée par son
+    fichier source ; le rapport de validation est dans attrs["validation"]."""
+    if path.lower().endswith((".xlsx", ".xlsm")):
+        raw, _ = read_excel_streaming(path, workers=1)
+    elif path.lower().endswith(".parquet"):
+        raw = pd.read_parquet(path)
+    else:
+        raw = pd.read_csv(path)
+    if mapping is None:
+        mapping, _ = column_mapping.suggest_mapping(raw.columns, column_mapping.MappingProfileStore())
+    df = apply_mapping(raw, mapping)
+    missing = [c for c in REQUIRED_BASE if c not in df.columns]
+    if missing:
+        raise ValueError(f"Colonnes obligatoires absentes : {missing}")
+    df["date"] = infer_date_col(df["date"])
+    df, report = validate_frame(df)
+    df = add_month_start(df)
+    df["source_file"] = os.path.basename(path)
+    df.attrs["validation"] = report
+    return df
+
+
+def _load_timed(path: str, mapping: dict):
+    """load_bordereau avec chronométrage ; une erreur est rapportée, pas levée."""
+    t0 = time.perf_counter()
+    row = {"file": os.path.basename(path), "rows": 0, "anomalies": 0, "status": "ok", "error": ""}
+    df = None
+    try:
+        df = load_bordereau(path, mapping)
+        row["rows"] = len(df)
+        row["anomalies"] = int(df.attrs.pop("validation")["nb_lignes"].sum())
+    except Exception as exc:
+        row["status"] = "erreur"
+        row["error"] = f"{type(exc).__name__}: {exc}"
+    row["seconds"] = round(time.perf_counter() - t0, 3)
+    return df, row
+
+
+class IncrementalKpiTable:
+    """Agrégat KPI tenu à jour d'une ingestion à l'autre, fichier par fichier.
+
+    Chaque fichier est repéré par son nom, sa taille et sa date de
+    modification. Un fichier déjà agrégé et inchangé est ignoré ; un fichier
+    modifié est retraité (ses anciennes sommes, conservées par fichier, sont
+    retirées avant l'ajout des nouvelles) ; un fichier disparu est retiré.
+    Seuls les groupes touchés sont recalculés (IncrementalAggregator).
+    L'état est conservé entre deux exécutions par save/load.
+    """
+
+    def __init__(self, key=None):
+        self.aggregator = IncrementalAggregator(key)
+        self.files = {}   # nom -> {"stamp": [taille, date], "sums": sommes du fichier par clé}
+
+    @staticmethod
+    def _stamp(path: str) -> list:
+        return [os.path.getsize(path), os.path.getmtime(path)]
+
+    def is_current(self, path: str) -> bool:
+        """Vrai si le fichier est déjà agrégé dans sa version actuelle."""
+        known = self.files.get(os.path.basename(path))
+        return known is not None and known["stamp"] == self._stamp(path)
+
+    def update(self, path: str, df: pd.DataFrame) -> bool:
+        """Agrège le fichier s'il est nouveau ou modifié ; retourne True s'il l'a été."""
+        if self.is_current(path):
+            return False
+        old = self.files.pop(os.path.basename(path), None)
+        if old is not None:
+            self.aggregator.retract(old["sums"])
+        self.aggregator.append(df)
+        measures = [m for m in self.aggregator.measures if m in df.columns]
+        sums = df.groupby(self.aggregator.key, dropna=False, observed=True)[measures].sum().reset_index()
+        self.files[os.path.basename(path)] = {"stamp": self._stamp(path), "sums": sums}
+        return True
+
+    def prune(self, names) -> list:
+        """Retire les fichiers agrégés absents de `names` ; retourne leurs noms."""
+        gone = [name for name in self.files if name not in set(names)]
+        for name in gone:
+            self.aggregator.retract(self.files.pop(name)["sums"])
+        return gone
+
+    def frame(self, by=["date"]) -> pd.DataFrame:
+        return self.aggregator.frame(by)
+
+    def save(self, path: str):
+        """Écrit l'état (fichier temporaire puis remplacement atomique)."""
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str) -> "IncrementalKpiTable":
+        """État enregistré par save, ou table vide s'il n'existe pas encore."""
+        if not os.path.exists(path):
+            return cls()
+        with open(path, "rb") as f:
+            return pickle.load(f)
+
+
+def ingest_directory(source: str, store: "dataset_store.ParquetDatasetStore" = None,
+                     workers: int = None, mapping: dict = None, progress=None,
+                     float32: bool = False, kpi_table: IncrementalKpiTable = None):
+    """Ingère tous les bordereaux d'un répertoire (ou d'un motif glob) dans un seul dataset.
+
+    Les fichiers sont lus en parallèle dans un pool de processus ; `progress`,
+    s'il est fourni, est appelé avec (fichiers traités, total, ligne de
+    synthèse) à chaque fichier terminé. Avec `kpi_table`, seuls les fichiers
+    nouveaux ou modifiés depuis la dernière ingestion y sont (ré)agrégés, dès
+    leur lecture ; les fichiers disparus ou en erreur en sont retirés.
+    Les fichiers valides sont concaténés,
+    typés par compact_dtypes et écrits dans le store Parquet partitionné.
+    Retourne (clé du dataset ou None si aucun fichier valide, synthèse par fichier).
+    """
+    paths = list_bordereaux(source)
+    if not paths:
+        raise FileNotFoundError(f"Aucun bordereau trouvé pour {source!r}")
+    store = store or dataset_store.ParquetDatasetStore()
+    workers = workers or os.cpu_count() or 1
+
+    frames, rows = [], []
+
+    by_name = {os.path.basename(p): p for p in paths}
+
+    def collect(df, row):
+        if df is not None and kpi_table is not None:
+            try:
+                kpi_table.update(by_name[row["file"]], df)
+            except Exception as exc:
+                # Fichier incompatible avec l'agrégat : écarté et signalé, les autres continuent
+                row.update(status="erreur", error=f"KPI : {type(exc).__name__}: {exc}")
+                df = None
+        rows.append(row)
+        if df is not None:
+            frames.append(df)
+        if progress is not None:
+            progress(len(rows), len(paths), row)
+
+    if workers == 1 or len(paths) == 1:
+        for path in paths:
+            collect(*_load_timed(path, mapping))
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(paths))) as pool:
+            futures = [pool.submit(_load_timed, path, mapping) for path in paths]
+            for fut in as_completed(futures):
+                collect(*fut.result())
+
+    summary = pd.DataFrame(rows, columns=SUMMARY_COLUMNS).sort_values("file", ignore_index=True)
+    if kpi_table is not None:
+        kpi_table.prune(summary.loc[summary["status"] == "ok", "file"])
+    if not frames:
+        return None, summary
+
+    df = pd.concat(frames, ignore_index=True)
+    df["source_file"] = df["source_file"].astype("category")
+    df = compact_dtypes(df, float32=float32)
+
+    # Le dataset est identifié par les fichiers ingérés avec succès (nom, taille, date de modification)
+    ingested = set(summary.loc[summary["status"] == "ok", "file"])
+    stamp = [(os.path.basename(p), os.path.getsize(p), os.path.getmtime(p))
+             for p in paths if os.path.basename(p) in ingested]
+    key = dataset_store.content_fingerprint(json.dumps(stamp).encode("utf-8"),
+                                            {"mapping": mapping, "float32": float32})
+    store.write(df, key, meta={"files": sorted(ingested)})
+    return key, summary
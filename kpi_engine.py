@@ -0,0 +1,775 @@
+# =============================================================================
+# MOTEUR KPI - CALCULS COLONNAIRES SANS INTERFACE
+# =============================================================================
+# Ce module ne dépend ni de Streamlit ni de Plotly : il peut être importé par
+# les scripts de l'application comme par des traitements batch.
+import numpy as np
+import pandas as pd
+
+# Colonnes KPI produites par compute_kpis, dans l'ordre historique
+KPI_COLUMNS = [
+    "loss_ratio", "acq_ratio", "adm_ratio", "expense_ratio", "combined_ratio",
+    "operating_ratio", "cession_ratio", "retention_ratio", "frequency", "severity",
+    "total_reserves", "reserve_coverage", "solvency_ratio",
+]
+
+
+# Schéma de mapping des colonnes (identique à celui des scripts Streamlit)
+SCHEMA = {
+    "date": ["date", "period", "periode", "month", "quarter", "year"],
+    "lob": ["lob", "branche", "line_of_business"],
+    "region": ["region", "zone", "pays", "geography"],
+    "cedant": ["cedant", "cedente", "ceding_company"],
+    "gross_premium": ["gross_premium", "primes_brutes", "gwp"],
+    "ceded_premium": ["ceded_premium", "primes_cedees", "ceded"],
+    "earned_premium": ["earned_premium", "primes_acquises", "ep"],
+    "incurred_claims": ["incurred_claims", "sinistres_encourus", "icl"],
+    "paid_claims": ["paid_claims", "sinistres_payes", "pcl"],
+    "ibnr": ["ibnr", "reserves_ibnr"],
+    "rbns": ["rbns", "reserves_rbns"],
+    "acq_expense": ["acq_expense", "frais_acquisition"],
+    "adm_expense": ["adm_expense", "frais_admin", "g&a"],
+    "investment_income": ["investment_income", "produits_financiers"],
+    "claims_count": ["claims_count", "nombre_sinistres"],
+    "exposure": ["exposure", "exposition", "policies", "risks"],
+    "scr": ["scr", "exigence_capital"],
+    "own_funds": ["own_funds", "fonds_propres"],
+}
+
+REQUIRED_BASE = ["date", "earned_premium", "incurred_claims"]
+
+
+# =============================================================================
+# PRÉPARATION DES DONNÉES
+# =============================================================================
+def auto_map_columns(df: pd.DataFrame):
+    """Détecte automatiquement les correspondances colonnes utilisateur -> schéma."""
+    mapping = {}
+    cols_lower = {c.lower(): c for c in df.columns}
+    for key, aliases in SCHEMA.items():
+        found = None
+        for a in aliases:
+            if a in cols_lower:
+                found = cols_lower[a]
+                break
+        mapping[key] = found
+    return mapping
+
+
+def apply_mapping(df: pd.DataFrame, mapping: dict) -> pd.DataFrame:
+    """Renomme les colonnes utilisateur vers les noms du schéma."""
+    rename_dict = {v: k for k, v in mapping.items() if v is not None}
+    return df.rename(columns=rename_dict)
+
+
+def _legacy_infer_date_col(s: pd.Series) -> pd.Series:
+    """Parsing générique historique, utilisé quand aucun format n'est reconnu."""
+    try:
+        parsed = pd.to_datetime(s, errors="coerce", dayfirst=True)
+        if parsed.notna().mean() > 0.6:
+            return parsed
+    except Exception:
+        pass
+    if s.dtype.kind in "if":
+        return pd.to_datetime(s.astype(int).astype(str) + "-01-01", errors="coerce")
+    return pd.to_datetime(s, errors="coerce")
+
+
+def _parse_quarters(values: pd.Series) -> pd.Series:
+    """'2024Q1', '2024-Q1', 'Q1 2024' -> premier jour du trimestre."""
+    parts = values.str.extract(r"^(\d{4})\s*[-/ ]?\s*[Qq]([1-4])$|^[Qq]([1-4])\s*[-/ ]?\s*(\d{4})$")
+    year = parts[0].fillna(parts[3])
+    quarter = parts[1].fillna(parts[2])
+    month = (quarter.astype(float) - 1) * 3 + 1
+    return pd.to_datetime(year + "-" + month.map("{:02.0f}".format, na_action="ignore"),
+                          format="%Y-%m", errors="coerce")
+
+
+def _parse_fiscal_years(values: pd.Series) -> pd.Series:
+    """'FY2024', 'FY24', '2023/2024', '2023-24' -> 1er janvier de la première année."""
+    parts = values.str.extract(r"^(?:[Ff][Yy]|[Ee][Xx])\s*-?\s*(\d{4}|\d{2})$|^(\d{4})\s*[-/]\s*(?:\d{4}|\d{2})$")
+    year = parts[0].fillna(parts[1])
+    short = year.str.len() == 2
+    year = year.where(~short, "20" + year)
+    return pd.to_datetime(year, format="%Y", errors="coerce")
+
+
+def _parse_excel_serials(values: pd.Series) -> pd.Series:
+    """Numéros de série Excel (jours depuis le 30/12/1899)."""
+    return pd.to_datetime(pd.to_numeric(values, errors="coerce"), unit="D", origin="1899-12-30")
+
+
+# Formats reconnus : (motif sur l'échantillon, format strptime ou fonction de parsing)
+_DATE_FORMATS = [
+    (r"^\d{4}-\d{1,2}-\d{1,2}$", "%Y-%m-%d"),
+    (r"^\d{4}-\d{2}-\d{2}[ T]\d{2}:\d{2}(:\d{2}(\.\d+)?)?$", "ISO8601"),
+    (r"^\d{4}/\d{1,2}/\d{1,2}$", "%Y/%m/%d"),
+    (r"^\d{1,2}/\d{1,2}/\d{4}$", "%d/%m/%Y"),
+    (r"^\d{1,2}-\d{1,2}-\d{4}$", "%d-%m-%Y"),
+    (r"^\d{1,2}\.\d{1,2}\.\d{4}$", "%d.%m.%Y"),
+    (r"^\d{4}-\d{1,2}$", "%Y-%m"),
+    (r"^\d{4}/\d{1,2}$", "%Y/%m"),
+    (r"^\d{1,2}/\d{4}$", "%m/%Y"),
+    (r"^\d{4}$", "%Y"),
+    (r"^(\d{4}\s*[-/ ]?\s*[Qq][1-4]|[Qq][1-4]\s*[-/ ]?\s*\d{4})$", _parse_quarters),
+    (r"^([Ff][Yy]|[Ee][Xx])\s*-?\s*(\d{4}|\d{2})$|^\d{4}\s*[-/]\s*(\d{4}|\d{2})$", _parse_fiscal_years),
+    (r"^\d{5}(\.\d+)?$", _parse_excel_serials),
+]
+
+
+def sniff_date_format(sample: pd.Series):
+    """Format de date reconnu sur un échantillon de chaînes, sinon None.
+
+    Retourne un format strptime (ou "ISO8601") ou une fonction de parsing.
+    Pour les dates jour/mois ambiguës, le jour est supposé en premier
+    (comme dayfirst=True) sauf si l'échantillon montre un mois > 12.
+    """
+    sample = sample.dropna().astype(str).str.strip()
+    if sample.empty:
+        return None
+    best, best_share = None, 0.6
+    for pattern, fmt in _DATE_FORMATS:
+        share = sample.str.match(pattern).mean()
+        if share > best_share:
+            best, best_share = fmt, share
+    if isinstance(best, str) and best.startswith("%d"):
+        sep = best[2]
+        fields = sample.str.split(sep, expand=True, regex=False)
+        first = pd.to_numeric(fields[0], errors="coerce")
+        second = pd.to_numeric(fields[1], errors="coerce")
+        if not (first > 12).any() and (second > 12).any():
+            best = f"%m{sep}%d{sep}%Y"
+    return best
+
+
+def infer_date_col(s: pd.Series, sample_size: int = 500) -> pd.Series:
+    """Tente de parser une colonne date.
+
+    Le format est détecté sur un échantillon de valeurs distinctes (dates
+    ISO ou jour/mois, années, trimestres '2024Q1', exercices 'FY2024',
+    numéros de série Excel), puis seules les valeurs distinctes sont
+    parsées avec ce format explicite et recopiées sur les lignes. Sans
+    format reconnu, le parsing générique historique s'applique.
+    """
+    if pd.api.types.is_datetime64_any_dtype(s):
+        return s
+    if s.dtype.kind in "iuf":
+        values = s.dropna()
+        if len(values) and (values % 1 == 0).all():
+            if values.between(1800, 2200).all():
+                return pd.to_datetime(s.astype("Int64").astype(str), format="%Y", errors="coerce")
+            if values.between(10_000, 80_000).all():
+                return pd.to_datetime(s, unit="D", origin="1899-12-30")
+        return _legacy_infer_date_col(s)
+
+    codes, uniques = pd.factorize(s)
+    uniques = pd.Series(uniques)
+    fmt = sniff_date_format(uniques.iloc[:sample_size])
+    if fmt is None:
+        parsed = _legacy_infer_date_col(uniques)
+    else:
+        text = uniques.astype(str).str.strip()
+        parsed = fmt(text) if callable(fmt) else pd.to_datetime(text, format=fmt, errors="coerce")
+    # Le code -1 (valeur manquante) pointe sur le NaT ajouté en fin de tableau
+    values = np.append(parsed.to_numpy(), np.datetime64("NaT"))
+    return pd.Series(values[codes], index=s.index, name=s.name)
+
+
+def add_month_start(df: pd.DataFrame) -> pd.DataFrame:
+    """Aligne les dates sur le début de mois."""
+    out = df.copy()
+    out["date"] = pd.to_datetime(out["date"], errors="coerce").dt.to_period("M").dt.to_timestamp()
+    return out
+
+
+def prepare_frame(df_raw: pd.DataFrame, mapping: dict = None) -> pd.DataFrame:
+    """Renomme selon le mapping (auto_map_columns par défaut) et normalise les dates."""
+    if mapping is None:
+        mapping = auto_map_columns(df_raw)
+    df = apply_mapping(df_raw, mapping)
+    missing = [c for c in REQUIRED_BASE if c not in df.columns]
+    if missing:
+        raise KeyError(f"Colonnes obligatoires absentes : {missing}")
+    df["date"] = infer_date_col(df["date"])
+    return add_month_start(df)
+
+
+# =============================================================================
+# OUTILS BAS NIVEAU
+# =============================================================================
+def _column(df: pd.DataFrame, name: str):
+    """Retourne la colonne sous forme de buffer float64 contigu (sans copie si possible)."""
+    if name not in df.columns:
+        return None
+    s = df[name]
+    if s.dtype == np.float64:
+        return np.ascontiguousarray(s.to_numpy())
+    return np.ascontiguousarray(s.to_numpy(dtype=np.float64, na_value=np.nan))
+
+
+def _safe_divide(num, den, out: np.ndarray, mask: np.ndarray) -> np.ndarray:
+    """Division num / den écrite dans `out`, NaN si le dénominateur est nul.
+
+    `mask` est un buffer booléen de travail réutilisé d'un appel à l'autre :
+    aucune série intermédiaire n'est allouée.
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        np.divide(num, den, out=out)
+    np.equal(den, 0.0, out=mask)
+    np.copyto(out, np.nan, where=mask)
+    return out
+
+
+def _add_fill_zero(a: np.ndarray, b: np.ndarray, out: np.ndarray, mask: np.ndarray) -> np.ndarray:
+    """Équivalent de a.fillna(0) + b.fillna(0), écrit dans `out`."""
+    if out is not a:
+        np.copyto(out, a)
+    np.isnan(out, out=mask)
+    np.copyto(out, 0.0, where=mask)
+    np.isnan(b, out=mask)
+    np.logical_not(mask, out=mask)
+    np.add(out, b, out=out, where=mask)
+    return out
+
+
+# =============================================================================
+# REGISTRE DES KPI
+# =============================================================================
+class KpiDefinition:
+    """Définition d'un KPI : colonnes d'entrée, KPI prérequis et noyau de calcul.
+
+    `func(cols, out, mask)` écrit le KPI dans le buffer `out`. `cols[nom]`
+    renvoie une colonne d'entrée en float64 (None pour une entrée optionnelle
+    absente) ou un KPI prérequis déjà calculé.
+    """
+
+    def __init__(self, name: str, func, requires=(), optional=(), deps=()):
+        self.name = name
+        self.func = func
+        self.requires = tuple(requires)
+        self.optional = tuple(optional)
+        self.deps = tuple(deps)
+
+
+# KPI connus, dans l'ordre des colonnes produites par compute_kpis
+KPI_REGISTRY = {}
+
+
+def register_kpi(name: str, func, requires=(), optional=(), deps=()) -> KpiDefinition:
+    """Ajoute (ou remplace) un KPI dans le registre.
+
+    `requires` : colonnes sans lesquelles le KPI n'est pas produit ;
+    `optional` : colonnes lues si présentes ; `deps` : KPI prérequis.
+    """
+    unknown = [d for d in deps if d not in KPI_REGISTRY]
+    if unknown:
+        raise KeyError(f"KPI prérequis inconnus : {unknown}")
+    KPI_REGISTRY[name] = KpiDefinition(name, func, requires, optional, deps)
+    return KPI_REGISTRY[name]
+
+
+def register_ratio(name: str, numerator: str, denominator: str) -> KpiDefinition:
+    """Enregistre un ratio numérateur / dénominateur (NaN si le dénominateur est nul).
+
+    Numérateur et dénominateur peuvent être des colonnes ou des KPI déjà enregistrés.
+    """
+    deps = [c for c in (numerator, denominator) if c in KPI_REGISTRY]
+    requires = [c for c in (numerator, denominator) if c not in KPI_REGISTRY]
+
+    def ratio(cols, out, mask):
+        _safe_divide(cols[numerator], cols[denominator], out, mask)
+    return register_kpi(name, ratio, requires=requires, deps=deps)
+
+
+def _or_zero(a):
+    return 0.0 if a is None else a
+
+
+def _kpi_loss_ratio(c, out, mask):
+    _safe_divide(c["incurred_claims"], c["earned_premium"], out, mask)
+
+
+def _kpi_acq_ratio(c, out, mask):
+    _safe_divide(_or_zero(c["acq_expense"]), c["earned_premium"], out, mask)
+
+
+def _kpi_adm_ratio(c, out, mask):
+    _safe_divide(_or_zero(c["adm_expense"]), c["earned_premium"], out, mask)
+
+
+def _kpi_expense_ratio(c, out, mask):
+    _add_fill_zero(c["acq_ratio"], c["adm_ratio"], out, mask)
+
+
+def _kpi_combined_ratio(c, out, mask):
+    _add_fill_zero(c["expense_ratio"], c["loss_ratio"], out, mask)
+
+
+def _kpi_operating_ratio(c, out, mask):
+    # operating = combined - investment_income / ep
+    _safe_divide(_or_zero(c["investment_income"]), c["earned_premium"], out, mask)
+    np.subtract(c["combined_ratio"], out, out=out)
+
+
+def _kpi_cession_ratio(c, out, mask):
+    gwp = c["gross_premium"]
+    if gwp is None:
+        out.fill(np.nan)
+    else:
+        _safe_divide(_or_zero(c["ceded_premium"]), gwp, out, mask)
+
+
+def _kpi_retention_ratio(c, out, mask):
+    gwp, ced = c["gross_premium"], c["ceded_premium"]
+    if gwp is None:
+        out.fill(np.nan)
+        return
+    if ced is None:
+        np.copyto(out, gwp)
+    else:
+        np.subtract(gwp, ced, out=out)
+    _safe_divide(out, gwp, out, mask)
+
+
+def _kpi_frequency(c, out, mask):
+    _safe_divide(c["claims_count"], c["exposure"], out, mask)
+
+
+def _kpi_severity(c, out, mask):
+    _safe_divide(c["incurred_claims"], c["claims_count"], out, mask)
+
+
+def _kpi_total_reserves(c, out, mask):
+    _add_fill_zero(c["ibnr"], c["rbns"], out, mask)
+
+
+def _kpi_reserve_coverage(c, out, mask):
+    _safe_divide(c["total_reserves"], c["incurred_claims"], out, mask)
+
+
+def _kpi_solvency_ratio(c, out, mask):
+    _safe_divide(c["own_funds"], c["scr"], out, mask)
+
+
+_EP = ("earned_premium",)
+register_kpi("loss_ratio", _kpi_loss_ratio, requires=("earned_premium", "incurred_claims"))
+register_kpi("acq_ratio", _kpi_acq_ratio, requires=_EP, optional=("acq_expense",))
+register_kpi("adm_ratio", _kpi_adm_ratio, requires=_EP, optional=("adm_expense",))
+register_kpi("expense_ratio", _kpi_expense_ratio, deps=("acq_ratio", "adm_ratio"))
+register_kpi("combined_ratio", _kpi_combined_ratio, deps=("loss_ratio", "expense_ratio"))
+register_kpi("operating_ratio", _kpi_operating_ratio, requires=_EP,
+             optional=("investment_income",), deps=("combined_ratio",))
+register_kpi("cession_ratio", _kpi_cession_ratio, optional=("gross_premium", "ceded_premium"))
+register_kpi("retention_ratio", _kpi_retention_ratio, optional=("gross_premium", "ceded_premium"))
+register_kpi("frequency", _kpi_frequency, requires=("claims_count", "exposure"))
+register_kpi("severity", _kpi_severity, requires=("incurred_claims", "claims_count"))
+register_kpi("total_reserves", _kpi_total_reserves, requires=("ibnr", "rbns"))
+register_kpi("reserve_coverage", _kpi_reserve_coverage, requires=("incurred_claims",),
+             deps=("total_reserves",))
+register_kpi("solvency_ratio", _kpi_solvency_ratio, requires=("own_funds", "scr"))
+
+
+def _available_kpis(columns) -> set:
+    """KPI calculables avec ces colonnes d'entrée."""
+    cols = set(columns)
+    available = set()
+    pending = list(KPI_REGISTRY.values())
+    progress = True
+    while progress:
+        progress = False
+        for kd in list(pending):
+            if cols.issuperset(kd.requires) and available.issuperset(kd.deps):
+                available.add(kd.name)
+                pending.remove(kd)
+                progress = True
+    return available
+
+
+def _resolve(names) -> list:
+    """KPI demandés et leurs prérequis, dans un ordre de calcul valide."""
+    order, seen = [], set()
+
+    def visit(name):
+        if name in seen:
+            return
+        seen.add(name)
+        for dep in KPI_REGISTRY[name].deps:
+            visit(dep)
+        order.append(name)
+
+    for name in names:
+        visit(name)
+    return order
+
+
+def kpi_columns_for(columns, kpis=None) -> list:
+    """Liste des colonnes KPI que compute_kpis produira pour ces colonnes d'entrée.
+
+    Sans `kpis`, tous les KPI calculables ; sinon ceux de `kpis` qui sont
+    calculables, dans l'ordre du registre.
+    """
+    if kpis is not None:
+        unknown = [k for k in kpis if k not in KPI_REGISTRY]
+        if unknown:
+            raise KeyError(f"KPI inconnus : {unknown}")
+    available = _available_kpis(columns)
+    wanted = KPI_REGISTRY if kpis is None else set(kpis)
+    return [name for name in KPI_REGISTRY if name in wanted and name in available]
+
+
+class _KpiInputs(dict):
+    """Colonnes d'entrée chargées à la demande, puis KPI calculés."""
+
+    def __init__(self, df: pd.DataFrame):
+        super().__init__()
+        self.df = df
+
+    def __missing__(self, name):
+        value = self[name] = _column(self.df, name)
+        return value
+
+
+# =============================================================================
+# NOYAU KPI
+# =============================================================================
+def compute_kpi_block(df: pd.DataFrame, kpis=None):
+    """Calcule les KPI dans un bloc préalloué de forme (n_kpi, n_lignes).
+
+    Chaque ligne du bloc est un buffer contigu ; les divisions et les
+    remplacements de NaN sont faits en place. Avec `kpis`, seuls ces KPI et
+    leurs prérequis sont calculés ; les prérequis non demandés utilisent des
+    buffers temporaires. Retourne (noms, bloc).
+    """
+    if kpis is None:
+        for col in ("earned_premium", "incurred_claims"):
+            if col not in df.columns:
+                raise KeyError(col)
+    names = kpi_columns_for(df.columns, kpis)
+    n = len(df)
+    block = np.empty((len(names), n), dtype=np.float64)
+    cols = _KpiInputs(df)
+    mask = np.empty(n, dtype=bool)
+
+    rows = {name: block[i] for i, name in enumerate(names)}
+    for name in _resolve(names):
+        out = rows[name] if name in rows else np.empty(n, dtype=np.float64)
+        KPI_REGISTRY[name].func(cols, out, mask)
+        cols[name] = out
+    return names, block
+
+
+def compute_kpis(d: pd.DataFrame, inplace: bool = False, kpis=None) -> pd.DataFrame:
+    """Calcule les ratios KPI techniques/financiers/risque.
+
+    Les colonnes d'entrée ne sont pas copiées : le résultat partage leurs
+    buffers et reçoit les KPI depuis un bloc unique. Avec inplace=True, les
+    colonnes KPI sont ajoutées directement à `d`. `kpis` restreint le calcul
+    à une liste de KPI (et à leurs prérequis) ; les KPI dont les colonnes
+    d'entrée manquent sont ignorés.
+    """
+    names, block = compute_kpi_block(d, kpis)
+    out = d if inplace else d.copy(deep=False)
+    if names:
+        out[names] = pd.DataFrame(block.T, index=out.index, columns=names, copy=False)
+    return out
+
+
+# =============================================================================
+# AGRÉGATION
+# =============================================================================
+# Dimensions d'analyse et mesures additives sommées par aggregate_kpis
+DIMENSIONS = ["date", "lob", "region", "cedant", "peril"]
+SUM_MEASURES = [
+    "gross_premium", "ceded_premium", "earned_premium", "incurred_claims", "paid_claims",
+    "ibnr", "rbns", "acq_expense", "adm_expense", "investment_income",
+    "claims_count", "exposure", "scr", "own_funds",
+]
+
+
+def aggregate_kpis(d: pd.DataFrame, by=["date"], kpis=None) -> pd.DataFrame:
+    """Agrège par dimensions et recalcule les KPI (tous, ou `kpis`) au niveau agrégé."""
+    grp = d.groupby(by, dropna=False, observed=True)[SUM_MEASURES].sum().reset_index()
+    return compute_kpis(grp, inplace=True, kpis=kpis)
+
+
+class KpiCube:
+    """Cube de mesures sommées sur date × lob × region × cedant × peril.
+
+    Le cube de base est construit une seule fois par jeu de données ; chaque
+    regroupement demandé est ensuite calculé à partir du plus petit agrégat
+    déjà en cache qui contient les dimensions nécessaires, puis les ratios
+    sont recalculés au niveau agrégé.
+    """
+
+    def __init__(self, df: pd.DataFrame, dims=None):
+        self.dims = [c for c in (dims or DIMENSIONS) if c in df.columns]
+        self.measures = [m for m in SUM_MEASURES if m in df.columns]
+        if not self.dims:
+            raise ValueError("Aucune dimension disponible pour construire le cube")
+        base = df.groupby(self.dims, dropna=False, observed=True)[self.measures].sum().reset_index()
+        self._cache = {tuple(self.dims): base}
+
+    def _parent(self, needed: set) -> pd.DataFrame:
+        """Plus petit agrégat en cache couvrant les dimensions demandées."""
+        candidates = [g for key, g in self._cache.items() if needed.issubset(key)]
+        return min(candidates, key=len)
+
+    def sums(self, by, filters=None) -> pd.DataFrame:
+        """Mesures sommées par `by`, éventuellement filtrées ({dimension: valeur})."""
+        by = list(by)
+        filters = filters or {}
+        missing = (set(by) | set(filters)) - set(self.dims)
+        if missing:
+            raise KeyError(f"Dimensions absentes du cube : {sorted(missing)}")
+        key = tuple(by)
+        if not filters and key in self._cache:
+            return self._cache[key]
+
+        parent = self._parent(set(by) | set(filters))
+        if filters:
+            mask = np.ones(len(parent), dtype=bool)
+            for dim, value in filters.items():
+                mask &= (parent[dim] == value).to_numpy()
+            parent = parent[mask]
+        grp = parent.groupby(by, dropna=False, observed=True)[self.measures].sum().reset_index()
+        if not filters:
+            self._cache[key] = grp
+        return grp
+
+    def rollup(self, by=["date"], filters=None, kpis=None) -> pd.DataFrame:
+        """Équivalent de aggregate_kpis(df, by, kpis) calculé depuis le cube."""
+        return compute_kpis(self.sums(by, filters).copy(), inplace=True, kpis=kpis)
+
+
+# =============================================================================
+# AGRÉGATION INCRÉMENTALE
+# =============================================================================
+class IncrementalAggregator:
+    """Sommes courantes par groupe, mises à jour période par période.
+
+    Un registre des mesures est tenu au grain des dimensions (date × lob ×
+    region × cedant × peril). `append` ajoute une nouvelle période, `restate`
+    remplace des lignes déjà reçues ; dans les deux cas seuls les groupes
+    touchés voient leurs sommes et leurs ratios recalculés. Les lignes reçues
+    doivent déjà avoir une colonne date normalisée (add_month_start).
+    La clé est fixée par le premier ajout ; les mesures sont l'union de
+    celles reçues (une mesure absente d'un ajout y vaut 0).
+    """
+
+    def __init__(self, key=None):
+        self.key = list(key) if key else None
+        self.measures = None
+        self._rows = None
+        self._views = {}
+
+    def append(self, df: pd.DataFrame) -> "IncrementalAggregator":
+        """Ajoute des lignes (nouvelle période) aux sommes courantes."""
+        return self._ingest(df, replace=False)
+
+    def restate(self, df: pd.DataFrame) -> "IncrementalAggregator":
+        """Remplace les lignes de même clé déjà reçues (retraitement)."""
+        return self._ingest(df, replace=True)
+
+    def retract(self, df: pd.DataFrame) -> "IncrementalAggregator":
+        """Retire des lignes ajoutées auparavant (ancienne version d'un fichier retraité)."""
+        return self._ingest(df, replace=False, sign=-1)
+
+    def _ingest(self, df: pd.DataFrame, replace: bool, sign: int = 1) -> "IncrementalAggregator":
+        key = self.key or [c for c in DIMENSIONS if c in df.columns]
+        missing = [c for c in key if c not in df.columns]
+        if missing:
+            raise KeyError(f"Dimensions absentes : {missing} (clé de l'agrégat : {key})")
+        self.key = key
+        received = {m for m in SUM_MEASURES if m in df.columns}
+        if self._rows is None:
+            self.measures = [m for m in SUM_MEASURES if m in received]
+        elif not received.issubset(self.measures):
+            # Nouvelles mesures : nulles pour les lignes déjà reçues, vues recalculées à la demande
+            self.measures = [m for m in SUM_MEASURES if m in received or m in self.measures]
+            self._rows = self._rows.reindex(columns=self.measures, fill_value=0)
+            self._views.clear()
+        rows = df.reindex(columns=self.key + self.measures, fill_value=0)
+        rows = rows.groupby(self.key, dropna=False, observed=True)[self.measures].sum()
+        if sign < 0:
+            rows = -rows
+        if self._rows is None:
+            self._rows = rows
+            return self
+
+        # Types communs (une mesure entière dans un fichier peut être flottante dans un autre)
+        common = {m: np.result_type(self._rows[m].dtype, rows[m].dtype) for m in self.measures}
+        if any(self._rows[m].dtype != t for m, t in common.items()):
+            self._rows = self._rows.astype(common)
+        rows = rows.astype(common, copy=False)
+        known = rows.index.isin(self._rows.index)
+        delta = rows.copy()
+        if known.any():
+            old = self._rows.reindex(rows.index[known])
+            if replace:
+                delta.loc[known] = rows.loc[known] - old
+            else:
+                rows.loc[known] = rows.loc[known] + old
+            self._rows.loc[rows.index[known]] = rows.loc[known]
+        self._rows = pd.concat([self._rows, rows.loc[~known]])
+
+        for by, view in self._views.items():
+            self._apply_delta(by, view, delta)
+        return self
+
+    def _apply_delta(self, by: tuple, view: dict, delta: pd.DataFrame):
+        """Met à jour les sommes d'une vue, puis les KPI des seuls groupes touchés."""
+        delta_g = delta.groupby(level=list(by), dropna=False).sum()
+        sums = view["sums"].add(delta_g, fill_value=0).astype(self._rows.dtypes.to_dict())
+        touched = compute_kpis(sums.loc[delta_g.index].reset_index(), inplace=True)
+        touched = touched.set_index(list(by))
+        kpis = view["kpis"]
+        view["sums"] = sums
+        view["kpis"] = pd.concat([kpis.drop(index=delta_g.index, errors="ignore"), touched]).sort_index()
+
+    def frame(self, by=["date"]) -> pd.DataFrame:
+        """Agrégat KPI courant, au même format que aggregate_kpis(df, by)."""
+        by = tuple(by)
+        if by not in self._views:
+            sums = self._rows.groupby(level=list(by), dropna=False).sum()
+            kpis = compute_kpis(sums.reset_index(), inplace=True).set_index(list(by))
+            self._views[by] = {"sums": sums, "kpis": kpis}
+        return self._views[by]["kpis"].reset_index()
+
+
+# =============================================================================
+# AGRÉGATION HORS MÉMOIRE (CSV PAR BLOCS)
+# =============================================================================
+def aggregate_kpis_chunked(source, by=["date"], mapping=None, chunksize: int = 500_000,
+                           compact_every: int = 16, **read_csv_kwargs) -> pd.DataFrame:
+    """Agrège un CSV bloc par bloc, avec une mémoire bornée par la taille de bloc.
+
+    Seules les colonnes utiles sont lues. Chaque bloc est renommé selon le
+    mapping (auto_map_columns sur l'en-tête par défaut), ses dates sont
+    normalisées, puis ses sommes partielles par groupe sont fusionnées avec
+    les précédentes. Le résultat a le format de aggregate_kpis(df, by) ; le
+    nombre de lignes lues est dans attrs["rows_read"].
+    """
+    by = list(by)
+    if mapping is None:
+        header = pd.read_csv(source, nrows=0, **read_csv_kwargs)
+        if hasattr(source, "seek"):
+            source.seek(0)
+        mapping = auto_map_columns(header)
+    wanted = set(by) | set(SUM_MEASURES)
+    usecols = [src for key, src in mapping.items() if src is not None and key in wanted]
+
+    parts = []
+    measures = None
+    rows_read = 0
+    for chunk in pd.read_csv(source, usecols=usecols, chunksize=chunksize, **read_csv_kwargs):
+        rows_read += len(chunk)
+        chunk = apply_mapping(chunk, mapping)
+        if "date" in chunk.columns:
+            chunk["date"] = infer_date_col(chunk["date"])
+            chunk = add_month_start(chunk)
+        if measures is None:
+            measures = [m for m in SUM_MEASURES if m in chunk.columns]
+        parts.append(chunk.groupby(by, dropna=False, observed=True)[measures].sum())
+        if len(parts) >= compact_every:
+            parts = [_merge_partial_sums(parts, by)]
+
+    if not parts:
+        raise ValueError("Fichier vide : aucune ligne à agréger")
+    grp = _merge_partial_sums(parts, by).reset_index()
+    out = compute_kpis(grp, inplace=True)
+    out.attrs["rows_read"] = rows_read
+    return out
+
+
+def _merge_partial_sums(parts: list, by: list) -> pd.DataFrame:
+    """Fusionne des sommes partielles indexées par `by`."""
+    if len(parts) == 1:
+        return parts[0]
+    return pd.concat(parts).groupby(level=list(range(len(by))), dropna=False).sum()
+
+
+# =============================================================================
+# KPI GLISSANTS ET VARIATIONS ANNUELLES
+# =============================================================================
+# Ratios recalculés sur fenêtre glissante et comparés à l'année précédente
+WINDOW_RATIOS = ["loss_ratio", "combined_ratio"]
+
+
+def window_kpis(agg: pd.DataFrame, by=(), ratios=WINDOW_RATIOS, window_months: int = 12,
+                period_months: int = None) -> pd.DataFrame:
+    """Ajoute les ratios glissants et leurs variations sur un an à un agrégat date × `by`.
+
+    Les mesures sont sommées sur les `window_months` derniers mois de chaque
+    groupe (4 trimestres ou 12 mois pour la fenêtre par défaut) à partir de
+    sommes cumulées sur les lignes triées par groupe puis par date : un seul
+    passage vectorisé, sans boucle par groupe. Les ratios sont ensuite
+    recalculés sur ces sommes, comme dans aggregate_kpis. Colonnes ajoutées,
+    pour chaque ratio : <ratio>_<w>m (NaN tant que l'historique du groupe ne
+    couvre pas la fenêtre ; une période de `period_months` mois, déduite du
+    plus petit écart entre deux dates d'un groupe si absente, couvre ses
+    propres mois) et <ratio>_yoy (écart avec la même date un an plus
+    tôt, NaN si cette date est absente).
+    """
+    by = list(by)
+    out = agg.copy(deep=False)
+    n = len(out)
+    dates = pd.to_datetime(out["date"])
+    month = (dates.dt.year * 12 + dates.dt.month - 1).to_numpy(dtype=np.int64)
+    month = month - (month.min() if n else 0)
+
+    gid = np.zeros(n, dtype=np.int64)
+    for col in by:
+        codes, uniq = pd.factorize(out[col], use_na_sentinel=False)
+        gid = gid * len(uniq) + codes
+    # Clé triable groupe puis mois ; l'écart entre groupes dépasse toute fenêtre
+    stride = (month.max() if n else 0) + max(window_months, 12) + 1
+    key = gid * stride + month
+    order = np.argsort(key, kind="stable")
+    key = key[order]
+    month = month[order]
+
+    measures = [m for m in SUM_MEASURES if m in out.columns]
+    values = out[measures].to_numpy(dtype=np.float64, na_value=np.nan)[order]
+    np.copyto(values, 0.0, where=np.isnan(values))
+    cum = np.zeros((n + 1, len(measures)), dtype=np.float64)
+    np.cumsum(values, axis=0, out=cum[1:])
+
+    if period_months is None:
+        same = gid[order][1:] == gid[order][:-1]
+        steps = np.diff(month)[same]
+        steps = steps[steps > 0]
+        period_months = int(steps.min()) if steps.size else 1
+    start = np.searchsorted(key, key - (window_months - 1), side="left")
+    first = np.searchsorted(key, gid[order] * stride, side="left")
+    # Fenêtre complète : la première période du groupe commence au plus tard au début de la fenêtre
+    full = month[first] <= month - window_months + period_months
+    rolled = pd.DataFrame(cum[1:] - cum[start], columns=measures)
+    names, block = compute_kpi_block(rolled, kpis=ratios)
+
+    prev = np.searchsorted(key, key - 12, side="left")
+    has_prev = prev < n
+    has_prev[has_prev] = key[prev[has_prev]] == key[has_prev] - 12
+    prev = np.where(has_prev, prev, 0)
+
+    inverse = np.empty(n, dtype=np.int64)
+    inverse[order] = np.arange(n)
+    for ratio in ratios:
+        current = out[ratio].to_numpy(dtype=np.float64)[order] if ratio in out.columns else None
+        if ratio in names:
+            win = np.where(full, block[names.index(ratio)], np.nan)
+            out[f"{ratio}_{window_months}m"] = win[inverse]
+        if current is not None:
+            out[f"{ratio}_yoy"] = np.where(has_prev, current - current[prev], np.nan)[inverse]
+    return out
+
+
+# =============================================================================
+# EXPORT
+# =============================================================================
+def export_table(df: pd.DataFrame, path: str) -> str:
+    """Écrit une table KPI en CSV ou en Parquet selon l'extension du chemin."""
+    if path.endswith(".parquet"):
+        df.to_parquet(path, index=False)
+    else:
+        df.to_csv(path, index=False)
+    return path
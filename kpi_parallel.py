@@ -0,0 +1,93 @@
+# =============================================================================
+# AGRÉGATION KPI PARALLÈLE (POOL DE PROCESSUS)
+# =============================================================================
+# Les lignes sont découpées en blocs contigus, un par processus. Les processus
+# sont créés par fork après l'enregistrement du DataFrame : ils le lisent en
+# mémoire partagée (copie à l'écriture), sans sérialisation ni copie préalable
+# dans le processus parent. Chaque processus fait lui-même le groupby de son
+# bloc (factorisation des dimensions comprise) et ne renvoie que ses sommes
+# partielles par groupe, fusionnées ensuite par un petit groupby.
+#
+# Le parent ne fait donc aucun travail proportionnel au nombre de lignes. Le
+# pool n'est utilisé qu'au-delà de PARALLEL_MIN_ROWS lignes et avec plusieurs
+# cœurs ; sinon (ou sans fork, sous Windows) le calcul reste un groupby simple.
+import multiprocessing
+import os
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from kpi_engine import DIMENSIONS, SUM_MEASURES, KpiCube, compute_kpis
+
+# Nombre de lignes à partir duquel le démarrage du pool est amorti
+PARALLEL_MIN_ROWS = int(os.environ.get("REASSURANCE_PARALLEL_MIN_ROWS", "2000000"))
+
+# Jeux de données en cours d'agrégation, hérités par les processus forkés
+_FRAMES = {}
+
+
+# =============================================================================
+# TRAVAIL CÔTÉ PROCESSUS
+# =============================================================================
+def _block_sums(token: str, start: int, stop: int) -> pd.DataFrame:
+    """Sommes par groupe des lignes [start, stop) du DataFrame hérité du parent."""
+    df, by, measures = _FRAMES[token]
+    return df.iloc[start:stop].groupby(by, dropna=False, observed=True, sort=False)[measures].sum()
+
+
+# =============================================================================
+# API
+# =============================================================================
+def _fork_context():
+    """Contexte fork, ou None si la plateforme ne le propose pas."""
+    if "fork" not in multiprocessing.get_all_start_methods():
+        return None
+    return multiprocessing.get_context("fork")
+
+
+def group_sums(df: pd.DataFrame, by, measures=None, workers: int = None) -> pd.DataFrame:
+    """Mesures sommées par `by` (format de groupby(...).sum().reset_index()).
+
+    Avec plusieurs `workers` (nombre de cœurs par défaut), chaque processus
+    agrège un bloc de lignes contigu ; avec workers=1, ou sans fork, le
+    groupby est fait directement dans le processus courant.
+    """
+    by = list(by)
+    measures = list(SUM_MEASURES if measures is None else measures)
+    missing = [m for m in measures if m not in df.columns]
+    if missing:
+        raise KeyError(f"Mesures absentes : {missing}")
+    workers = min(workers or os.cpu_count() or 1, max(len(df), 1))
+    context = _fork_context()
+    if workers <= 1 or context is None:
+        return df.groupby(by, dropna=False, observed=True)[measures].sum().reset_index()
+
+    token = uuid.uuid4().hex
+    _FRAMES[token] = (df, by, measures)
+    try:
+        step = -(-len(df) // workers)
+        bounds = [(start, min(start + step, len(df))) for start in range(0, len(df), step)]
+        with ProcessPoolExecutor(max_workers=len(bounds), mp_context=context) as pool:
+            partials = list(pool.map(_block_sums, [token] * len(bounds), *zip(*bounds)))
+    finally:
+        del _FRAMES[token]
+    merged = pd.concat(partials).groupby(level=list(range(len(by))), dropna=False, observed=True).sum()
+    return merged.reset_index()
+
+
+def aggregate_kpis_parallel(df: pd.DataFrame, by=["date"], workers: int = None) -> pd.DataFrame:
+    """Équivalent de aggregate_kpis(df, by) calculé par blocs de lignes dans un pool de processus."""
+    return compute_kpis(group_sums(df, by, workers=workers), inplace=True)
+
+
+def build_cube(df: pd.DataFrame, workers: int = None) -> KpiCube:
+    """Cube KPI du DataFrame ; le cube de base est agrégé en parallèle au-delà de
+    PARALLEL_MIN_ROWS lignes quand plusieurs cœurs sont disponibles."""
+    workers = workers or os.cpu_count() or 1
+    if len(df) < PARALLEL_MIN_ROWS or workers <= 1:
+        return KpiCube(df)
+    dims = [c for c in DIMENSIONS if c in df.columns]
+    measures = [m for m in SUM_MEASURES if m in df.columns]
+    # Le cube regroupe à nouveau ces sommes, au coût du nombre de groupes seulement
+    return KpiCube(group_sums(df, dims, measures, workers), dims)
@@ -0,0 +1,123 @@
+# =============================================================================
+# CACHE DES FICHIERS IMPORTÉS
+# =============================================================================
+# Un fichier importé n'est parsé qu'une fois par session : le DataFrame est
+# conservé sous l'empreinte de son contenu (et du mapping pour les données
+# préparées). Les entrées les moins récemment utilisées sont évincées dès que
+# le budget mémoire est dépassé. Le cache est rangé dans l'état de session,
+# donc partagé par toutes les pages.
+import io
+import os
+from collections import OrderedDict
+
+import pandas as pd
+
+import ingestion
+from dataset_store import content_fingerprint
+
+DEFAULT_BUDGET_MB = float(os.environ.get("REASSURANCE_PARSE_CACHE_MB", "1024"))
+SESSION_KEY = "parse_cache"
+
+
+def frame_nbytes(df: pd.DataFrame) -> int:
+    """Empreinte mémoire d'un DataFrame, chaînes comprises."""
+    return int(df.memory_usage(deep=True).sum())
+
+
+class ParseCache:
+    """Cache LRU de DataFrames, borné par un budget mémoire en Mo."""
+
+    def __init__(self, max_mb: float = DEFAULT_BUDGET_MB):
+        self.max_bytes = int(max_mb * 1e6)
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()   # clé -> (DataFrame, octets)
+        self._digests = {}              # identifiant d'upload -> empreinte du contenu
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key: str):
+        """DataFrame en cache (copie superficielle), sinon None."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        self._entries.move_to_end(key)
+        return entry[0].copy(deep=False)
+
+    def put(self, key: str, df: pd.DataFrame):
+        """Ajoute un DataFrame, puis évince les plus anciens au-delà du budget.
+
+        Un DataFrame plus gros que le budget à lui seul n'est pas conservé.
+        """
+        size = frame_nbytes(df)
+        if key in self._entries:
+            self.nbytes -= self._entries.pop(key)[1]
+        if size > self.max_bytes:
+            return
+        self._entries[key] = (df, size)
+        self.nbytes += size
+        while self.nbytes > self.max_bytes:
+            _, (_, evicted) = self._entries.popitem(last=False)
+            self.nbytes -= evicted
+
+    def get_or_create(self, key: str, build) -> pd.DataFrame:
+        """DataFrame en cache, ou construit par `build()` puis mis en cache."""
+        df = self.get(key)
+        if df is not None:
+            self.hits += 1
+            return df
+        self.misses += 1
+        df = build()
+        self.put(key, df)
+        return df.copy(deep=False)
+
+    def fingerprint(self, uploaded_file) -> str:
+        """Empreinte du contenu d'un fichier importé, calculée une fois par upload."""
+        upload_id = (getattr(uploaded_file, "file_id", None), uploaded_file.name, uploaded_file.size)
+        if upload_id[0] is None or upload_id not in self._digests:
+            self._digests[upload_id] = content_fingerprint(uploaded_file.getvalue())
+        return self._digests[upload_id]
+
+    def clear(self):
+        self._entries.clear()
+        self._digests.clear()
+        self.nbytes = 0
+
+
+def session_cache(state, max_mb: float = DEFAULT_BUDGET_MB) -> ParseCache:
+    """Cache de la session (st.session_state ou tout dictionnaire)."""
+    if SESSION_KEY not in state:
+        state[SESSION_KEY] = ParseCache(max_mb)
+    return state[SESSION_KEY]
+
+
+def _parse(uploaded_file) -> pd.DataFrame:
+    name = uploaded_file.name.lower()
+    if name.endswith((".xlsx", ".xlsm")):
+        # Classeur lu feuille par feuille en streaming, en-têtes d'origine conservés :
+        # le mapping et le typage compact sont appliqués après confirmation (prepare)
+        df, report = ingestion.read_excel_streaming(uploaded_file.getvalue(), measure_memory=True)
+        df.attrs["load_report"] = report
+        return df
+    data = io.BytesIO(uploaded_file.getvalue())
+    if name.endswith(".csv"):
+        return pd.read_csv(data)
+    return pd.read_excel(data)
+
+
+def read_upload(uploaded_file, cache: ParseCache, mapping: dict = None, prepare=None) -> pd.DataFrame:
+    """Fichier importé parsé, depuis le cache de session si possible.
+
+    Avec `prepare`, retourne prepare(données brutes), mis en cache sous
+    l'empreinte du contenu et du `mapping`.
+    """
+    raw_key = cache.fingerprint(uploaded_file)
+    if prepare is None:
+        return cache.get_or_create(raw_key, lambda: _parse(uploaded_file))
+    key = content_fingerprint(raw_key.encode("utf-8"), {"mapping": mapping})
+    return cache.get_or_create(key, lambda: prepare(read_upload(uploaded_file, cache)))
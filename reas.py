@@ -17,6 +17,12 @@ import plotly.graph_objects as go
 from datetime import datetime
 from statsmodels.tsa.statespace.sarimax import SARIMAX
 
+import dataset_store
+import demo_data
+import forecast_engine
+import kpi_engine
+import parse_cache
+
 st.set_page_config(page_title="Réassurance — KPI & Prévisions 3 ans", page_icon="🛡️", layout="wide")
 
 # ---------------------------------------
@@ -48,128 +54,35 @@ REQUIRED_BASE = ["date", "earned_premium", "incurred_claims"]
 # Helpers data
 # ---------------------------------------
 def _infer_date_col(s: pd.Series) -> pd.Series:
-    """Tente de parser une colonne date. Fallback: année -> 1er janvier."""
-    try:
-        parsed = pd.to_datetime(s, errors="coerce", dayfirst=True)
-        if parsed.notna().mean() > 0.6:
-            return parsed
-    except Exception:
-        pass
-    if s.dtype.kind in "if":
-        return pd.to_datetime(s.astype(int).astype(str) + "-01-01", errors="coerce")
-    return pd.to_datetime(s, errors="coerce")
+    """Tente de parser une colonne date (kpi_engine)."""
+    return kpi_engine.infer_date_col(s)
 
 def make_demo(periods=16, seed=42, freq="Q"):
-    """Jeu de données de démonstration trimestriel par défaut."""
-    rng = np.random.default_rng(seed)
-    idx = pd.period_range("2022Q1", periods=periods, freq=freq).to_timestamp()
-    lobs = ["Property Cat", "Casualty"]
-    regions = ["EU", "NA"]
-    rows = []
-    for dt in idx:
-        for lob, region in zip(lobs, regions):
-            gwp = rng.normal(50, 8)
-            ced = gwp * rng.uniform(0.15, 0.45)
-            ep = gwp * rng.uniform(0.75, 0.95)
-            cnt = rng.poisson(110 if lob == "Property Cat" else 85)
-            expo = rng.integers(900, 1600)
-            sev = rng.lognormal(mean=9.35 if lob == "Property Cat" else 9.1, sigma=0.35) / 1e6
-            inc = float(cnt) * float(sev)
-            paid = inc * rng.uniform(0.6, 0.9)
-            ibnr = inc * rng.uniform(0.06, 0.18)
-            rbns = inc * rng.uniform(0.05, 0.15)
-            acq = ep * rng.uniform(0.08, 0.14)
-            adm = ep * rng.uniform(0.05, 0.09)
-            inv = gwp * rng.uniform(0.01, 0.03)
-            scr = ep * rng.uniform(0.28, 0.42)
-            own = scr * rng.uniform(1.25, 1.9)
-            rows.append([
-                dt, "CedantA", lob, region, gwp, ced, ep, inc, paid, ibnr, rbns,
-                acq, adm, cnt, expo, scr, own, inv
-            ])
-    return pd.DataFrame(rows, columns=[
-        "date", "cedant", "lob", "region", "gross_premium", "ceded_premium", "earned_premium",
-        "incurred_claims", "paid_claims", "ibnr", "rbns", "acq_expense", "adm_expense",
-        "claims_count", "exposure", "scr", "own_funds", "investment_income"
-    ])
+    """Jeu de données de démonstration trimestriel par défaut (générateur vectorisé demo_data)."""
+    return demo_data.make_demo_data(
+        periods, seed, freq, lobs=["Property Cat", "Casualty"], regions=["EU", "NA"],
+        paired=True, premium_scale=1.0, severity_scale=1e-6,
+    )
 
 def auto_map_columns(df: pd.DataFrame):
-    """Détecte automatiquement les correspondances colonnes utilisateur -> schéma."""
-    mapping = {}
-    cols_lower = {c.lower(): c for c in df.columns}
-    for key, aliases in SCHEMA.items():
-        found = None
-        for a in aliases:
-            if a in cols_lower:
-                found = cols_lower[a]
-                break
-        mapping[key] = found
-    return mapping
+    """Détecte automatiquement les correspondances colonnes utilisateur -> schéma (kpi_engine)."""
+    return kpi_engine.auto_map_columns(df)
 
 def compute_kpis(d: pd.DataFrame) -> pd.DataFrame:
-    """Calcule les ratios KPI techniques/financiers/risque."""
-    df = d.copy()
-    ep = df["earned_premium"].replace(0, np.nan)
-    gwp = df.get("gross_premium", pd.Series(np.nan, index=df.index))
-    ced = df.get("ceded_premium", pd.Series(0.0, index=df.index))
-
-    df["loss_ratio"] = df["incurred_claims"] / ep
-    df["acq_ratio"] = df.get("acq_expense", 0) / ep
-    df["adm_ratio"] = df.get("adm_expense", 0) / ep
-    df["expense_ratio"] = df["acq_ratio"].fillna(0) + df["adm_ratio"].fillna(0)
-    df["combined_ratio"] = df["loss_ratio"].fillna(0) + df["expense_ratio"].fillna(0)
-    df["operating_ratio"] = df["combined_ratio"] - (df.get("investment_income", 0) / ep)
-    df["cession_ratio"] = ced / gwp.replace(0, np.nan)
-    df["retention_ratio"] = (gwp - ced) / gwp.replace(0, np.nan)
-
-    if {"claims_count", "exposure"}.issubset(df.columns):
-        df["frequency"] = df["claims_count"] / df["exposure"].replace(0, np.nan)
-    if {"incurred_claims", "claims_count"}.issubset(df.columns):
-        df["severity"] = df["incurred_claims"] / df["claims_count"].replace(0, np.nan)
-
-    if {"ibnr", "rbns"}.issubset(df.columns):
-        df["total_reserves"] = df["ibnr"].fillna(0) + df["rbns"].fillna(0)
-        df["reserve_coverage"] = df["total_reserves"] / df["incurred_claims"].replace(0, np.nan)
-
-    if {"scr", "own_funds"}.issubset(df.columns):
-        df["solvency_ratio"] = df["own_funds"] / df["scr"].replace(0, np.nan)
-
-    return df
+    """Calcule les ratios KPI techniques/financiers/risque (noyau colonnaire kpi_engine)."""
+    return kpi_engine.compute_kpis(d)
 
 def aggregate_kpis(d: pd.DataFrame, by=["date"]) -> pd.DataFrame:
-    """Agrège par dimensions et recalcule les KPI au niveau agrégé."""
-    grp = d.groupby(by, dropna=False).agg({
-        "gross_premium": "sum", "ceded_premium": "sum", "earned_premium": "sum",
-        "incurred_claims": "sum", "paid_claims": "sum", "ibnr": "sum", "rbns": "sum",
-        "acq_expense": "sum", "adm_expense": "sum", "investment_income": "sum",
-        "claims_count": "sum", "exposure": "sum", "scr": "sum", "own_funds": "sum"
-    }).reset_index()
-    grp = compute_kpis(grp)
-    return grp
+    """Agrège par dimensions et recalcule les KPI au niveau agrégé (kpi_engine)."""
+    return kpi_engine.aggregate_kpis(d, by=by)
 
 def sarimax_forecast(ts: pd.Series, steps: int, order=(1,1,1), seasonal=(0,1,1,4)) -> pd.Series:
-    """Prévision SARIMAX avec fallback naïf si historique insuffisant."""
-    ts = ts.astype(float).replace([np.inf, -np.inf], np.nan).dropna()
-    if ts.shape[0] < max(24, steps):
-        last = ts.iloc[-1] if ts.shape[0] else 0.0
-        idx = pd.date_range(datetime.today(), periods=steps, freq="MS")
-        return pd.Series([last] * steps, index=idx)
-    try:
-        model = SARIMAX(ts, order=order, seasonal_order=seasonal,
-                        enforce_stationarity=False, enforce_invertibility=False)
-        res = model.fit(disp=False)
-        fc = res.get_forecast(steps=steps).predicted_mean
-        return fc
-    except Exception:
-        last = ts.iloc[-1] if ts.shape[0] else 0.0
-        idx = pd.date_range(ts.index[-1] + pd.offsets.MonthBegin(1), periods=steps, freq="MS")
-        return pd.Series([last] * steps, index=idx)
+    """Prévision SARIMAX avec fallback naïf si historique insuffisant (forecast_engine, résultats en cache)."""
+    return forecast_engine.sarimax_forecast(ts, steps, order, seasonal, cache=forecast_engine.default_cache())
 
 def add_month_start(df: pd.DataFrame) -> pd.DataFrame:
-    """Aligne les dates sur le début de mois pour homogénéiser les séries temporelles."""
-    out = df.copy()
-    out["date"] = pd.to_datetime(out["date"], errors="coerce").dt.to_period("M").dt.to_timestamp()
-    return out
+    """Aligne les dates sur le début de mois (kpi_engine)."""
+    return kpi_engine.add_month_start(df)
 
 def download_button(df: pd.DataFrame, filename: str):
     """Lien de téléchargement CSV sans écrire sur disque côté serveur."""
@@ -200,10 +113,8 @@ with st.sidebar:
         df_raw = make_demo(periods=16, freq=("Q" if freq == "Trimestrielle" else ("A" if freq == "Annuelle" else "M")))
     else:
         if up is not None:
-            if up.name.lower().endswith(".csv"):
-                df_raw = pd.read_csv(up)
-            else:
-                df_raw = pd.read_excel(up)
+            # Fichier parsé une seule fois par session (cache partagé entre les pages)
+            df_raw = parse_cache.read_upload(up, parse_cache.session_cache(st.session_state))
         else:
             df_raw = pd.DataFrame()
 
@@ -234,8 +145,17 @@ if missing:
     st.error(f"Colonnes indispensables manquantes: {missing}")
     st.stop()
 
-df["date"] = _infer_date_col(df["date"])
-df = add_month_start(df)
+if do_demo:
+    df["date"] = _infer_date_col(df["date"])
+    df = add_month_start(df)
+    dataset_id = f"demo:{freq}"
+else:
+    # Données renommées et datées, gardées en cache pour ce mapping
+    df = parse_cache.read_upload(up, parse_cache.session_cache(st.session_state), mapping=ren,
+                                 prepare=lambda raw: kpi_engine.prepare_frame(raw, mapping))
+    # Identité du jeu de données (contenu du fichier et mapping) pour les choix mis en cache
+    raw_key = parse_cache.session_cache(st.session_state).fingerprint(up)
+    dataset_id = dataset_store.content_fingerprint(raw_key.encode("utf-8"), {"mapping": ren})
 df_kpi = compute_kpis(df)
 
 # ---------------------------------------
@@ -287,38 +207,64 @@ with tab2:
     target = st.selectbox("Série à projeter",
                           ["earned_premium", "incurred_claims", "combined_ratio", "loss_ratio", "expense_ratio"], index=0)
     by_dim = st.selectbox("Projection par dimension", ["Global"] + [c for c in ["lob", "region"] if c in df_kpi.columns])
+    auto_order = st.checkbox("Ordre SARIMAX automatique (AIC)", value=False)
 
-    def project_series(df_in: pd.DataFrame) -> pd.DataFrame:
-        d = aggregate_kpis(df_in, by=["date"]).sort_values("date").set_index("date")
-        ts = d[target]
+    # Modèle et horizon selon la fréquence
+    if freq == "Mensuelle":
+        order, seas, steps = (1, 1, 1), (0, 1, 1, 12), 12 * int(horizon_years)
+    elif freq == "Trimestrielle":
+        order, seas, steps = (1, 1, 1), (0, 1, 1, 4), 4 * int(horizon_years)
+    else:
+        # Données annuelles : pas de composante saisonnière
+        order, seas, steps = (1, 1, 0), (0, 0, 0, 0), int(horizon_years)
+
+    def orders_for(series: dict) -> dict:
+        """Ordre fixe, ou choisi par AIC pour chaque série (choix mis en cache)."""
+        if not auto_order:
+            return {k: (order, seas) for k in series}
+        orders, report = forecast_engine.select_orders(
+            series, forecast_engine.season_length(freq), "aic",
+            cache=forecast_engine.default_cache(), namespace=f"reas:{dataset_id}:{freq}:{by_dim}:{target}",
+        )
+        with st.expander("Modèles retenus"):
+            st.dataframe(report)
+        return orders
+
+    def projection_index(last_date) -> pd.DatetimeIndex:
         if freq == "Mensuelle":
-            order, seas, steps = (1, 1, 1), (0, 1, 1, 12), 12 * int(horizon_years)
-            idx = pd.date_range(d.index[-1] + pd.offsets.MonthBegin(1), periods=steps, freq="MS")
+            return pd.date_range(last_date + pd.offsets.MonthBegin(1), periods=steps, freq="MS")
         elif freq == "Trimestrielle":
-            order, seas, steps = (1, 1, 1), (0, 1, 1, 4), 4 * int(horizon_years)
-            idx = pd.period_range(d.index[-1].to_period('Q') + 1, periods=steps, freq="Q").to_timestamp()
-        else:
-            order, seas, steps = (1, 1, 0), (0, 1, 1, 1), int(horizon_years)
-            idx = pd.date_range(d.index[-1] + pd.offsets.YearBegin(1), periods=steps, freq="YS")
-        fc = sarimax_forecast(ts, steps, order, seas)
-        fc.index = idx
+            return pd.period_range(last_date.to_period('Q') + 1, periods=steps, freq="Q").to_timestamp()
+        return pd.date_range(last_date + pd.offsets.YearBegin(1), periods=steps, freq="YS")
+
+    def projection_frame(ts: pd.Series, fc: pd.Series) -> pd.DataFrame:
+        fc.index = projection_index(ts.index[-1])
         return pd.DataFrame({
             "date": list(ts.index) + list(fc.index),
             target: list(ts.values) + list(fc.values),
             "type": ["historique"] * len(ts) + ["prévision"] * len(fc)
         })
 
+    def project_series(df_in: pd.DataFrame) -> pd.DataFrame:
+        ts = aggregate_kpis(df_in, by=["date"]).sort_values("date").set_index("date")[target]
+        ts_order, ts_seas = orders_for({"Global": ts})["Global"]
+        return projection_frame(ts, sarimax_forecast(ts, steps, ts_order, ts_seas))
+
     if by_dim == "Global":
         pr = project_series(df_kpi)
         fig = px.line(pr, x="date", y=target, color="type")
         st.plotly_chart(fig, use_container_width=True)
         st.dataframe(pr.tail(12))
     else:
-        vals = sorted(df_kpi[by_dim].dropna().unique())
-        tabs = st.tabs(vals)
+        # Séries de tous les segments ajustées ensemble dans un pool de processus
+        series = forecast_engine.segment_series(aggregate_kpis(df_kpi, by=["date", by_dim]), by_dim, target)
+        forecasts = forecast_engine.batch_forecast(series, steps, order, seas, cache=forecast_engine.default_cache(),
+                                                   orders=orders_for(series))
+        vals = list(series)
+        tabs = st.tabs([str(v) for v in vals])
         for i, v in enumerate(vals):
             with tabs[i]:
-                pr = project_series(df_kpi[df_kpi[by_dim] == v])
+                pr = projection_frame(series[v], forecasts[v])
                 fig = px.line(pr, x="date", y=target, color="type", title=f"{by_dim} = {v}")
                 st.plotly_chart(fig, use_container_width=True)
                 st.dataframe(pr.tail(12))